@@ -0,0 +1,101 @@
+import numpy as np
+
+from instrumentation import instrumented
+
+# Transforms of the monthly series, by name, with the label of
+# the dashboard control. REAL_PRICES needs a deflator series
+TRANSFORMS = { 'monthly': 'Mensal',
+               'quarterly': 'Trimestral',
+               'yearly': 'Anual',
+               'rolling_3': 'Média móvel de 3 meses',
+               'rolling_12': 'Média móvel de 12 meses',
+               'month_change': 'Variação mensal (%)',
+               'year_change': 'Variação anual (%)',
+               'real_prices': 'Preços reais (IPCA)' }
+DEFAULT_TRANSFORM = 'monthly'
+REAL_PRICES = 'real_prices'
+PERCENT_TRANSFORMS = ['month_change', 'year_change']
+
+def month_numbers(months):
+    '''Months since January 1970 of datetime64 values'''
+    return months.astype('datetime64[M]').astype(np.int64)
+
+def resample(values, months, period):
+    '''
+    Means of the values of each period of months (3 for
+    quarters, 12 for years), skipping the missing ones.
+    The months must be consecutive, the periods are
+    labelled by their first month
+    '''
+    periods = month_numbers(months) // period
+    starts = np.flatnonzero(np.diff(periods, prepend=periods[0] - 1))
+
+    observed = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(observed, values, 0), starts, axis=1)
+    counts = np.add.reduceat(observed, starts, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+
+    return means, (periods[starts] * period).astype('datetime64[M]').astype(months.dtype)
+
+def rolling_mean(values, window):
+    '''
+    Means of the values over the last window months, from
+    cumulative sums, when at least half of them are known
+    '''
+    observed = ~np.isnan(values)
+    zeros = np.zeros((len(values), 1))
+    value_sums = np.hstack([zeros, np.cumsum(np.where(observed, values, 0), axis=1)])
+    counts = np.hstack([zeros, np.cumsum(observed, axis=1)])
+
+    stops = np.arange(1, values.shape[1] + 1)
+    starts = np.maximum(stops - window, 0)
+    window_sums = value_sums[:, stops] - value_sums[:, starts]
+    window_counts = counts[:, stops] - counts[:, starts]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(window_counts >= (window + 1) // 2, window_sums / window_counts, np.nan)
+
+def percent_change(values, lag):
+    '''Change of the values from lag months before, in percent'''
+    changes = np.full(values.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        changes[:, lag:] = (values[:, lag:] / values[:, :-lag] - 1) * 100
+
+    return changes
+
+def deflate(values, months, deflator):
+    '''
+    Values at the prices of the last month of the deflator, a
+    price index Series by month, unknown where the index is
+    '''
+    price_indexes = deflator.reindex(months).values.astype(np.float64)
+    return values * (deflator.values[-1] / price_indexes)
+
+@instrumented('apply_transform')
+def apply_transform(transform, values, months, deflator=None):
+    '''
+    Applies the named transform to every row of the (series x
+    month) matrix at once, returning the transformed matrix and
+    its months. The months must be consecutive, so the rolling
+    windows and changes can reach before the months shown
+    '''
+    if transform == 'quarterly':
+        return resample(values, months, 3)
+    if transform == 'yearly':
+        return resample(values, months, 12)
+    if transform == 'rolling_3':
+        return rolling_mean(values, 3), months
+    if transform == 'rolling_12':
+        return rolling_mean(values, 12), months
+    if transform == 'month_change':
+        return percent_change(values, 1), months
+    if transform == 'year_change':
+        return percent_change(values, 12), months
+    if transform == REAL_PRICES:
+        if deflator is None:
+            raise ValueError('Real prices need a deflator series')
+        return deflate(values, months, deflator), months
+    if transform == DEFAULT_TRANSFORM:
+        return values, months
+
+    raise ValueError(f'Unknown transform {transform}')
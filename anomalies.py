@@ -0,0 +1,155 @@
+'''
+Batch job scoring how far each city diverges from its state
+and region: for every city, product and month, the z-scores
+of its market price and margin against the cities of its
+state and of its region, and the spread of its distribution
+price over the mean of its state. The scores are computed
+over the whole dataset at once and written to a Feather
+file, read by the outliers table of the dashboard.
+
+Usage: python anomalies.py
+'''
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from pyarrow import feather
+
+import data_provider
+from data_provider import COLUMNS
+from instrumentation import instrumented
+
+# Rewritten by every run of the job, ANOMALIES_PATH
+# sets another file (the cache directory is cleared
+# of the Feather files directly in it)
+anomalies_path = os.environ.get('ANOMALIES_PATH',
+                                os.path.join(data_provider.cache_dir_path,
+                                             'analytics', 'anomalies.feather'))
+
+# Parents with fewer cities in a month give no z-scores
+MIN_PARENT_CITIES = int(os.environ.get('ANOMALIES_MIN_PARENT_CITIES', 3))
+
+class ANOMALY_COLUMNS:
+    PRICE_STATE_Z = 'Z PREÇO ESTADO'
+    PRICE_REGION_Z = 'Z PREÇO REGIÃO'
+    MARGIN_STATE_Z = 'Z MARGEM ESTADO'
+    MARGIN_REGION_Z = 'Z MARGEM REGIÃO'
+    DIST_PRICE_SPREAD = 'SPREAD DISTRIBUIÇÃO ESTADO'
+    SCORE = 'MAIOR Z ABSOLUTO'
+
+# Z-score column of each measure against each parent
+Z_SCORES = [(ANOMALY_COLUMNS.PRICE_STATE_Z, COLUMNS.MARKET_PRICE_MEAN, COLUMNS.STATE),
+            (ANOMALY_COLUMNS.PRICE_REGION_Z, COLUMNS.MARKET_PRICE_MEAN, COLUMNS.REGION),
+            (ANOMALY_COLUMNS.MARGIN_STATE_Z, COLUMNS.MARKET_MARGIN, COLUMNS.STATE),
+            (ANOMALY_COLUMNS.MARGIN_REGION_Z, COLUMNS.MARKET_MARGIN, COLUMNS.REGION)]
+
+CITY_COLUMNS = [COLUMNS.PLACE_ID, COLUMNS.PLACE_NAME, COLUMNS.STATE, COLUMNS.REGION,
+                COLUMNS.PRODUCT, COLUMNS.MONTH, COLUMNS.GAS_STATION_COUNT,
+                COLUMNS.MARKET_PRICE_MEAN, COLUMNS.MARKET_MARGIN, COLUMNS.DIST_PRICE_MEAN]
+
+def group_keys(frame, key_columns):
+    '''
+    Integer key of the group of each row and the number of
+    possible keys, -1 for the rows missing a key column
+    '''
+    codes, uniques = zip(*[ pd.factorize(frame[column]) for column in key_columns ])
+    shape = [ max(len(column_uniques), 1) for column_uniques in uniques ]
+    missing = np.any([ column_codes < 0 for column_codes in codes ], axis=0)
+
+    keys = np.ravel_multi_index([ np.maximum(column_codes, 0) for column_codes in codes ], shape)
+    return np.where(missing, -1, keys), int(np.prod(shape))
+
+def group_statistics(values, keys, key_space):
+    '''
+    Mean, standard deviation and count of the known values of
+    each row's group, from counts of the group keys: the sums
+    first, then the squared deviations from the means
+    '''
+    known = ~np.isnan(values) & (keys >= 0)
+    known_keys = keys[known]
+    counts = np.bincount(known_keys, minlength=key_space)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.bincount(known_keys, weights=values[known], minlength=key_space) / counts
+        squares = np.bincount(known_keys, weights=(values[known] - means[known_keys]) ** 2,
+                              minlength=key_space)
+        deviations = np.sqrt(squares / (counts - 1))
+
+    # The rows without a group get the statistics of no values
+    row_keys = np.where(keys >= 0, keys, key_space)
+    return tuple(np.append(statistic, fill)[row_keys]
+                 for statistic, fill in [(means, np.nan), (deviations, np.nan), (counts, 0)])
+
+def z_scores(values, keys, key_space, min_count):
+    means, deviations, counts = group_statistics(values, keys, key_space)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where((counts >= min_count) & (deviations > 0),
+                        (values - means) / deviations, np.nan)
+
+@instrumented('compute_anomalies')
+def compute_anomalies(aggregate_data, min_parent_cities=MIN_PARENT_CITIES):
+    '''
+    Scores the city rows of the aggregate data against the
+    other cities of their state and region in the same
+    product and month, with the largest absolute z-score of
+    each row to rank them
+    '''
+    city_rows = aggregate_data[COLUMNS.PLACE_TYPE] == 'CIDADE'
+    anomalies_data = aggregate_data.loc[city_rows, CITY_COLUMNS].reset_index(drop=True)
+
+    parent_keys = { parent_column: group_keys(anomalies_data, [parent_column, COLUMNS.PRODUCT,
+                                                               COLUMNS.MONTH])
+                    for parent_column in [COLUMNS.STATE, COLUMNS.REGION] }
+    for z_column, measure_column, parent_column in Z_SCORES:
+        values = anomalies_data[measure_column].values.astype(np.float64)
+        anomalies_data[z_column] = z_scores(values, *parent_keys[parent_column],
+                                            min_parent_cities).astype('float32')
+
+    dist_prices = anomalies_data[COLUMNS.DIST_PRICE_MEAN].values.astype(np.float64)
+    state_means, _, _ = group_statistics(dist_prices, *parent_keys[COLUMNS.STATE])
+    anomalies_data[ANOMALY_COLUMNS.DIST_PRICE_SPREAD] = (dist_prices - state_means).astype('float32')
+
+    z_values = np.abs(anomalies_data[[ z_column for z_column, _, _ in Z_SCORES ]].values)
+    known_z = ~np.isnan(z_values).all(axis=1)
+    anomalies_data[ANOMALY_COLUMNS.SCORE] = np.nan
+    anomalies_data.loc[known_z, ANOMALY_COLUMNS.SCORE] = np.nanmax(z_values[known_z], axis=1)
+    anomalies_data[ANOMALY_COLUMNS.SCORE] = anomalies_data[ANOMALY_COLUMNS.SCORE].astype('float32')
+
+    return anomalies_data
+
+def write_anomalies(anomalies_data, path=None):
+    '''Writes the scores next to the file and renames it over the old one'''
+    path = path or anomalies_path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    anomalies_data.to_feather(f'{path}.tmp')
+    os.replace(f'{path}.tmp', path)
+
+def read_anomalies(path=None):
+    return feather.read_table(path or anomalies_path, memory_map=True).to_pandas()
+
+def top_outliers(anomalies_data, selected_product, selected_year_range, count):
+    '''The count city rows of the product and years with the largest scores'''
+    months = anomalies_data[COLUMNS.MONTH]
+    rows = ((anomalies_data[COLUMNS.PRODUCT] == selected_product) &
+            (months >= pd.Timestamp(year=int(selected_year_range[0]), month=1, day=1)) &
+            (months < pd.Timestamp(year=int(selected_year_range[1]) + 1, month=1, day=1)))
+    return anomalies_data[rows].nlargest(count, ANOMALY_COLUMNS.SCORE)
+
+def main():
+    start_time = time.perf_counter()
+    aggregate_data = data_provider.read_aggregate_data()
+    read_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    anomalies_data = compute_anomalies(aggregate_data)
+    compute_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    write_anomalies(anomalies_data)
+    write_seconds = time.perf_counter() - start_time
+
+    print(f'{len(anomalies_data)} city rows scored, read {read_seconds:.2f}s, '
+          f'compute {compute_seconds:.2f}s, write {write_seconds:.2f}s: {anomalies_path}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+
+import pandas as pd
+import pyarrow as pa
+from flask import Blueprint, Response, jsonify, request
+
+import data_provider
+from data_provider import COLUMNS, PRODUCT_UNITS, get_dataset_version, select_aggregate_data
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Aggregate columns served by /api/prices, under their API names
+PRICE_COLUMNS = { COLUMNS.PLACE_ID: 'place_id',
+                  COLUMNS.PLACE_NAME: 'place_name',
+                  COLUMNS.MONTH: 'month',
+                  COLUMNS.GAS_STATION_COUNT: 'gas_stations',
+                  COLUMNS.MARKET_PRICE_MEAN: 'market_price_mean',
+                  COLUMNS.MARKET_PRICE_STD: 'market_price_std',
+                  COLUMNS.MARKET_PRICE_MIN: 'market_price_min',
+                  COLUMNS.MARKET_PRICE_MAX: 'market_price_max',
+                  COLUMNS.MARKET_PRICE_VAR_COEF: 'market_price_var_coef',
+                  COLUMNS.MARKET_MARGIN: 'market_margin',
+                  COLUMNS.DIST_PRICE_MEAN: 'distribution_price_mean',
+                  COLUMNS.DIST_PRICE_STD: 'distribution_price_std',
+                  COLUMNS.DIST_PRICE_MIN: 'distribution_price_min',
+                  COLUMNS.DIST_PRICE_MAX: 'distribution_price_max',
+                  COLUMNS.DIST_PRICE_VAR_COEF: 'distribution_price_var_coef' }
+
+class BadRequest(Exception):
+    pass
+
+@api.errorhandler(BadRequest)
+def bad_request(error):
+    return jsonify({ 'error': str(error) }), 400
+
+def __parse_month(month_str, parameter):
+    try:
+        return pd.to_datetime(month_str, format='%Y-%m')
+    except ValueError:
+        raise BadRequest(f'{parameter} must be a YYYY-MM month, not {month_str!r}')
+
+def __price_query():
+    '''
+    Validated product, places, month range and format of the request,
+    places are given as repeated or comma separated place parameters
+    '''
+    product = request.args.get('product')
+    if product not in data_provider.PRODUCTS:
+        raise BadRequest(f'product must be one of {list(data_provider.PRODUCTS)}')
+
+    place_ids = sorted({ place_id for places in request.args.getlist('places')
+                         for place_id in places.split(',') if place_id })
+    if not place_ids:
+        raise BadRequest('places must list at least one place id, see /api/places')
+    unknown_places = [ place_id for place_id in place_ids
+                       if place_id not in data_provider.PLACES_DICT ]
+    if unknown_places:
+        raise BadRequest(f'unknown places {unknown_places}, see /api/places')
+
+    first_month = __parse_month(request.args.get('start', f'{min(data_provider.YEARS)}-01'), 'start')
+    last_month = __parse_month(request.args.get('end', f'{max(data_provider.YEARS)}-12'), 'end')
+
+    response_format = request.args.get('format', 'json')
+    if response_format not in ('json', 'arrow'):
+        raise BadRequest('format must be json or arrow')
+
+    return product, place_ids, first_month, last_month, response_format
+
+def __query_etag(*query):
+    '''
+    Responses only change with the query and the
+    loaded data, so the ETag is known before building them
+    '''
+    digest = hashlib.sha1(repr((get_dataset_version(),) + query).encode('utf-8'))
+    return digest.hexdigest()
+
+def select_price_series(product, place_ids, first_month, last_month):
+    '''
+    Returns the monthly aggregates of the places for
+    the product between the two months, with the API column names
+    '''
+    aggregate_data = select_aggregate_data(product, (first_month.year, last_month.year), place_ids)
+    months = aggregate_data[COLUMNS.MONTH]
+    price_series = aggregate_data.loc[(months >= first_month) & (months <= last_month),
+                                      list(PRICE_COLUMNS)]
+
+    return price_series.rename(columns=PRICE_COLUMNS).reset_index(drop=True)
+
+def __arrow_body(price_series):
+    table = pa.Table.from_pandas(price_series, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    writer = pa.ipc.new_stream(sink, table.schema)
+    writer.write_table(table)
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+@api.route('/products')
+def products():
+    return jsonify([{ 'product': product, 'unit': PRODUCT_UNITS.get(product) }
+                    for product in data_provider.PRODUCTS])
+
+@api.route('/places')
+def places():
+    return jsonify(data_provider.PLACES_DICT)
+
+@api.route('/prices')
+def prices():
+    '''
+    Monthly price series of the places for a product, as JSON
+    records or an Arrow IPC stream, between the start and end
+    months (YYYY-MM, inclusive, every month by default)
+    '''
+    product, place_ids, first_month, last_month, response_format = __price_query()
+
+    etag = __query_etag(product, place_ids, first_month, last_month, response_format)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    price_series = select_price_series(product, place_ids, first_month, last_month)
+    if response_format == 'arrow':
+        response = Response(__arrow_body(price_series), mimetype=ARROW_MIMETYPE)
+    else:
+        price_series['month'] = price_series['month'].dt.strftime('%Y-%m')
+        # Prices are stored as float32, six digits is all they hold
+        response = Response(price_series.to_json(orient='records', double_precision=6),
+                            mimetype='application/json')
+
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,181 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    clientside: {
+        // Draws the markers sent by the server over the
+        // map figure, keeping its layout untouched
+        draw_map_markers: function(markers, figure) {
+            if (!markers) {
+                return window.dash_clientside.no_update;
+            }
+
+            var maxPrice = Math.max.apply(null, markers.prices.concat([0]));
+            var trace = {
+                type: 'scattermapbox',
+                mode: 'markers',
+                lat: markers.lat,
+                lon: markers.lon,
+                text: markers.names,
+                marker: {
+                    size: markers.prices,
+                    sizemode: 'area',
+                    sizeref: maxPrice > 0 ? 2 * maxPrice / (20 * 20) : 1,
+                    color: markers.prices,
+                    coloraxis: 'coloraxis'
+                },
+                hovertemplate: '<b>%{text}</b><br>%{marker.color:.2f}<extra></extra>'
+            };
+            var layout = Object.assign({}, figure.layout, {
+                title: { text: markers.title }
+            });
+
+            return { data: [trace], layout: layout };
+        },
+
+        // Asks the server for a new series store when the selected
+        // years leave the ones the store covers: a series store
+        // covers every year, an outputs store only its own
+        request_store_years: function(years, store) {
+            if (!store || store.kind === 'series' || sameYears(store.years, years)) {
+                return window.dash_clientside.no_update;
+            }
+
+            return years;
+        },
+
+        // Draws every dashboard output for the selected years from
+        // the series store, keeping the layouts of the plot figures
+        draw_series_store: function(store, years, pricePlot, marginPlot, stdPlot, varCoefPlot) {
+            var noUpdate = window.dash_clientside.no_update;
+            if (!store || !years) {
+                return [noUpdate, noUpdate, noUpdate, noUpdate, noUpdate, noUpdate, noUpdate, noUpdate];
+            }
+
+            if (store.kind === 'outputs') {
+                if (!sameYears(store.years, years)) {
+                    return [noUpdate, noUpdate, noUpdate, noUpdate, noUpdate, noUpdate, noUpdate, noUpdate];
+                }
+
+                var outputs = store.outputs;
+                return [outputs.brazil_map, outputs.market_price_plot, outputs.market_margin_plot,
+                        outputs.market_price_std_deviation_plot, outputs.market_price_coef_var_plot]
+                       .concat(outputs.badges);
+            }
+
+            function inYears(month) {
+                var year = parseInt(month.slice(0, 4), 10);
+                return year >= years[0] && year <= years[1];
+            }
+            var monthInYears = store.months.map(inYears);
+            var rows = store.rows;
+            var places = store.places;
+
+            // Mean price of each place and the months with rows
+            var priceSums = places.names.map(function() { return 0; });
+            var priceCounts = places.names.map(function() { return 0; });
+            var monthHasRows = store.months.map(function() { return false; });
+            for (var row = 0; row < rows.place.length; row++) {
+                var month = rows.month[row];
+                if (!monthInYears[month]) {
+                    continue;
+                }
+
+                if (rows.price[row] !== null) {
+                    priceSums[rows.place[row]] += rows.price[row];
+                    priceCounts[rows.place[row]] += 1;
+                }
+                monthHasRows[month] = true;
+            }
+
+            // Lines of each place, of the transformed series when there is one
+            var lineRows = store.lines || { months: store.months, place: rows.place, month: rows.month,
+                                            price: rows.price, margin: rows.margin };
+            var lineMonthInYears = lineRows.months.map(inYears);
+            var lines = places.names.map(function() {
+                return { months: [], prices: [], margins: [] };
+            });
+            for (var lineRow = 0; lineRow < lineRows.place.length; lineRow++) {
+                var lineMonth = lineRows.month[lineRow];
+                if (!lineMonthInYears[lineMonth]) {
+                    continue;
+                }
+
+                var line = lines[lineRows.place[lineRow]];
+                line.months.push(lineRows.months[lineMonth] + '-01');
+                line.prices.push(lineRows.price[lineRow]);
+                line.margins.push(lineRows.margin[lineRow]);
+            }
+
+            function linePlot(figure, title, values, format) {
+                var data = [];
+                lines.forEach(function(line, place) {
+                    if (line.months.length > 0) {
+                        data.push({ type: 'scatter', mode: 'lines',
+                                    name: places.names[place], legendgroup: places.names[place],
+                                    x: line.months, y: line[values],
+                                    hovertemplate: '<b>' + places.names[place] + '</b><br>' +
+                                                   '%{x|%Y-%m}<br>%{y:' + format + '}<extra></extra>' });
+                    }
+                });
+
+                return { data: data, layout: Object.assign({}, figure.layout, { title: { text: title } }) };
+            }
+
+            // Bars of each year over the places
+            var yearly = store.yearly;
+            function barPlot(figure, title, values) {
+                var bars = {};
+                var barYears = [];
+                for (var row = 0; row < yearly.place.length; row++) {
+                    var year = yearly.year[row];
+                    if (parseInt(year, 10) < years[0] || parseInt(year, 10) > years[1]) {
+                        continue;
+                    }
+
+                    if (!(year in bars)) {
+                        bars[year] = { x: [], y: [] };
+                        barYears.push(year);
+                    }
+                    bars[year].x.push(places.names[yearly.place[row]]);
+                    bars[year].y.push(yearly[values][row]);
+                }
+
+                var data = barYears.map(function(year) {
+                    return { type: 'bar', name: year, legendgroup: year, offsetgroup: year,
+                             x: bars[year].x, y: bars[year].y,
+                             hovertemplate: '%{x}<br>' + year + ': %{y}<extra></extra>' };
+                });
+                return { data: data, layout: Object.assign({}, figure.layout, { title: { text: title } }) };
+            }
+
+            var markers = { title: store.titles.brazil_map, names: [], lat: [], lon: [], prices: [] };
+            priceCounts.forEach(function(priceCount, place) {
+                if (priceCount > 0) {
+                    markers.names.push(places.names[place]);
+                    markers.lat.push(places.lat[place]);
+                    markers.lon.push(places.lon[place]);
+                    markers.prices.push(Math.round(priceSums[place] / priceCount * 1000) / 1000);
+                }
+            });
+
+            var stationCount = 0;
+            store.stations.forEach(function(count, month) {
+                if (monthInYears[month]) {
+                    stationCount += count;
+                }
+            });
+
+            return [markers,
+                    linePlot(pricePlot, store.titles.market_price_plot, 'prices', '.3f'),
+                    linePlot(marginPlot, store.titles.market_margin_plot, 'margins', '.3f'),
+                    barPlot(stdPlot, store.titles.market_price_std_deviation_plot, 'std'),
+                    barPlot(varCoefPlot, store.titles.market_price_coef_var_plot, 'var_coef'),
+                    store.place_count,
+                    stationCount,
+                    monthHasRows.filter(Boolean).length];
+        }
+    }
+});
+
+function sameYears(storeYears, years) {
+    return !!storeYears && !!years &&
+           storeYears[0] === years[0] && storeYears[1] === years[1];
+}
@@ -0,0 +1,84 @@
+'''
+Checks the transforms of the analytics module against a
+pandas reference, resampling, rolling means and percent
+changes of every place series, and times the transformed
+slices of the price and margin plots for 5, 100 and all
+the places of a product.
+
+Usage: python benchmarks/analytics_benchmark.py [repetitions]
+'''
+import os
+import sys
+import timeit
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+os.environ['WARMUP_SIZE'] = '0'
+os.environ['REQUEST_HISTORY'] = ''
+
+import numpy as np
+import pandas as pd
+
+import main
+import analytics
+import data_provider
+from data_provider import COLUMNS
+
+PRODUCT = data_provider.PRODUCTS[0]
+PLACE_COUNTS = [5, 100, None]
+
+def product_place_ids(product):
+    aggregate_data = data_provider.read_aggregate_data()
+    return list(aggregate_data.loc[aggregate_data[COLUMNS.PRODUCT] == product,
+                                   COLUMNS.PLACE_ID].astype(str).unique())
+
+def reference_transform(transform, frame):
+    '''The transform of the (month x place) frame with pandas'''
+    if transform == 'quarterly':
+        return frame.resample('QS').mean()
+    if transform == 'yearly':
+        return frame.resample('AS').mean()
+    if transform == 'rolling_3':
+        return frame.rolling(3, min_periods=2).mean()
+    if transform == 'rolling_12':
+        return frame.rolling(12, min_periods=6).mean()
+    if transform == 'month_change':
+        return frame.pct_change(1, fill_method=None) * 100
+    if transform == 'year_change':
+        return frame.pct_change(12, fill_method=None) * 100
+    return frame
+
+def check_transforms(place_ids):
+    price_matrix = data_provider.select_price_matrix(PRODUCT, place_ids)
+    values = price_matrix.values[COLUMNS.MARKET_PRICE_MEAN]
+    frame = pd.DataFrame(values.T, index=pd.DatetimeIndex(price_matrix.months))
+
+    transforms = [ transform for transform in analytics.TRANSFORMS
+                   if transform != analytics.REAL_PRICES ]
+    for transform in transforms:
+        result, months = analytics.apply_transform(transform, values, price_matrix.months)
+        expected = reference_transform(transform, frame)
+        assert np.array_equal(pd.DatetimeIndex(months), expected.index), transform
+        assert np.allclose(result, expected.values.T, equal_nan=True), transform
+
+    return transforms
+
+def main_benchmark(repetitions):
+    place_ids = product_place_ids(PRODUCT)
+    transforms = check_transforms(place_ids)
+    print(f'{", ".join(transforms)} of {len(place_ids)} places match pandas')
+
+    year_range = (main.DEFAULT_FIRST_YEAR, int(max(data_provider.YEARS)))
+    print(f'{"places":>8} {"transform":>14} {"ms":>10}')
+    for place_count in PLACE_COUNTS:
+        places = place_ids[:place_count]
+        for transform in transforms:
+            timing = min(timeit.repeat(
+                lambda: main.build_transformed_slice(PRODUCT, year_range, places, transform),
+                number=1, repeat=repetitions))
+            print(f'{len(places):>8} {transform:>14} {timing * 1000:>10.1f}')
+
+if __name__ == '__main__':
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,68 @@
+'''
+Checks the z-scores and spreads of the anomalies job against
+a pandas groupby reference, and times the job on the aggregate
+data repeated 1, 2, 5 and 10 times, to show it grows linearly
+with the rows. Run it with DATA_DIR set to a scaled copy of the
+data (see scale_dataset.py) to time more distinct cities.
+
+Usage: python benchmarks/anomalies_benchmark.py [repetitions]
+'''
+import os
+import sys
+import timeit
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+
+import numpy as np
+import pandas as pd
+
+import data_provider
+from data_provider import COLUMNS
+from anomalies import ANOMALY_COLUMNS, Z_SCORES, MIN_PARENT_CITIES, compute_anomalies
+
+AGGREGATE_DATA = data_provider.read_aggregate_data()
+SCALE_FACTORS = [1, 2, 5, 10]
+
+def reference_anomalies(anomalies_data):
+    '''The z-scores and spreads with pandas groupbys'''
+    expected = pd.DataFrame(index=anomalies_data.index)
+    for z_column, measure_column, parent_column in Z_SCORES:
+        values = anomalies_data[measure_column].astype('float64')
+        groups = values.groupby([anomalies_data[parent_column], anomalies_data[COLUMNS.PRODUCT],
+                                 anomalies_data[COLUMNS.MONTH]], observed=True)
+        deviations = groups.transform('std')
+        known = (groups.transform('count') >= MIN_PARENT_CITIES) & (deviations > 0)
+        expected[z_column] = ((values - groups.transform('mean')) / deviations).where(known)
+
+    dist_prices = anomalies_data[COLUMNS.DIST_PRICE_MEAN].astype('float64')
+    expected[ANOMALY_COLUMNS.DIST_PRICE_SPREAD] = dist_prices - dist_prices.groupby(
+        [anomalies_data[COLUMNS.STATE], anomalies_data[COLUMNS.PRODUCT],
+         anomalies_data[COLUMNS.MONTH]], observed=True).transform('mean')
+    expected[ANOMALY_COLUMNS.SCORE] = expected[[ z_column for z_column, _, _ in Z_SCORES ]]\
+                                      .abs().max(axis=1)
+    return expected
+
+def check_anomalies():
+    anomalies_data = compute_anomalies(AGGREGATE_DATA)
+    expected = reference_anomalies(anomalies_data)
+    for column in expected.columns:
+        assert np.allclose(anomalies_data[column].astype('float64'), expected[column],
+                           rtol=1e-4, atol=1e-4, equal_nan=True), column
+
+    return len(anomalies_data)
+
+def main(repetitions):
+    print(f'{check_anomalies()} city rows match the pandas reference')
+
+    print(f'{"scale":>6} {"rows":>10} {"seconds":>9} {"rows/s":>12}')
+    for scale_factor in SCALE_FACTORS:
+        aggregate_data = pd.concat([AGGREGATE_DATA] * scale_factor, ignore_index=True)
+        city_count = int((aggregate_data[COLUMNS.PLACE_TYPE] == 'CIDADE').sum())
+        timing = min(timeit.repeat(lambda: compute_anomalies(aggregate_data),
+                                   number=1, repeat=repetitions))
+        print(f'{scale_factor:>6} {city_count:>10} {timing:>9.3f} {city_count / timing:>12.0f}')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
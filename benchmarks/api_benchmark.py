@@ -0,0 +1,76 @@
+'''
+Throughput of the read-only API against the figure callback
+path, the one scraped so far to get the prices: concurrent
+clients request random products, places and years from a
+threaded server for a fixed time.
+
+The figure cache is disabled so every callback builds its figure.
+
+Usage: python benchmarks/api_benchmark.py [seconds] [clients]
+'''
+import os
+import sys
+import time
+import random
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from callback_load_test import start_server, callback_payloads, post
+
+import main
+from data_provider import *
+
+PLACES_PER_REQUEST = 10
+
+def random_filters(random_generator, place_ids):
+    years = sorted(random_generator.sample([int(year) for year in YEARS], 2))
+    return (random_generator.choice(PRODUCTS), years,
+            random_generator.sample(place_ids, PLACES_PER_REQUEST))
+
+def request_figure(server_url, product, years, places):
+    payload = [ payload for payload in callback_payloads(product, years, places)
+                if payload['output'] == '..market_price_plot.figure..' ][0]
+    post(server_url, payload)
+
+def request_api(response_format):
+    def request_prices(server_url, product, years, places):
+        query = urllib.parse.urlencode({ 'product': product,
+                                         'places': ','.join(places),
+                                         'start': f'{years[0]}-01',
+                                         'end': f'{years[1]}-12',
+                                         'format': response_format })
+        with urllib.request.urlopen(f'{server_url}/api/prices?{query}') as response:
+            response.read()
+
+    return request_prices
+
+def run_client(server_url, send_request, seed, seconds):
+    random_generator = random.Random(seed)
+    place_ids = list(PLACES_DICT)
+    requests = 0
+    end_time = time.perf_counter() + seconds
+    while time.perf_counter() < end_time:
+        send_request(server_url, *random_filters(random_generator, place_ids))
+        requests += 1
+
+    return requests
+
+def main_benchmark(seconds, clients):
+    server_url = start_server()
+    paths = [('figure callback', request_figure),
+             ('api json', request_api('json')),
+             ('api arrow', request_api('arrow'))]
+
+    print(f'{clients} clients, {seconds}s per path, {PLACES_PER_REQUEST} places per request')
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for name, send_request in paths:
+            main.FILTERED_SLICE_CACHE.clear()
+            futures = [ executor.submit(run_client, server_url, send_request, seed, seconds)
+                        for seed in range(clients) ]
+            requests = sum(future.result() for future in futures)
+            print(f'{name:>16} {requests / seconds:>8.1f} requests/s')
+
+if __name__ == '__main__':
+    main_benchmark(float(sys.argv[1]) if len(sys.argv) > 1 else 10,
+                   int(sys.argv[2]) if len(sys.argv) > 2 else 4)
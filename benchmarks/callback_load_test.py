@@ -0,0 +1,112 @@
+'''
+Load test of the dashboard callbacks over HTTP. For random
+filter changes it requests the outputs one after the other,
+as the single callback built them before, and all at once,
+as the browser does with one callback per output. Prints the
+50th and 99th percentiles of the time until the first and
+until the last output arrived. The single callback showed
+nothing before all outputs were built, its latency is the
+one of the last output.
+
+The figure cache is disabled so every request builds its output.
+
+Usage: python benchmarks/callback_load_test.py [filter changes] [places per change]
+'''
+import os
+import sys
+import json
+import time
+import random
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+os.environ['FIGURE_CACHE_SIZE'] = '0'
+os.environ['WARMUP_SIZE'] = '0'
+os.environ['REQUEST_HISTORY'] = ''
+
+import numpy as np
+from werkzeug.serving import make_server
+
+import main
+from data_provider import *
+
+def start_server():
+    server = make_server('127.0.0.1', 0, main.app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+def callback_payloads(selected_product, selected_year_range, selected_places):
+    inputs = [{ 'id': 'selected_product', 'property': 'value', 'value': selected_product },
+              { 'id': 'selected_years', 'property': 'value', 'value': list(selected_year_range) },
+              { 'id': 'selected_places', 'property': 'value', 'value': selected_places }]
+
+    transform_input = { 'id': 'selected_transform', 'property': 'value',
+                        'value': main.DEFAULT_TRANSFORM }
+
+    for output_name, (outputs, _) in main.DASHBOARD_OUTPUTS.items():
+        output_ids = [ f'{output.component_id}.{output.component_property}' for output in outputs ]
+        yield { 'output': f'..{"...".join(output_ids)}..',
+                'outputs': [{ 'id': output.component_id, 'property': output.component_property }
+                            for output in outputs],
+                'inputs': inputs + ([transform_input] if output_name in main.TRANSFORM_OUTPUTS else []),
+                'changedPropIds': ['selected_places.value'] }
+
+def post(server_url, payload):
+    request = urllib.request.Request(f'{server_url}/_dash-update-component',
+                                     data=json.dumps(payload).encode('utf-8'),
+                                     headers={ 'Content-Type': 'application/json' })
+    with urllib.request.urlopen(request) as response:
+        response.read()
+    return time.perf_counter()
+
+def sequential_requests(server_url, payloads, executor):
+    start_time = time.perf_counter()
+    arrival_times = [ post(server_url, payload) for payload in payloads ]
+    return [ arrival_time - start_time for arrival_time in arrival_times ]
+
+def concurrent_requests(server_url, payloads, executor):
+    start_time = time.perf_counter()
+    futures = [ executor.submit(post, server_url, payload) for payload in payloads ]
+    return [ future.result() - start_time for future in futures ]
+
+def main_load_test(filter_changes, places_per_change):
+    random.seed(0)
+    server_url = start_server()
+    place_ids = list(PLACES_DICT)
+    filters = [ (random.choice(PRODUCTS),
+                 tuple(sorted(int(year) for year in random.sample(YEARS, 2))),
+                 random.sample(place_ids, min(places_per_change, len(place_ids))))
+                for _ in range(filter_changes) ]
+
+    print(f'{filter_changes} filter changes, {places_per_change} places each')
+    print(f'{"requests":>10} {"first p50":>10} {"first p99":>10} {"last p50":>10} {"last p99":>10}')
+    with ThreadPoolExecutor(max_workers=len(main.DASHBOARD_OUTPUTS)) as executor:
+        for name, send_requests in [('sequential', sequential_requests),
+                                    ('concurrent', concurrent_requests)]:
+            # Filtered slices cached by the previous run would skew this one
+            main.FILTERED_SLICE_CACHE.clear()
+
+            first_times, last_times = [], []
+            for selected_filters in filters:
+                arrival_times = send_requests(server_url,
+                                              list(callback_payloads(*selected_filters)),
+                                              executor)
+                first_times.append(min(arrival_times))
+                last_times.append(max(arrival_times))
+
+            print(f'{name:>10} ' + ' '.join(f'{np.percentile(times, percentile) * 1000:>8.1f}ms'
+                                            for times in [first_times, last_times]
+                                            for percentile in [50, 99]))
+
+    print('mean build time per output:')
+    for output_name, timings in main.FIGURE_TIMINGS.stats().items():
+        print(f'{output_name:>32} {timings["mean_seconds"] * 1000:>8.1f}ms')
+
+if __name__ == '__main__':
+    main_load_test(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+                   int(sys.argv[2]) if len(sys.argv) > 2 else 10)
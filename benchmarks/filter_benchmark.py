@@ -0,0 +1,61 @@
+'''
+Micro-benchmark of the place filtering: boolean masks
+over the whole aggregate cube against the place index
+used by data_provider.select_aggregate_data.
+
+Usage: python benchmarks/filter_benchmark.py [repetitions]
+'''
+import os
+import sys
+import random
+import timeit
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+
+from data_provider import *
+
+PRODUCT = 'GASOLINA COMUM'
+YEAR_RANGE = (2018, max(YEARS))
+SELECTION_SIZES = [1, 10, 500]
+
+AGGREGATE_DATA = read_aggregate_data()
+
+def filter_with_masks(product, year_range, place_ids):
+    dataset_years = AGGREGATE_DATA[COLUMNS.MONTH].dt.year
+    filters = ((AGGREGATE_DATA[COLUMNS.PRODUCT] == product) &
+               (dataset_years >= year_range[0]) &
+               (dataset_years <= year_range[1]) &
+               (AGGREGATE_DATA[COLUMNS.PLACE_ID].isin(place_ids)))
+
+    return AGGREGATE_DATA[filters]
+
+def main(repetitions):
+    random.seed(0)
+    place_ids = list(PLACES_DICT)
+
+    print(f'{len(AGGREGATE_DATA)} aggregate rows')
+    print(f'{"places":>6} {"rows":>8} {"masks":>10} {"index":>10}')
+    for size in SELECTION_SIZES:
+        selected_places = random.sample(place_ids, min(size, len(place_ids)))
+
+        expected = filter_with_masks(PRODUCT, YEAR_RANGE, selected_places)
+        result = select_aggregate_data(PRODUCT, YEAR_RANGE, selected_places)
+        # Each product cube has its own row positions, so rows are compared by place and month
+        sort_columns = [COLUMNS.PLACE_ID, COLUMNS.MONTH]
+        assert result.astype(str).sort_values(sort_columns).reset_index(drop=True)\
+                     .equals(expected.astype(str).sort_values(sort_columns).reset_index(drop=True))
+
+        def time_filter(filter_function):
+            return min(timeit.repeat(
+                lambda: filter_function(PRODUCT, YEAR_RANGE, selected_places),
+                number=1, repeat=repetitions))
+
+        masks_time = time_filter(filter_with_masks)
+        index_time = time_filter(select_aggregate_data)
+        print(f'{size:>6} {len(result):>8} '
+              f'{masks_time * 1000:>8.2f}ms {index_time * 1000:>8.2f}ms')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,44 @@
+'''
+Reports how long data_provider.count_gas_stations takes for
+random place selections. tests/test_gas_stations_count.py
+checks the counts against a brute force count.
+
+Usage: python benchmarks/gas_stations_count_benchmark.py [selections]
+'''
+import os
+import sys
+import random
+import timeit
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+
+from data_provider import *
+
+def random_selection(place_ids):
+    # Bias towards selections mixing nested places
+    size = random.choice([1, 2, 5, 10, 50, len(place_ids)])
+    return random.sample(place_ids, min(size, len(place_ids)))
+
+def main(selections):
+    random.seed(0)
+    place_ids = list(PLACES_DICT)
+    timings = []
+
+    for _ in range(selections):
+        product = random.choice(PRODUCTS)
+        first_year, last_year = sorted(random.choices(YEARS, k=2))
+        selected_places = random_selection(place_ids)
+
+        timings.append(min(timeit.repeat(
+            lambda: count_gas_stations(product, (first_year, last_year), selected_places),
+            number=1, repeat=5)))
+
+    timings.sort()
+    print(f'{selections} selections')
+    print(f'median: {timings[len(timings) // 2] * 1e6:.0f}us, '
+          f'max: {timings[-1] * 1e6:.0f}us')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,73 @@
+'''
+Compares the eager loader (whole CSV parsed at once, then
+aggregated) with the chunked loader data_provider uses, both
+writing the partitions to a temporary directory, and reports
+their time and peak traced memory. tests/test_chunked_loader.py
+checks both produce the same metadata and aggregates.
+
+Usage: python benchmarks/loader_benchmark.py [chunk sizes...]
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import tracemalloc
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+
+import data_provider
+
+MEGABYTE = 1024 ** 2
+
+def load_eagerly(output_path):
+    read_source_data = getattr(data_provider, '__read_source_data')
+    compact_dataset = getattr(data_provider, '__compact_dataset')
+    build_metadata = getattr(data_provider, '__build_metadata')
+    split_partitions = getattr(data_provider, '__split_partitions')
+    write_partitions = getattr(data_provider, '__write_partitions')
+
+    dataset = compact_dataset(read_source_data())
+    metadata = build_metadata(dataset)
+    partitions = split_partitions(data_provider.generate_aggregate_data(dataset))
+    return metadata, write_partitions(os.path.join(output_path, 'partitions'),
+                                      metadata, sorted(partitions.items()))
+
+def load_in_chunks(chunk_size, output_path):
+    load_source_data_in_chunks = getattr(data_provider, '__load_source_data_in_chunks')
+    write_partitions = getattr(data_provider, '__write_partitions')
+
+    partitions_path = os.path.join(output_path, 'partitions')
+    metadata, partitions = load_source_data_in_chunks(chunk_size, f'{partitions_path}.spill.tmp')
+    return metadata, write_partitions(partitions_path, metadata, partitions)
+
+def measure(loader, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = loader(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main(chunk_sizes):
+    output_path = tempfile.mkdtemp()
+    try:
+        _, elapsed, peak = measure(load_eagerly, output_path)
+    finally:
+        shutil.rmtree(output_path, ignore_errors=True)
+    print(f'{"loader":<18} {"time":>8} {"peak memory":>12}')
+    print(f'{"eager":<18} {elapsed:>7.2f}s {peak / MEGABYTE:>10.1f}MB')
+
+    for chunk_size in chunk_sizes:
+        output_path = tempfile.mkdtemp()
+        try:
+            _, elapsed, peak = measure(load_in_chunks, chunk_size, output_path)
+        finally:
+            shutil.rmtree(output_path, ignore_errors=True)
+        print(f'{f"chunks of {chunk_size}":<18} {elapsed:>7.2f}s {peak / MEGABYTE:>10.1f}MB')
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 50000, 200000])
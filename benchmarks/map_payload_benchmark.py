@@ -0,0 +1,78 @@
+'''
+Compares the map sent on every filter change: the full
+px.scatter_mapbox figure built from the filtered months
+against the marker arrays drawn by assets/clientside.js,
+in serialized bytes and build time.
+
+Usage: python benchmarks/map_payload_benchmark.py [repetitions]
+'''
+import os
+import sys
+import json
+import timeit
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+os.environ['WARMUP_SIZE'] = '0'
+
+import plotly.express as px
+from plotly.utils import PlotlyJSONEncoder
+
+import main
+from data_provider import *
+
+PRODUCT = 'GASOLINA COMUM'
+YEAR_RANGE = (2018, max(YEARS))
+
+def scatter_mapbox_figure(product, year_range, place_ids):
+    filtered_dataset = main.filter_by_places(product, year_range, place_ids)
+    place_groups = filtered_dataset.groupby([COLUMNS.PLACE_NAME], as_index=False)
+
+    return px.scatter_mapbox(place_groups.mean(),
+                             lat=COLUMNS.LATITUDE, lon=COLUMNS.LONGITUDE,
+                             size=COLUMNS.MARKET_PRICE_MEAN,
+                             width=800, height=600,
+                             zoom=2.5,
+                             center=dict(lat=-11.619893, lon=-56.408030),
+                             color_continuous_scale=px.colors.sequential.Aggrnyl,
+                             color=COLUMNS.MARKET_PRICE_MEAN,
+                             hover_name=COLUMNS.PLACE_NAME,
+                             hover_data={ COLUMNS.MARKET_PRICE_MEAN: ':.2f',
+                                          COLUMNS.LATITUDE: False,
+                                          COLUMNS.LONGITUDE: False },
+                             title=f"Preço Médio do Combustível nas Revendas { PRODUCT_UNITS[product] }",
+    ).to_dict()
+
+def map_markers(product, year_range, place_ids):
+    return main.build_brazil_map_markers(select_map_markers(product, year_range, place_ids),
+                                         product)
+
+def payload_size(payload):
+    return len(json.dumps(payload, cls=PlotlyJSONEncoder).encode('utf-8'))
+
+def main_benchmark(repetitions):
+    city_ids = [ place_id for place_id in PLACES_DICT if place_id.startswith('city') ]
+    state_ids = [ place_id for place_id in PLACES_DICT if place_id.startswith('state') ]
+    selections = { 'default cities': ['city_MANAUS', 'city_BRASILIA', 'city_FLORIANOPOLIS',
+                                      'city_SALVADOR', 'city_SAO PAULO'],
+                   'all states': state_ids,
+                   'all cities': city_ids }
+
+    print(f'base figure sent once per page: {payload_size(main.BRAZIL_MAP_BASE_FIGURE)} bytes')
+    print(f'{"selection":>15} {"places":>6} {"figure":>10} {"markers":>10} '
+          f'{"figure":>10} {"markers":>10}')
+    for name, place_ids in selections.items():
+        def time_build(build_function):
+            return min(timeit.repeat(lambda: build_function(PRODUCT, YEAR_RANGE, place_ids),
+                                     number=1, repeat=repetitions))
+
+        figure_bytes = payload_size(scatter_mapbox_figure(PRODUCT, YEAR_RANGE, place_ids))
+        markers_bytes = payload_size(map_markers(PRODUCT, YEAR_RANGE, place_ids))
+        print(f'{name:>15} {len(place_ids):>6} {figure_bytes:>9}B {markers_bytes:>9}B '
+              f'{time_build(scatter_mapbox_figure) * 1000:>8.1f}ms '
+              f'{time_build(map_markers) * 1000:>8.1f}ms')
+
+if __name__ == '__main__':
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,44 @@
+'''
+Reports the in-memory size of DATASET as parsed from
+the source CSV files and after data_provider compacts it.
+
+Usage: python benchmarks/memory_footprint.py
+'''
+import os
+import sys
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+
+import data_provider
+
+MEGABYTE = 1024 ** 2
+
+def column_sizes(dataset):
+    return dataset.memory_usage(deep=True, index=False)
+
+def main():
+    read_source_data = getattr(data_provider, '__read_source_data')
+    compact_dataset = getattr(data_provider, '__compact_dataset')
+
+    parsed_dataset = read_source_data()
+    before = column_sizes(parsed_dataset)
+    before_dtypes = parsed_dataset.dtypes
+
+    compact = compact_dataset(parsed_dataset.copy())
+    after = column_sizes(compact)
+
+    print(f'{"column":<32} {"before":>18} {"after":>18}')
+    for column in before.index:
+        after_str = (f'{after[column] / MEGABYTE:8.2f}MB {str(compact[column].dtype):>8}'
+                     if column in after.index else f'{"dropped":>19}')
+        print(f'{column:<32} {before[column] / MEGABYTE:8.2f}MB {str(before_dtypes[column]):>8} '
+              f'{after_str}')
+
+    print(f'{"total":<32} {before.sum() / MEGABYTE:8.2f}MB {"":>8} '
+          f'{after.sum() / MEGABYTE:8.2f}MB')
+    print(f'reduction: {before.sum() / after.sum():.1f}x')
+
+if __name__ == '__main__':
+    main()
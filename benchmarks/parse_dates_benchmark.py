@@ -0,0 +1,54 @@
+'''
+Compares the locale based month parsing previously used by
+data_provider with the current lookup based parser over the
+MÊS column of the full ANP file.
+
+Usage: python benchmarks/parse_dates_benchmark.py [repetitions]
+'''
+import os
+import sys
+import timeit
+import locale as lcl
+import pandas as pd
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+
+import data_provider
+
+def parse_dates_with_locale(series):
+    default_locale_str = lcl.getlocale()[0]
+    lcl.setlocale(lcl.LC_ALL, 'pt_BR')
+    parsed_series = pd.to_datetime(series, format='%b/%y')
+    lcl.setlocale(lcl.LC_ALL, default_locale_str)
+    return parsed_series
+
+def main(repetitions):
+    months = pd.read_csv(data_provider.gas_dataset_path,
+                         sep=';', encoding='cp1252',
+                         usecols=[data_provider.COLUMNS.MONTH])\
+                        [data_provider.COLUMNS.MONTH]
+    parse_dates = getattr(data_provider, '__parse_dates')
+
+    print(f'{len(months)} rows, {months.nunique()} distinct months')
+
+    lookup_time = min(timeit.repeat(lambda: parse_dates(months),
+                                    number=1, repeat=repetitions))
+    print(f'lookup : {lookup_time * 1000:.1f}ms')
+
+    try:
+        expected = parse_dates_with_locale(months)
+    except lcl.Error:
+        print('locale : skipped, pt_BR locale is not installed')
+        return
+
+    assert parse_dates(months).equals(expected)
+
+    locale_time = min(timeit.repeat(lambda: parse_dates_with_locale(months),
+                                    number=1, repeat=repetitions))
+    print(f'locale : {locale_time * 1000:.1f}ms')
+    print(f'speedup: {locale_time / lookup_time:.1f}x')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,59 @@
+'''
+Times the NumPy partial aggregation kernel, with the regions
+rolled up from the states, against the unweighted state and
+region groupbys it replaced. tests/test_partial_aggregation.py
+checks its results against a pandas reference.
+
+Usage: python benchmarks/partial_aggregation_benchmark.py [repetitions]
+'''
+import os
+import sys
+import timeit
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+
+import data_provider
+from data_provider import *
+
+DATASET = read_dataset()
+
+aggregate_partials = getattr(data_provider, '__aggregate_partials')
+finalize_partials = getattr(data_provider, '__finalize_partials')
+
+MEAN_COLUMNS = [COLUMNS.MARKET_MARGIN, COLUMNS.DIST_PRICE_MEAN, COLUMNS.DIST_PRICE_STD,
+                COLUMNS.DIST_PRICE_VAR_COEF, COLUMNS.LATITUDE, COLUMNS.LONGITUDE]
+
+def groupby_partials(dataset, place_column):
+    '''The unweighted groupby the kernel replaced'''
+    mean_columns = MEAN_COLUMNS + [COLUMNS.MARKET_PRICE_MEAN, COLUMNS.MARKET_PRICE_STD,
+                                   COLUMNS.MARKET_PRICE_VAR_COEF]
+    measures = dataset.astype({ column: 'float64' for column in mean_columns })
+    return measures.groupby([place_column, COLUMNS.PRODUCT, COLUMNS.MONTH], observed=True)\
+                   .agg({ COLUMNS.GAS_STATION_COUNT: ['sum'],
+                          COLUMNS.MARKET_PRICE_MIN: ['min'],
+                          COLUMNS.MARKET_PRICE_MAX: ['max'],
+                          COLUMNS.DIST_PRICE_MIN: ['min'],
+                          COLUMNS.DIST_PRICE_MAX: ['max'],
+                          **{ column: ['sum', 'count'] for column in mean_columns } })
+
+def groupby_aggregates():
+    return [ groupby_partials(DATASET, place_column)
+             for place_column in [COLUMNS.STATE, COLUMNS.REGION] ]
+
+def kernel_aggregates():
+    partials = [aggregate_partials(DATASET)]
+    return [ finalize_partials(partials, place_column)
+             for place_column in [COLUMNS.STATE, COLUMNS.REGION] ]
+
+def main(repetitions):
+    def time_aggregates(aggregates_function):
+        return min(timeit.repeat(aggregates_function, number=1, repeat=repetitions))
+
+    print(f'{len(DATASET)} city rows, state and region partials')
+    print(f'groupby: {time_aggregates(groupby_aggregates) * 1000:.1f}ms, '
+          f'kernel: {time_aggregates(kernel_aggregates) * 1000:.1f}ms')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -0,0 +1,60 @@
+'''
+Bytes of the page layout with every place listed in the
+places dropdown against the layout sent now, with only the
+selected places, and the time of the place searches that
+fill the dropdown as the user types. The searches also run
+over every IBGE city, as when the ANP covers all of them.
+
+Usage: python benchmarks/place_search_benchmark.py [repetitions]
+'''
+import os
+import sys
+import json
+import timeit
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+os.environ['WARMUP_SIZE'] = '0'
+
+import pandas as pd
+from plotly.utils import PlotlyJSONEncoder
+
+import main
+import data_provider
+from place_search import PlaceSearchIndex
+
+QUERIES = ['s', 'sa', 'sao', 'sao p', 'paulo', 'rio grande', 'sp']
+
+def layout_bytes():
+    return len(json.dumps(main.serve_layout(), cls=PlotlyJSONEncoder).encode('utf-8'))
+
+def ibge_places():
+    cities_data = pd.read_csv(data_provider.cities_dataset_path, sep=';', encoding='cp1252')
+    return { f'city_{index}': f'{name} ({uf})' for index, (name, uf)
+             in enumerate(zip(cities_data[data_provider.COLUMNS.CITY_NAME],
+                              cities_data[data_provider.COLUMNS.UF])) }
+
+def main_benchmark(repetitions):
+    searched_bytes = layout_bytes()
+    all_options = main.place_options(data_provider.PLACES_DICT)
+    main.place_options = lambda place_ids: all_options
+    listed_bytes = layout_bytes()
+    print(f'layout with every place: {listed_bytes}B, with the selected places: {searched_bytes}B')
+
+    for name, places_dict in [('dataset places', data_provider.PLACES_DICT),
+                              ('IBGE cities', ibge_places())]:
+        build_seconds = min(timeit.repeat(lambda: PlaceSearchIndex(places_dict),
+                                          number=1, repeat=repetitions))
+        index = PlaceSearchIndex(places_dict)
+        print(f'{name}: {len(places_dict)} places, index built in {build_seconds * 1000:.1f}ms')
+        print(f'{"query":>12} {"matches":>8} {"search":>10}')
+        for query in QUERIES:
+            search_seconds = min(timeit.repeat(lambda: index.search(query, main.PLACE_SEARCH_LIMIT),
+                                               number=1, repeat=repetitions))
+            matches = len(index.search(query, len(places_dict)))
+            print(f'{query:>12} {matches:>8} {search_seconds * 1e6:>8.0f}us')
+
+if __name__ == '__main__':
+    main_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,220 @@
+'''
+Benchmark suite of data_provider and the dashboard outputs,
+runnable offline against the data directory in DATA_DIR
+(see scale_dataset.py for larger datasets). Covers:
+
+- importing data_provider from the CSV files (cold) and the cache (warm)
+- reading the ANP file, __parse_dates and __merge_city_data
+- generate_aggregate_data
+- filter_by_places, each figure builder and all the dashboard
+  outputs, over a matrix of selection sizes and year ranges
+
+The timings are written as JSON, compare two runs with --compare.
+
+Usage: python benchmarks/run_benchmarks.py [--repeat N] [--output FILE] [--compare FILE]
+'''
+import os
+import sys
+import json
+import shutil
+import tempfile
+import time
+import random
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+os.environ['FIGURE_CACHE_SIZE'] = '0'
+os.environ['WARMUP_SIZE'] = '0'
+
+import numpy as np
+import pandas as pd
+
+SELECTION_SIZES = [1, 10, 100]
+PRODUCT = 'GASOLINA COMUM'
+
+def time_repeated(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+
+    return { 'repeat': repeat,
+             'min': min(timings),
+             'median': float(np.median(timings)),
+             'mean': float(np.mean(timings)),
+             'max': max(timings) }
+
+def benchmark_imports(data_dir, repeat):
+    '''
+    Times a fresh interpreter importing data_provider, parsing
+    the CSV files (cold) or reading the columnar cache (warm).
+    Runs against a temporary directory linking the data files,
+    so the cache of data_dir is left as it is
+    '''
+    import_data_dir = tempfile.mkdtemp()
+    for name in os.listdir(data_dir):
+        if name != 'cache':
+            os.symlink(os.path.abspath(os.path.join(data_dir, name)),
+                       os.path.join(import_data_dir, name))
+
+    def import_data_provider():
+        subprocess.run([sys.executable, '-c', 'import data_provider'], cwd=ROOT_PATH,
+                       env=dict(os.environ, DATA_DIR=import_data_dir), check=True)
+
+    def import_from_csv():
+        shutil.rmtree(os.path.join(import_data_dir, 'cache'), ignore_errors=True)
+        import_data_provider()
+
+    try:
+        cold = time_repeated(import_from_csv, repeat)
+        warm = time_repeated(import_data_provider, repeat)
+    finally:
+        shutil.rmtree(import_data_dir, ignore_errors=True)
+    return [('import data_provider (cold)', {}, cold),
+            ('import data_provider (warm)', {}, warm)]
+
+def benchmark_loading(data_provider, repeat):
+    read_gas_data = getattr(data_provider, '__read_gas_data')
+    read_cities_data = getattr(data_provider, '__read_cities_data')
+    parse_dates = getattr(data_provider, '__parse_dates')
+    merge_city_data = getattr(data_provider, '__merge_city_data')
+
+    gas_data = read_gas_data(data_provider.gas_dataset_path)
+    cities_data = read_cities_data()
+    month_strings = pd.read_csv(data_provider.gas_dataset_path,
+                                sep=';', encoding='cp1252',
+                                usecols=[data_provider.COLUMNS.MONTH])[data_provider.COLUMNS.MONTH]
+
+    dataset = data_provider.read_dataset()
+
+    return [('__read_gas_data', {}, time_repeated(
+                lambda: read_gas_data(data_provider.gas_dataset_path), repeat)),
+            ('__parse_dates', {}, time_repeated(
+                lambda: parse_dates(month_strings), repeat)),
+            ('__merge_city_data', {}, time_repeated(
+                lambda: merge_city_data(gas_data, cities_data), repeat)),
+            ('generate_aggregate_data', {}, time_repeated(
+                lambda: data_provider.generate_aggregate_data(dataset), repeat))]
+
+def selection_matrix(data_provider):
+    years = sorted(int(year) for year in data_provider.YEARS)
+    year_ranges = [(years[-1], years[-1]),
+                   (years[max(len(years) - 3, 0)], years[-1]),
+                   (years[0], years[-1])]
+    place_ids = sorted(data_provider.PLACES_DICT)
+
+    for size in SELECTION_SIZES:
+        selected_places = random.Random(size).sample(place_ids, min(size, len(place_ids)))
+        for year_range in year_ranges:
+            yield { 'places': len(selected_places),
+                    'years': list(year_range) }, selected_places, year_range
+
+def benchmark_outputs(main, repeat):
+    from data_provider import select_map_markers, select_yearly_rollup
+
+    figure_builders = {
+        'build_brazil_map_markers': lambda places, years, _: main.build_brazil_map_markers(
+            select_map_markers(PRODUCT, years, places), PRODUCT),
+        'build_market_price_plot': lambda places, years, filtered: main.build_market_price_plot(
+            filtered, PRODUCT).to_dict(),
+        'build_market_margin_plot': lambda places, years, filtered: main.build_market_margin_plot(
+            filtered, PRODUCT).to_dict(),
+        'build_market_price_std_deviation_plot': lambda places, years, _: main.build_market_price_std_deviation_plot(
+            select_yearly_rollup(PRODUCT, years, places), PRODUCT).to_dict(),
+        'build_market_price_var_coef_plot': lambda places, years, _: main.build_market_price_var_coef_plot(
+            select_yearly_rollup(PRODUCT, years, places), PRODUCT).to_dict(),
+    }
+
+    def build_dashboard_outputs(places, years):
+        main.FILTERED_SLICE_CACHE.clear()
+        for output_name in main.DASHBOARD_OUTPUTS:
+            main.get_dashboard_output(output_name, PRODUCT, years, places)
+
+    results = []
+    for params, places, years in selection_matrix(main.data_provider):
+        results.append(('filter_by_places', params, time_repeated(
+            lambda: main.filter_by_places(PRODUCT, years, places), repeat)))
+
+        filtered = main.filter_by_places(PRODUCT, years, places)
+        for name, build_figure in figure_builders.items():
+            results.append((name, params, time_repeated(
+                lambda: build_figure(places, years, filtered), repeat)))
+
+        results.append(('build_dashboard_outputs', params, time_repeated(
+            lambda: build_dashboard_outputs(places, years), repeat)))
+
+    return results
+
+def environment_info(data_provider):
+    def version(module_name):
+        return sys.modules[module_name].__version__
+
+    git_commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_PATH,
+                                capture_output=True, text=True).stdout.strip()
+
+    return { 'python': platform.python_version(),
+             'platform': platform.platform(),
+             'pandas': version('pandas'),
+             'numpy': version('numpy'),
+             'plotly': version('plotly'),
+             'dash': version('dash'),
+             'git_commit': git_commit,
+             'data_dir': data_provider.data_dir_path,
+             'dataset_rows': len(data_provider.read_dataset()),
+             'aggregate_rows': len(data_provider.read_aggregate_data()) }
+
+def compare_results(results, baseline_path):
+    with open(baseline_path) as baseline_file:
+        baseline = { (result['name'], json.dumps(result['params'], sort_keys=True)): result
+                     for result in json.load(baseline_file)['results'] }
+
+    print(f'\ncompared to {baseline_path} (median, >1 is slower):')
+    for result in results:
+        key = (result['name'], json.dumps(result['params'], sort_keys=True))
+        if key in baseline:
+            ratio = result['median'] / baseline[key]['median']
+            print(f'{result["name"]:>40} {json.dumps(result["params"]):>32} {ratio:>6.2f}x')
+
+def main_benchmarks(arguments):
+    data_dir = os.environ.get('DATA_DIR', 'data')
+    results = benchmark_imports(data_dir, arguments.import_repeat)
+
+    import data_provider
+    import main
+    results += benchmark_loading(data_provider, arguments.repeat)
+    results += benchmark_outputs(main, arguments.repeat)
+
+    results = [ dict(name=name, params=params, **timings)
+                for name, params, timings in results ]
+    for result in results:
+        print(f'{result["name"]:>40} {json.dumps(result["params"]):>32} '
+              f'{result["median"] * 1000:>10.1f}ms')
+
+    output_path = arguments.output or os.path.join(
+        ROOT_PATH, 'benchmarks', 'results',
+        f'{os.path.basename(os.path.normpath(data_dir))}-'
+        f'{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as output_file:
+        json.dump({ 'created_at': datetime.now(timezone.utc).isoformat(),
+                    'environment': environment_info(data_provider),
+                    'results': results }, output_file, indent=2)
+    print(f'\nresults written to {output_path}')
+
+    if arguments.compare:
+        compare_results(results, arguments.compare)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the benchmark suite.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--import-repeat', type=int, default=2)
+    parser.add_argument('--output', help='JSON file for the results')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    main_benchmarks(parser.parse_args())
@@ -0,0 +1,83 @@
+'''
+Writes a copy of the data directory with the ANP file scaled
+by a factor, for benchmarking larger datasets. Every copy of
+a city gets a numbered name ("MANAUS 2"), slightly moved
+coordinates and prices scaled by a random factor, so the
+copies aggregate as distinct cities.
+
+Usage: python benchmarks/scale_dataset.py FACTOR OUTPUT_DIR [SOURCE_DIR]
+Then: DATA_DIR=OUTPUT_DIR python benchmarks/run_benchmarks.py
+'''
+import os
+import sys
+import shutil
+
+import numpy as np
+import pandas as pd
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GAS_FILE_NAME = 'dados-ANP-2013-2020.csv'
+CITIES_FILE_NAME = 'dados-IBGE-municipios.csv'
+PLACES_FILE_NAME = 'brazil-places-polygons.csv'
+
+PRICE_COLUMNS = ['PREÇO MÉDIO REVENDA', 'DESVIO PADRÃO REVENDA',
+                 'PREÇO MÍNIMO REVENDA', 'PREÇO MÁXIMO REVENDA',
+                 'MARGEM MÉDIA REVENDA', 'PREÇO MÉDIO DISTRIBUIÇÃO',
+                 'DESVIO PADRÃO DISTRIBUIÇÃO', 'PREÇO MÍNIMO DISTRIBUIÇÃO',
+                 'PREÇO MÁXIMO DISTRIBUIÇÃO']
+
+def read_anp_csv(path):
+    return pd.read_csv(path, sep=';', encoding='cp1252', decimal=',', na_values=['-'])
+
+def write_anp_csv(frame, path, append):
+    frame.to_csv(path, sep=';', encoding='cp1252', decimal=',', na_rep='-',
+                 index=False, float_format='%.3f',
+                 mode='a' if append else 'w', header=not append)
+
+def scale_dataset(factor, output_dir, source_dir):
+    random = np.random.default_rng(0)
+    gas_data = read_anp_csv(os.path.join(source_dir, GAS_FILE_NAME))
+    cities_data = pd.read_csv(os.path.join(source_dir, CITIES_FILE_NAME),
+                              sep=';', encoding='cp1252')
+
+    os.makedirs(output_dir, exist_ok=True)
+    shutil.copy(os.path.join(source_dir, PLACES_FILE_NAME), output_dir)
+
+    city_names = gas_data['MUNICÍPIO'].unique()
+    # Matches the normalized MUNICÍPIO names of the ANP file
+    normalized_names = cities_data['NOME MUNICIPIO'].str.normalize('NFKD')\
+                                                    .str.encode('ascii', errors='ignore')\
+                                                    .str.decode('utf-8')\
+                                                    .str.upper()
+    surveyed_cities = cities_data[normalized_names.isin(city_names)]
+
+    gas_path = os.path.join(output_dir, GAS_FILE_NAME)
+    cities_copies = [cities_data]
+    for copy in range(factor):
+        gas_copy = gas_data.copy()
+        if copy > 0:
+            gas_copy['MUNICÍPIO'] = gas_copy['MUNICÍPIO'] + f' {copy}'
+            price_factors = pd.Series(random.uniform(0.95, 1.05, len(city_names)),
+                                      index=city_names)
+            row_factors = price_factors[gas_data['MUNICÍPIO']].values
+            for column in PRICE_COLUMNS:
+                gas_copy[column] = gas_copy[column] * row_factors
+
+            cities_copy = surveyed_cities.copy()
+            cities_copy['NOME MUNICIPIO'] = cities_copy['NOME MUNICIPIO'] + f' {copy}'
+            for column in ['LATITUDE', 'LONGITUDE']:
+                cities_copy[column] = (cities_copy[column] +
+                                       random.uniform(-0.2, 0.2, len(cities_copy))).round(2)
+            cities_copies.append(cities_copy)
+
+        write_anp_csv(gas_copy, gas_path, append=copy > 0)
+
+    pd.concat(cities_copies).to_csv(os.path.join(output_dir, CITIES_FILE_NAME),
+                                    sep=';', encoding='cp1252', index=False)
+
+    print(f'{len(gas_data) * factor} rows written to {gas_path}')
+
+if __name__ == '__main__':
+    scale_dataset(int(sys.argv[1]), sys.argv[2],
+                  sys.argv[3] if len(sys.argv) > 3 else os.path.join(ROOT_PATH, 'data'))
@@ -0,0 +1,59 @@
+'''
+Bytes sent by the clientside filtering mode: the series store
+of a product and places, sent once for every year, against
+the outputs the server sends on each move of the year slider,
+raw and gzip compressed as Flask-Compress sends them.
+
+Usage: python benchmarks/series_store_benchmark.py
+'''
+import os
+import sys
+import gzip
+import json
+import time
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+os.environ['WARMUP_SIZE'] = '0'
+os.environ['REQUEST_HISTORY'] = ''
+os.environ['CLIENTSIDE_FILTERING'] = '1'
+
+from plotly.utils import PlotlyJSONEncoder
+
+import main
+from data_provider import *
+
+PRODUCT = 'GASOLINA COMUM'
+YEAR_RANGE = [2018, int(max(YEARS))]
+
+def payload_bytes(payload):
+    '''Raw and gzip compressed bytes of the payload'''
+    payload_json = json.dumps(payload, cls=PlotlyJSONEncoder).encode('utf-8')
+    return len(payload_json), len(gzip.compress(payload_json))
+
+def main_benchmark():
+    city_ids = [ place_id for place_id in PLACES_DICT if place_id.startswith('city') ]
+    selections = { 'one city': city_ids[:1],
+                   'default places': main.DEFAULT_PLACES,
+                   '50 cities': city_ids[:50],
+                   f'{main.MAP_CLUSTER_THRESHOLD} cities': city_ids[:main.MAP_CLUSTER_THRESHOLD] }
+
+    print(f'{"selection":>15} {"store":>6} {"store raw":>10} {"gzip":>8} {"build":>9} '
+          f'{"outputs raw":>12} {"gzip":>8}')
+    for name, place_ids in selections.items():
+        start_time = time.perf_counter()
+        store = main.get_series_store(PRODUCT, YEAR_RANGE, place_ids)
+        build_seconds = time.perf_counter() - start_time
+
+        outputs = { output_name: main.get_dashboard_output(output_name, PRODUCT,
+                                                           YEAR_RANGE, place_ids)
+                    for output_name in main.DASHBOARD_OUTPUTS }
+        store_raw, store_gzip = payload_bytes(store)
+        outputs_raw, outputs_gzip = payload_bytes(outputs)
+        print(f'{name:>15} {store["kind"]:>6} {store_raw:>9}B {store_gzip:>7}B '
+              f'{build_seconds * 1000:>7.1f}ms {outputs_raw:>11}B {outputs_gzip:>7}B')
+
+if __name__ == '__main__':
+    main_benchmark()
@@ -0,0 +1,73 @@
+'''
+Compares the time to import data_provider when the
+dataset has to be parsed from the source CSV files (cold)
+against reading the partition metadata from the cache
+(warm), and the time of the first request of a product,
+which reads its partitions. Runs against a temporary
+directory linking the data files of DATA_DIR, with its own
+cache, so the cache of DATA_DIR is left as it is.
+
+Usage: python benchmarks/startup_benchmark.py [repetitions]
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT_PATH, os.environ.get('DATA_DIR', 'data'))
+
+FIRST_REQUEST = '''
+import time
+import data_provider
+start = time.perf_counter()
+data_provider.select_aggregate_data(data_provider.PRODUCTS[0], (2020, 2020), ['state_BAHIA'])
+print(time.perf_counter() - start)
+'''
+
+def link_data_dir():
+    '''Temporary data directory linking the files of DATA_DIR but its cache'''
+    data_dir = tempfile.mkdtemp()
+    for name in os.listdir(DATA_DIR):
+        if name != 'cache':
+            os.symlink(os.path.join(DATA_DIR, name), os.path.join(data_dir, name))
+    return data_dir
+
+def run_python(data_dir, code):
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT_PATH, check=True,
+                          env=dict(os.environ, DATA_DIR=data_dir),
+                          stdout=subprocess.PIPE, text=True).stdout
+
+def time_import(data_dir):
+    start = time.perf_counter()
+    run_python(data_dir, 'import data_provider')
+    return time.perf_counter() - start
+
+def time_first_request(data_dir):
+    return float(run_python(data_dir, FIRST_REQUEST).split()[-1])
+
+def main(repetitions):
+    cold_timings = []
+    warm_timings = []
+    first_request_timings = []
+    data_dir = link_data_dir()
+    try:
+        for _ in range(repetitions):
+            shutil.rmtree(os.path.join(data_dir, 'cache'), ignore_errors=True)
+            cold_timings.append(time_import(data_dir))
+            warm_timings.append(time_import(data_dir))
+            first_request_timings.append(time_first_request(data_dir))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    cold = min(cold_timings)
+    warm = min(warm_timings)
+    print(f'cold (CSV)    : {cold:.3f}s')
+    print(f'warm (cache)  : {warm:.3f}s')
+    print(f'speedup       : {cold / warm:.1f}x')
+    print(f'first request : {min(first_request_timings):.3f}s')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
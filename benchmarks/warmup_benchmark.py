@@ -0,0 +1,56 @@
+'''
+Time until every output of the first filter changes arrived
+on a cold figure cache and after the background warm-up:
+the first users pick the filters the warm-up builds, the
+default places and years of each product.
+
+Usage: python benchmarks/warmup_benchmark.py
+'''
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+os.environ['WARMUP_SIZE'] = '0'
+os.environ['REQUEST_HISTORY'] = ''
+
+# Imported before callback_load_test, which disables the figure cache
+import main
+from callback_load_test import start_server, callback_payloads, post
+
+def request_outputs(server_url, executor, filters):
+    '''Seconds until every output of the filter change arrived'''
+    start_time = time.perf_counter()
+    payloads = list(callback_payloads(*filters))
+    return max(executor.map(lambda payload: post(server_url, payload), payloads)) - start_time
+
+def clear_caches():
+    main.FIGURE_CACHE.clear()
+    main.FILTERED_SLICE_CACHE.clear()
+
+def main_benchmark():
+    server_url = start_server()
+    filters_list = [ (product, list(years), list(places))
+                     for product, years, places in main.warm_up_filters(len(main.PRODUCTS)) ]
+
+    with ThreadPoolExecutor(max_workers=len(main.DASHBOARD_OUTPUTS)) as executor:
+        clear_caches()
+        cold_timings = [ request_outputs(server_url, executor, filters) for filters in filters_list ]
+
+        clear_caches()
+        main.WARMUP.start(filters_list)
+        while main.WARMUP.stats()['state'] != 'done':
+            time.sleep(0.05)
+        warm_timings = [ request_outputs(server_url, executor, filters) for filters in filters_list ]
+
+    print(f'{len(filters_list)} filter changes, warm-up took {main.WARMUP.stats()["seconds"]:.2f}s')
+    print(f'{"product":>20} {"cold ms":>10} {"warm ms":>10}')
+    for (product, _, _), cold_timing, warm_timing in zip(filters_list, cold_timings, warm_timings):
+        print(f'{product:>20} {cold_timing * 1000:>10.1f} {warm_timing * 1000:>10.1f}')
+
+if __name__ == '__main__':
+    main_benchmark()
@@ -0,0 +1,131 @@
+'''
+Measures the memory of the gunicorn workers with the app
+preloaded in the master (shared dataset) and loaded by every
+worker: once the workers are idle after their warm-up, then
+after a round of API requests over random products, which
+builds the cubes of the products the master did not load.
+
+PSS splits each shared page between the processes mapping it,
+so the PSS of all processes adds up to the memory really used.
+Reads /proc/<pid>/smaps_rollup, so it only runs on Linux.
+
+Usage: python benchmarks/worker_memory.py [workers]
+'''
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import subprocess
+import urllib.parse
+import urllib.request
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SMAPS_FIELDS = ['Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty',
+                'Private_Clean', 'Private_Dirty']
+
+def free_port():
+    with socket.socket() as free_socket:
+        free_socket.bind(('127.0.0.1', 0))
+        return free_socket.getsockname()[1]
+
+def memory_of(pid):
+    '''
+    The smaps_rollup fields of the process, in MB
+    '''
+    memory = {}
+    with open(f'/proc/{pid}/smaps_rollup') as smaps_file:
+        for line in smaps_file:
+            field, _, value = line.partition(':')
+            if field in SMAPS_FIELDS:
+                memory[field] = int(value.split()[0]) / 1024
+
+    return memory
+
+def worker_pids(master_pid):
+    with open(f'/proc/{master_pid}/task/{master_pid}/children') as children_file:
+        return [ int(pid) for pid in children_file.read().split() ]
+
+def wait_until_serving(master, server_url, timeout=600):
+    end_time = time.time() + timeout
+    while time.time() < end_time and master.poll() is None:
+        try:
+            urllib.request.urlopen(f'{server_url}/api/places').read()
+            return
+        except OSError:
+            time.sleep(1)
+
+    raise TimeoutError(f'{server_url} did not start')
+
+def cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as stat_file:
+        fields = stat_file.read().rpartition(')')[2].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+def wait_until_idle(pids, idle_seconds=3, timeout=600):
+    '''Waits until the processes used no CPU for idle_seconds'''
+    end_time = time.time() + timeout
+    last_seconds = None
+    while time.time() < end_time:
+        seconds = sum(cpu_seconds(pid) for pid in pids)
+        if seconds == last_seconds:
+            return
+        last_seconds = seconds
+        time.sleep(idle_seconds)
+
+    raise TimeoutError(f'{pids} still busy')
+
+def send_requests(server_url, count):
+    random_generator = random.Random(0)
+    products = [ product['product'] for product in
+                 json.loads(urllib.request.urlopen(f'{server_url}/api/products').read()) ]
+    place_ids = list(json.loads(urllib.request.urlopen(f'{server_url}/api/places').read()))
+
+    for _ in range(count):
+        query = urllib.parse.urlencode({ 'product': random_generator.choice(products),
+                                         'places': ','.join(random_generator.sample(place_ids, 10)) })
+        urllib.request.urlopen(f'{server_url}/api/prices?{query}').read()
+
+def measure(workers, preload):
+    port = free_port()
+    server_url = f'http://127.0.0.1:{port}'
+    environment = dict(os.environ, BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(workers),
+                       GUNICORN_PRELOAD='1' if preload else '0', RELEASES_POLL_INTERVAL='0')
+    master = subprocess.Popen([sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()',
+                               '-c', 'gunicorn.conf.py', 'wsgi:server'],
+                              cwd=ROOT_PATH, env=environment,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_serving(master, server_url)
+        pids = worker_pids(master.pid)
+        wait_until_idle(pids)
+        after_warmup = memory_of(master.pid), [ memory_of(pid) for pid in pids ]
+
+        send_requests(server_url, 20 * workers)
+        return after_warmup, (memory_of(master.pid), [ memory_of(pid) for pid in pids ])
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait()
+
+def main(workers):
+    print(f'{workers} workers, MB per process')
+    print(f'{"mode":>10} {"stage":>9} {"process":>8} ' +
+          ' '.join(f'{field:>14}' for field in SMAPS_FIELDS))
+    for name, preload in [('preload', True), ('per worker', False)]:
+        stages = zip(['warmed up', 'requests'], measure(workers, preload))
+        for stage, (master_memory, workers_memory) in stages:
+            def print_row(process, memory):
+                print(f'{name:>10} {stage:>9} {process:>8} ' +
+                      ' '.join(f'{memory[field]:>14.1f}' for field in SMAPS_FIELDS))
+
+            print_row('master', master_memory)
+            print_row('worker', { field: sum(memory[field] for memory in workers_memory) / workers
+                                  for field in SMAPS_FIELDS })
+            total_pss = master_memory['Pss'] + sum(memory['Pss'] for memory in workers_memory)
+            print(f'{name:>10} {stage:>9} {"total":>8} {"Pss":>14} {total_pss:>14.1f}')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
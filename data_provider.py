@@ -1,16 +1,47 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import itertools
+import logging
+import tempfile
+import threading
+from collections import namedtuple
+import numpy as np
 import pandas as pd
-import locale as lcl
+import pyarrow.feather as feather
 
-gas_dataset_path = "data/dados-ANP-2013-2020.csv"
-cities_dataset_path = "data/dados-IBGE-municipios.csv"
-places_dataset_path = "data/brazil-places-polygons.csv"
+from instrumentation import instrumented
+from figure_cache import LRUCache
+
+# DATA_DIR points the app at another copy of the data,
+# such as the scaled datasets of the benchmarks
+data_dir_path = os.environ.get('DATA_DIR', 'data')
+gas_dataset_path = os.path.join(data_dir_path, "dados-ANP-2013-2020.csv")
+cities_dataset_path = os.path.join(data_dir_path, "dados-IBGE-municipios.csv")
+places_dataset_path = os.path.join(data_dir_path, "brazil-places-polygons.csv")
+deflator_dataset_path = os.path.join(data_dir_path, "deflator-IPCA.csv")
+releases_dir_path = os.path.join(data_dir_path, "releases")
+cache_dir_path = os.path.join(data_dir_path, "cache")
+
+# Rows of the ANP files parsed at a time, bounding the
+# memory used while loading them
+chunk_size = int(os.environ.get('DATASET_CHUNK_SIZE', 100000))
+
+# Products whose aggregate cube stays in memory, the least
+# recently requested one is evicted to load another
+product_cache_size = int(os.environ.get('PRODUCT_CACHE_SIZE', 3))
+
+# Seconds an outdated partitions directory is kept after a newer
+# one replaces it: other workers, and those forked later from a
+# preloaded master, may still read the partitions they published
+partitions_retention = float(os.environ.get('PARTITIONS_RETENTION', 24 * 3600))
+
+# Bump whenever the parsing below changes the stored dataset
+__CACHE_VERSION = 7
 
 # Import data
-__gas_data = pd.read_csv(gas_dataset_path,
-                         sep=';', encoding='cp1252',
-                         decimal=',', na_values=['-'])
-__cities_data = pd.read_csv(cities_dataset_path,
-                            sep=';', encoding='cp1252')
 __places_data = pd.read_csv(places_dataset_path, 
                             sep=',', decimal='.',
                             encoding='cp1252')
@@ -24,6 +55,7 @@ class COLUMNS:
     STATE = 'ESTADO'
     UF = 'UF'
     CITY_NAME = 'NOME MUNICIPIO'
+    CITY_ID = 'ID DO MUNICIPIO'
     GAS_STATION_COUNT = 'NÚMERO DE POSTOS PESQUISADOS'
     UNIT = 'UNIDADE DE MEDIDA'
 
@@ -44,12 +76,39 @@ class COLUMNS:
     LATITUDE = 'LATITUDE'
     LONGITUDE = 'LONGITUDE'
 
+    PLACE_TYPE = 'TIPO DO LOCAL'
+    PLACE_NAME = 'NOME DO LOCAL'
+    PLACE_ID = 'ID DO LOCAL'
+
+    YEAR = 'ANO'
+
+# Portuguese month abbreviations used by the MÊS column (e.g. 'jan/13')
+__MONTH_NUMBERS = { 'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4,
+                    'mai': 5, 'jun': 6, 'jul': 7, 'ago': 8,
+                    'set': 9, 'out': 10, 'nov': 11, 'dez': 12 }
+
+def __parse_month(month_str):
+    month, year = month_str.strip().lower().split('/')
+
+    # Same two digit year pivot as strptime's %y
+    year = int(year)
+    year += 2000 if year < 69 else 1900
+
+    return pd.Timestamp(year=year, month=__MONTH_NUMBERS[month], day=1)
+
 def __parse_dates(series):
-    default_locale_str = lcl.getlocale()[0]
-    lcl.setlocale(lcl.LC_ALL, 'pt_BR')
-    parsed_series = pd.to_datetime(series, format='%b/%y')
-    lcl.setlocale(lcl.LC_ALL, default_locale_str)
-    return parsed_series
+    '''
+    Parses the 'mmm/yy' months without changing the process
+    locale: each distinct string is parsed only once and the
+    result is broadcast through the categorical codes
+    '''
+    months = series.astype('category')
+    parsed_months = pd.DatetimeIndex([__parse_month(month)
+                                      for month in months.cat.categories])
+
+    return pd.Series(parsed_months.take(months.cat.codes,
+                                        allow_fill=True, fill_value=pd.NaT),
+                     index=series.index, name=series.name)
 
 def __normalize_city_names(series):
     '''Remove accents and upper case'''
@@ -58,24 +117,449 @@ def __normalize_city_names(series):
                  .str.decode('utf-8')\
                  .str.upper()
 
+def __normalize_distinct_names(series):
+    '''
+    Normalizes each distinct name once, returning
+    the normalized names as a categorical
+    '''
+    names = series.astype('category')
+    normalized_names = __normalize_city_names(names.cat.categories.to_series())
+    normalized_categories = pd.Index(normalized_names.unique())
+
+    codes = np.append(normalized_categories.get_indexer(normalized_names), -1)
+    return pd.Series(pd.Categorical.from_codes(codes[names.cat.codes.values],
+                                               categories=normalized_categories),
+                     index=series.index, name=series.name)
+
+def __recode(series, category_codes):
+    '''
+    Codes of the categorical series values given the code of
+    each of its categories, -1 for missing values
+    '''
+    return np.append(category_codes, -1)[series.cat.codes.values]
+
+def __category_codes(series, categories):
+    '''
+    Codes of the categorical series values in the given
+    categories, -1 for the values missing from them
+    '''
+    return __recode(series, pd.Index(categories).get_indexer(series.cat.categories))
+
+# The ANP files name the states, the IBGE table gives their UF
+__STATE_UFS = { 'ACRE': 'AC', 'ALAGOAS': 'AL', 'AMAPA': 'AP', 'AMAZONAS': 'AM',
+                'BAHIA': 'BA', 'CEARA': 'CE', 'DISTRITO FEDERAL': 'DF',
+                'ESPIRITO SANTO': 'ES', 'GOIAS': 'GO', 'MARANHAO': 'MA',
+                'MATO GROSSO': 'MT', 'MATO GROSSO DO SUL': 'MS', 'MINAS GERAIS': 'MG',
+                'PARA': 'PA', 'PARAIBA': 'PB', 'PARANA': 'PR', 'PERNAMBUCO': 'PE',
+                'PIAUI': 'PI', 'RIO DE JANEIRO': 'RJ', 'RIO GRANDE DO NORTE': 'RN',
+                'RIO GRANDE DO SUL': 'RS', 'RONDONIA': 'RO', 'RORAIMA': 'RR',
+                'SANTA CATARINA': 'SC', 'SAO PAULO': 'SP', 'SERGIPE': 'SE',
+                'TOCANTINS': 'TO' }
+__UFS = sorted(__STATE_UFS.values())
+
+def __city_keys(name_codes, uf_codes):
+    '''Integer join keys of the (name, UF) codes, -1 when either is missing'''
+    return np.where((name_codes >= 0) & (uf_codes >= 0),
+                    name_codes.astype(np.int64) * len(__UFS) + uf_codes, -1)
+
 def __merge_city_data(gas_data, cities_data):
-    city_names = cities_data['NOME MUNICIPIO']
-    cities_data['NOME MUNICIPIO'] = __normalize_city_names(city_names)
+    '''
+    Joins the IBGE city columns to the ANP rows on the
+    (normalized name, UF) codes of their city, dropping
+    and reporting the rows matching no city
+    '''
+    city_names = __normalize_distinct_names(gas_data[COLUMNS.CITY])
+    states = __normalize_distinct_names(gas_data[COLUMNS.STATE])
+    state_ufs = states.cat.categories.map(__STATE_UFS)
+
+    gas_keys = __city_keys(__category_codes(city_names, cities_data[COLUMNS.CITY_NAME].cat.categories),
+                           __recode(states, pd.Index(__UFS).get_indexer(state_ufs)))
+    city_keys = __city_keys(cities_data[COLUMNS.CITY_NAME].cat.codes.values,
+                            __category_codes(cities_data[COLUMNS.UF], __UFS))
+    city_positions = np.where(gas_keys >= 0, pd.Index(city_keys).get_indexer(gas_keys), -1)
+
+    matched = city_positions >= 0
+    if not matched.all():
+        unmatched_cities = pd.DataFrame({ COLUMNS.CITY: city_names[~matched].astype(str),
+                                          COLUMNS.STATE: states[~matched].astype(str) })\
+                             .drop_duplicates()
+        logging.warning('%d ANP rows match no IBGE city and were dropped: %s',
+                        (~matched).sum(),
+                        ', '.join(f'{city} ({state})' for city, state
+                                  in unmatched_cities.itertuples(index=False)))
+        gas_data, city_names = gas_data[matched], city_names[matched]
+        city_positions = city_positions[matched]
+
+    city_data = cities_data.drop(columns=[COLUMNS.CITY_NAME])\
+                           .take(city_positions)\
+                           .set_index(gas_data.index)
+    merged_data = pd.concat([gas_data, city_data], axis=1, copy=False)
+    merged_data[COLUMNS.CITY] = city_names
+    return merged_data
+
+def __compact_dataset(dataset):
+    '''
+    Down-casts the dataset columns: categories for the
+    repeated labels, float32 for prices and coordinates
+    and the smallest integer type for counts and codes
+    '''
+    label_columns = [COLUMNS.PRODUCT, COLUMNS.CITY, COLUMNS.CITY_ID,
+                     COLUMNS.STATE, COLUMNS.REGION, COLUMNS.UF, COLUMNS.UNIT]
+    for column in label_columns:
+        dataset[column] = dataset[column].astype('category')
+
+    float_columns = dataset.select_dtypes('float64').columns
+    dataset[float_columns] = dataset[float_columns].astype('float32')
+
+    for column in dataset.select_dtypes('int64').columns:
+        dataset[column] = pd.to_numeric(dataset[column], downcast='integer')
+
+    return dataset
+
+def __read_gas_data(path, chunk_size=None):
+    '''
+    Reads an ANP file, or an iterator over its
+    chunks when a chunk size is given
+    '''
+    gas_data = pd.read_csv(path,
+                           sep=';', encoding='cp1252',
+                           decimal=',', na_values=['-'],
+                           chunksize=chunk_size)
+    if chunk_size is None:
+        return __parse_gas_data(gas_data)
+
+    return (__parse_gas_data(gas_chunk) for gas_chunk in gas_data)
+
+def __parse_gas_data(gas_data):
+    gas_data[COLUMNS.MONTH] = __parse_dates(gas_data[COLUMNS.MONTH])
+    return gas_data
+
+def __read_cities_data():
+    '''
+    Reads the IBGE cities with their names normalized and
+    the place id of each one: the city name, followed by
+    the UF when other states have a city with the same name
+    '''
+    cities_data = pd.read_csv(cities_dataset_path,
+                              sep=';', encoding='cp1252')
+
+    city_names = __normalize_distinct_names(cities_data[COLUMNS.CITY_NAME])
+    cities_data[COLUMNS.CITY_NAME] = city_names
+    cities_data[COLUMNS.UF] = cities_data[COLUMNS.UF].astype('category')
+    cities_data = cities_data.drop_duplicates(subset=[COLUMNS.CITY_NAME, COLUMNS.UF])
+
+    homonymous = cities_data.duplicated(subset=[COLUMNS.CITY_NAME], keep=False)
+    city_ids = 'city_' + cities_data[COLUMNS.CITY_NAME].astype(str)
+    city_ids[homonymous] += ' (' + cities_data.loc[homonymous, COLUMNS.UF].astype(str) + ')'
+    cities_data[COLUMNS.CITY_ID] = city_ids.astype('category')
+
+    return cities_data.reset_index(drop=True)
+
+def __release_paths():
+    '''
+    ANP releases published after the base file, in the order
+    they are applied: name them so they sort chronologically
+    '''
+    if not os.path.isdir(releases_dir_path):
+        return []
+
+    return sorted(os.path.join(releases_dir_path, file_name)
+                  for file_name in os.listdir(releases_dir_path)
+                  if file_name.lower().endswith('.csv'))
+
+def __concat_frames(frames):
+    '''
+    Concatenates the frames keeping categorical columns
+    categorical, even when some of the frames lack them:
+    the codes of each frame are mapped to the union of the
+    categories, in the order they first appear
+    '''
+    frames = list(frames)
+    columns = list(dict.fromkeys(column for frame in frames for column in frame.columns))
+    frame_dtypes = [ frame.dtypes for frame in frames ]
+    categorical_columns = [ column for column in columns
+                            if all(pd.api.types.is_categorical_dtype(dtypes[column])
+                                   for dtypes in frame_dtypes if column in dtypes) ]
+
+    concatenated = pd.concat([ frame.drop(columns=[ column for column in categorical_columns
+                                                    if column in frame ])
+                               for frame in frames ], ignore_index=True, sort=False)
+    for column in categorical_columns:
+        values = [ frame[column].values if column in frame else None for frame in frames ]
+        categories = pd.Index(np.concatenate([ frame_values.categories.values
+                                               for frame_values in values
+                                               if frame_values is not None ])).drop_duplicates()
+        codes = [ np.full(len(frame), -1) if frame_values is None else
+                  np.append(categories.get_indexer(frame_values.categories), -1)[frame_values.codes]
+                  for frame, frame_values in zip(frames, values) ]
+        concatenated[column] = pd.Categorical.from_codes(np.concatenate(codes), categories=categories)
+
+    return concatenated[columns]
+
+def __product_month_keys(frame):
+    return pd.MultiIndex.from_arrays([frame[COLUMNS.PRODUCT].astype(str),
+                                      frame[COLUMNS.MONTH]])
+
+def __replace_months(dataset, new_data):
+    '''
+    Appends the new data to the dataset, dropping the rows
+    of the products and months the new data republishes
+    '''
+    republished = __product_month_keys(dataset).isin(__product_month_keys(new_data))
+    return __concat_frames([dataset[~republished], new_data])
+
+def __read_source_data():
+    gas_data = __read_gas_data(gas_dataset_path)
+    for release_path in __release_paths():
+        gas_data = __replace_months(gas_data, __read_gas_data(release_path))
+
+    return __merge_city_data(gas_data, __read_cities_data())
+
+def __superseded_product_months(gas_paths):
+    '''
+    For each ANP file, the products and months republished
+    by the files applied after it (None for the last one)
+    '''
+    superseded = [None]
+    for path in reversed(gas_paths[1:]):
+        keys = __product_month_keys(pd.read_csv(path,
+                                                sep=';', encoding='cp1252',
+                                                usecols=[COLUMNS.MONTH, COLUMNS.PRODUCT])\
+                                    .pipe(__parse_gas_data))
+        superseded.insert(0, keys if superseded[0] is None else keys.union(superseded[0]))
+
+    return superseded
+
+# Compacted city rows take about a sixth of the memory of the
+# CSV rows parsed with them, so this many chunks of them are
+# buffered before they are written to disk
+__SPILL_CHUNKS = 5
 
-    # Remove duplicated city names
-    unique_cities_data = cities_data.drop_duplicates(subset=[COLUMNS.CITY_NAME])
+def __load_source_data_in_chunks(chunk_size, spill_path):
+    '''
+    Parses the ANP files chunk by chunk: each chunk is merged
+    with the cities, compacted, added to the metadata and folded
+    into the state and region aggregates before the next one is
+    read, so only chunk_size raw CSV rows are in memory at any
+    time. Its city rows are buffered, and written to spill_path
+    by product and year when the buffer is full. Returns the
+    metadata and the partitions, assembled one at a time as
+    they are iterated
+    '''
+    cities_data = __read_cities_data()
+    gas_paths = [gas_dataset_path] + __release_paths()
+    os.makedirs(spill_path)
 
-    return pd.merge(gas_data,            unique_cities_data,
-                    left_on='MUNICÍPIO', right_on='NOME MUNICIPIO',
-                    how='inner')
+    metadata = None
+    partials = []
+    buffered = []
+    pieces = {}
+    piece_numbers = itertools.count()
 
+    def spill_buffered():
+        # Pickled without their unused categories, the pieces are
+        # written and read several times faster than Feather files
+        for key, city_rows in __split_partitions(__concat_frames(buffered)).items():
+            piece_path = os.path.join(spill_path, f'{next(piece_numbers)}.pickle')
+            city_rows.assign(**{ column: city_rows[column].cat.remove_unused_categories()
+                                 for column in city_rows.select_dtypes('category').columns })\
+                     .to_pickle(piece_path)
+            pieces.setdefault(key, []).append(piece_path)
+        buffered.clear()
 
-__gas_data[COLUMNS.MONTH] = __parse_dates(__gas_data[COLUMNS.MONTH])
-__df = __merge_city_data(__gas_data, __cities_data)
+    for path, superseded in zip(gas_paths, __superseded_product_months(gas_paths)):
+        for gas_chunk in __read_gas_data(path, chunk_size):
+            if superseded is not None:
+                gas_chunk = gas_chunk[~__product_month_keys(gas_chunk).isin(superseded)]
+
+            chunk = __compact_dataset(__merge_city_data(gas_chunk, cities_data))
+            chunk_metadata = __build_metadata(chunk)
+            metadata = (chunk_metadata if metadata is None else
+                        __merge_metadata(metadata, chunk_metadata))
+            partials.append(__aggregate_partials(chunk))
+
+            buffered.append(__city_rows(chunk))
+            if sum(map(len, buffered)) >= __SPILL_CHUNKS * chunk_size:
+                spill_buffered()
+
+    # The last buffered rows are not spilled
+    if buffered:
+        for key, city_rows in __split_partitions(__concat_frames(buffered)).items():
+            pieces.setdefault(key, []).append(city_rows)
+        buffered.clear()
+
+    return metadata, __assemble_partitions(pieces, partials)
+
+def __assemble_partitions(pieces, partials):
+    '''
+    Yields each partition, sorted by product and year, from
+    the pieces of its city rows, spilled or still in memory,
+    and its state and region rows
+    '''
+    parent_rows = __split_partitions(__concat_frames([__state_rows(partials),
+                                                      __region_rows(partials)]))
+    for key in sorted(set(pieces) | set(parent_rows)):
+        city_rows = [ pd.read_pickle(piece) if isinstance(piece, str) else piece
+                      for piece in pieces.pop(key, []) ]
+        yield key, __concat_frames(city_rows + ([parent_rows.pop(key)] if key in parent_rows else []))
+
+def __source_paths():
+    return [gas_dataset_path, cities_dataset_path] + __release_paths()
+
+def __partitions_dir_path(source_paths):
+    '''
+    Directory of the partitioned aggregate data, named
+    after a hash of the source files contents
+    '''
+    digest = hashlib.sha1(str(__CACHE_VERSION).encode())
+    for path in source_paths:
+        with open(path, 'rb') as source_file:
+            for block in iter(lambda: source_file.read(1 << 20), b''):
+                digest.update(block)
+
+    return os.path.join(cache_dir_path, f'partitions-{digest.hexdigest()}')
+
+__METADATA_FILE_NAME = 'metadata.json'
+# Created in a partitions directory when a newer one replaces it
+__SUPERSEDED_FILE_NAME = 'superseded'
+
+def __split_partitions(aggregate_data):
+    '''Splits the aggregate rows by product and year'''
+    years = aggregate_data[COLUMNS.MONTH].dt.year
+    partition_groups = aggregate_data.groupby([aggregate_data[COLUMNS.PRODUCT], years],
+                                              observed=True, sort=False)
+
+    return { (str(product), int(year)): partition.reset_index(drop=True)
+             for (product, year), partition in partition_groups }
+
+def __write_partitions(partitions_path, metadata, partitions):
+    '''
+    Writes each ((product, year), partition) pair to a feather
+    file and the metadata listing them, returning the paths of
+    the partitions. Partitions already in a file are linked,
+    not rewritten, and the others are written as they are
+    iterated, so they can be assembled one at a time
+    '''
+    os.makedirs(os.path.dirname(partitions_path), exist_ok=True)
+
+    # Written to a temporary directory first so concurrent
+    # workers never read a partially written one
+    temporary_path = f'{partitions_path}.{os.getpid()}.tmp'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+
+    metadata = dict(metadata, partitions=[])
+    try:
+        for (product, year), partition in partitions:
+            file_name = f'product-{metadata["products"].index(product)}-{year}.feather'
+            file_path = os.path.join(temporary_path, file_name)
+            if isinstance(partition, str):
+                try:
+                    os.link(partition, file_path)
+                except OSError:
+                    shutil.copyfile(partition, file_path)
+            else:
+                partition.to_feather(file_path)
+            metadata['partitions'].append({ 'product': product, 'year': year, 'file': file_name })
+
+        with open(os.path.join(temporary_path, __METADATA_FILE_NAME), 'w') as metadata_file:
+            json.dump(metadata, metadata_file)
+    except OSError:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        raise
+
+    try:
+        os.rename(temporary_path, partitions_path)
+    except OSError:
+        # Another worker wrote the same partitions first
+        shutil.rmtree(temporary_path, ignore_errors=True)
+
+    __remove_superseded_partitions(partitions_path)
+    return __read_partition_paths(partitions_path)[1]
+
+def __unmark_superseded(partitions_path):
+    '''Keeps partitions current again, when the sources went back to them'''
+    try:
+        os.remove(os.path.join(partitions_path, __SUPERSEDED_FILE_NAME))
+    except OSError:
+        pass
+
+def __remove_superseded_partitions(partitions_path):
+    '''
+    Marks the other partitions directories as superseded and
+    removes those superseded for longer than the retention:
+    the processes that published them have had that long to
+    ingest the releases, or to reload the partitions
+    '''
+    __unmark_superseded(partitions_path)
+    partitions_dir_path = os.path.dirname(partitions_path)
+    for file_name in os.listdir(partitions_dir_path):
+        stale_path = os.path.join(partitions_dir_path, file_name)
+        try:
+            if (file_name.startswith('partitions-') and not file_name.endswith('.tmp') and
+                    stale_path != partitions_path):
+                superseded_path = os.path.join(stale_path, __SUPERSEDED_FILE_NAME)
+                if not os.path.exists(superseded_path):
+                    open(superseded_path, 'w').close()
+                elif time.time() - os.path.getmtime(superseded_path) > partitions_retention:
+                    shutil.rmtree(stale_path, ignore_errors=True)
+            elif file_name.endswith('.feather'):
+                os.remove(stale_path) # Caches of the unpartitioned dataset
+        except OSError:
+            pass # Removed by another worker meanwhile
+
+def __read_partition_paths(partitions_path):
+    '''The metadata of the partitions directory and the path of each partition'''
+    with open(os.path.join(partitions_path, __METADATA_FILE_NAME)) as metadata_file:
+        metadata = json.load(metadata_file)
+
+    return metadata, { (entry['product'], entry['year']): os.path.join(partitions_path, entry['file'])
+                       for entry in metadata['partitions'] }
+
+def __load_partitions():
+    '''
+    Returns the metadata of the aggregate data and where each
+    of its partitions is: only the metadata is read from the
+    cache, the source CSV files are parsed when they changed
+    '''
+    partitions_path = __partitions_dir_path(__source_paths())
+    if os.path.exists(os.path.join(partitions_path, __METADATA_FILE_NAME)):
+        __unmark_superseded(partitions_path)
+        return __read_partition_paths(partitions_path)
+
+    try:
+        os.makedirs(cache_dir_path, exist_ok=True)
+        writable = os.access(cache_dir_path, os.W_OK)
+    except OSError:
+        writable = False
+    if not writable:
+        # Read-only deploys write the partitions to a temporary directory
+        partitions_path = os.path.join(tempfile.mkdtemp(), os.path.basename(partitions_path))
+
+    spill_path = f'{partitions_path}.{os.getpid()}.spill.tmp'
+    try:
+        metadata, partitions = __load_source_data_in_chunks(chunk_size, spill_path)
+        return metadata, __write_partitions(partitions_path, metadata, partitions)
+    finally:
+        shutil.rmtree(spill_path, ignore_errors=True)
+
+def __read_deflator():
+    '''
+    The IPCA price index by month, when its file is in the data
+    directory, with MÊS (YYYY-MM) and NÚMERO ÍNDICE columns
+    '''
+    if not os.path.exists(deflator_dataset_path):
+        return None
+
+    deflator_data = pd.read_csv(deflator_dataset_path,
+                                sep=';', encoding='cp1252', decimal=',')
+    price_indexes = pd.Series(deflator_data['NÚMERO ÍNDICE'].astype(np.float64).values,
+                              index=pd.to_datetime(deflator_data[COLUMNS.MONTH], format='%Y-%m'))
+    return price_indexes.dropna().sort_index()
+
+# Deflates the prices when available, never estimated
+DEFLATOR = __read_deflator()
 
-DATASET = __df
-PRODUCTS = list(__df[COLUMNS.PRODUCT].unique())
-YEARS = list(__df[COLUMNS.MONTH].dt.year.unique())
 PRODUCT_UNITS = {
     "ÓLEO DIESEL" : "(R$/L)",
     "ÓLEO DIESEL S10" : "(R$/L)",
@@ -85,74 +569,711 @@ PRODUCT_UNITS = {
     "GNV" : "(R$/m^3)"
 }
 
-REGIONS = list(__df[COLUMNS.REGION].unique())
-STATES = list(__df[COLUMNS.STATE].unique())
-CITIES_UF = list((__df[COLUMNS.CITY] + ' (' + __df[COLUMNS.UF] + ')').dropna().unique())
-
 def remove_uf(city_name):
     return ' '.join(city_name.split()[:-1])
 
 def remove_region_prefix(city_name):
     return ' '.join(city_name.split()[1:])
 
-def __generate_places_dict():
+def __list_city_places(dataset):
+    '''Maps the place id of each city to its "NAME (UF)" name'''
+    cities_data = dataset[[COLUMNS.CITY_ID, COLUMNS.CITY, COLUMNS.UF]].dropna().drop_duplicates()
+    return dict(zip(cities_data[COLUMNS.CITY_ID].astype(str),
+                    cities_data[COLUMNS.CITY].astype(str) + ' (' +
+                    cities_data[COLUMNS.UF].astype(str) + ')'))
 
-    regions = { f'region_{name}': f'REGIAO {name}' for name in REGIONS }
-    states = { f'state_{name}': name for name in STATES }
-    cities = { f'city_{remove_uf(name_uf)}': name_uf for name_uf in CITIES_UF }
+def __generate_places_dict(regions, states, city_places):
+
+    regions = { f'region_{name}': f'REGIAO {name}' for name in regions }
+    states = { f'state_{name}': name for name in states }
+    cities = dict(city_places)
 
     return { **regions, **states, **cities }
 
-PLACES_DICT = __generate_places_dict()
+# Measures averaged over the cities of a state or region
+__MEAN_COLUMNS = [ COLUMNS.MARKET_MARGIN,
+                   COLUMNS.DIST_PRICE_MEAN,
+                   COLUMNS.DIST_PRICE_STD, # ?
+                   COLUMNS.DIST_PRICE_VAR_COEF, # ?
+                   COLUMNS.LATITUDE, # ?
+                   COLUMNS.LONGITUDE, # ?
+                   ]
 
-def generate_aggregate_data(dataset):
-    COLUMNS.PLACE_TYPE = 'TIPO DO LOCAL'
-    COLUMNS.PLACE_NAME = 'NOME DO LOCAL'
-
-    dataset[COLUMNS.PLACE_TYPE] = 'CIDADE'
-    dataset[COLUMNS.PLACE_NAME] = dataset[COLUMNS.CITY]\
-                                  .apply(lambda name: PLACES_DICT['city_' + name])
-
-    column_aggregations = { COLUMNS.GAS_STATION_COUNT: 'sum',
-                            COLUMNS.MARKET_PRICE_MEAN: 'mean',
-                            COLUMNS.MARKET_PRICE_STD: 'mean', # ?
-                            COLUMNS.MARKET_PRICE_MIN: 'min',
-                            COLUMNS.MARKET_PRICE_MAX: 'max',
-                            COLUMNS.MARKET_PRICE_VAR_COEF: 'mean', # ?
-                            COLUMNS.MARKET_MARGIN: 'mean',
-                            COLUMNS.DIST_PRICE_MEAN: 'mean',
-                            COLUMNS.DIST_PRICE_STD: 'mean', # ?
-                            COLUMNS.DIST_PRICE_MIN: 'min',
-                            COLUMNS.DIST_PRICE_MAX: 'max',
-                            COLUMNS.DIST_PRICE_VAR_COEF: 'mean', # ?
-                            COLUMNS.LATITUDE: 'mean', # ?
-                            COLUMNS.LONGITUDE: 'mean', # ?
-                            }
-
-    def group_and_aggregate(columns):
-        return dataset.groupby(columns)\
-                      .agg(column_aggregations)\
-                      .reset_index()
-
-    states_data = group_and_aggregate([COLUMNS.STATE,
-                                       COLUMNS.MONTH])
+# The market prices of a state or region pool the prices of its
+# gas stations: sufficient statistics of the city rows, weighted
+# by their station counts, give the mean, standard deviation and
+# coefficient of variation of all the stations
+__POOLED_STATISTICS = ['weight', 'weighted_sum', 'weighted_squares', 'deviations']
+
+# How the partial aggregates of each measure are computed from
+# the city rows and then combined across chunks of the dataset
+__PARTIAL_AGGREGATIONS = { COLUMNS.GAS_STATION_COUNT: { 'sum': 'sum' },
+                           COLUMNS.MARKET_PRICE_MIN: { 'min': 'min' },
+                           COLUMNS.MARKET_PRICE_MAX: { 'max': 'max' },
+                           COLUMNS.DIST_PRICE_MIN: { 'min': 'min' },
+                           COLUMNS.DIST_PRICE_MAX: { 'max': 'max' },
+                           COLUMNS.MARKET_PRICE_MEAN: { statistic: 'sum'
+                                                        for statistic in __POOLED_STATISTICS[:2] },
+                           COLUMNS.MARKET_PRICE_STD: { statistic: 'sum'
+                                                       for statistic in __POOLED_STATISTICS },
+                           **{ column: { 'sum': 'sum', 'count': 'sum' }
+                               for column in __MEAN_COLUMNS } }
+
+# NaN skipping reductions of the minimums and maximums
+__REDUCTIONS = { 'min': np.fmin, 'max': np.fmax }
+
+def __partial_terms(dataset):
+    '''
+    The term of each city row in each partial aggregate,
+    as float64 arrays: missing values add nothing
+    '''
+    def values(column):
+        return dataset[column].to_numpy(dtype='float64')
+
+    station_counts = values(COLUMNS.GAS_STATION_COUNT)
+    prices = values(COLUMNS.MARKET_PRICE_MEAN)
+    price_deviations = values(COLUMNS.MARKET_PRICE_STD)
+    priced = ~np.isnan(prices)
+    spread = priced & ~np.isnan(price_deviations)
+
+    terms = { (COLUMNS.GAS_STATION_COUNT, 'sum'): station_counts }
+    for column in [COLUMNS.MARKET_PRICE_MIN, COLUMNS.DIST_PRICE_MIN]:
+        terms[(column, 'min')] = values(column)
+    for column in [COLUMNS.MARKET_PRICE_MAX, COLUMNS.DIST_PRICE_MAX]:
+        terms[(column, 'max')] = values(column)
+    for column in __MEAN_COLUMNS:
+        column_values = values(column)
+        counted = ~np.isnan(column_values)
+        terms[(column, 'sum')] = np.where(counted, column_values, 0)
+        terms[(column, 'count')] = counted.astype('float64')
+
+    for column, rows in [(COLUMNS.MARKET_PRICE_MEAN, priced),
+                         (COLUMNS.MARKET_PRICE_STD, spread)]:
+        terms[(column, 'weight')] = np.where(rows, station_counts, 0)
+        terms[(column, 'weighted_sum')] = np.where(rows, station_counts * prices, 0)
+    terms[(COLUMNS.MARKET_PRICE_STD, 'weighted_squares')] = \
+        np.where(spread, station_counts * prices ** 2, 0)
+    terms[(COLUMNS.MARKET_PRICE_STD, 'deviations')] = \
+        np.where(spread, (station_counts - 1) * price_deviations ** 2, 0)
+
+    return terms
+
+def __factorize(values):
+    '''
+    Codes and sorted uniques of the values: the codes and
+    categories of a categorical column, which need no hashing
+    '''
+    if values.dtype.name == 'category':
+        return (values.cat.codes.to_numpy(),
+                pd.Categorical.from_codes(np.arange(len(values.cat.categories)),
+                                          dtype=values.dtype))
+
+    return pd.factorize(values, sort=True)
+
+def __group_rows(key_codes, key_shape):
+    '''
+    Integer key of the group of each row, from the codes of its
+    key columns, the order of the rows sorted by key, the start
+    of each group in that order and the key of each group
+    '''
+    key_space = int(np.prod(key_shape))
+
+    # Keys of up to 16 bits are radix sorted, in linear time
+    keys = np.ravel_multi_index(key_codes, key_shape)
+    keys = keys.astype(np.min_scalar_type(max(key_space - 1, 0)))
+    key_order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[key_order]
+    group_starts = np.flatnonzero(np.diff(sorted_keys, prepend=-1))
+    return keys, key_space, key_order, group_starts, sorted_keys[group_starts]
+
+def __combine_groups(terms, keys, key_space, key_order, group_starts, group_keys):
+    '''
+    Combines the terms of each partial aggregate over the groups:
+    the sums are counted per key and the minimums and maximums
+    are reduced over the group slices of the rows sorted by key
+    '''
+    combined = {}
+    for column, aggregations in __PARTIAL_AGGREGATIONS.items():
+        for aggregation, combination in aggregations.items():
+            term = terms[(column, aggregation)]
+            if combination == 'sum':
+                combined[(column, aggregation)] = np.bincount(keys, weights=term,
+                                                              minlength=key_space)[group_keys]
+            elif len(keys):
+                combined[(column, aggregation)] = __REDUCTIONS[combination]\
+                    .reduceat(term[key_order], group_starts)
+            else:
+                combined[(column, aggregation)] = np.empty(0)
+
+    return combined
+
+def __aggregate_partials(dataset):
+    '''
+    Sums, counts, weighted sums, minimums and maximums of the
+    measures per state, product and month, indexed by region
+    too: the partial aggregates of different chunks, or of the
+    states of a region, can be combined before the means are
+    computed
+    '''
+    key_columns = [COLUMNS.STATE, COLUMNS.PRODUCT, COLUMNS.MONTH]
+    keyed = dataset[key_columns].notna().all(axis=1)
+    if not keyed.all():
+        dataset = dataset[keyed]
+
+    key_codes, key_uniques = zip(*[ __factorize(dataset[column]) for column in key_columns ])
+    key_shape = [ len(uniques) for uniques in key_uniques ]
+    groups = __group_rows(key_codes, key_shape)
+    _, _, key_order, group_starts, group_keys = groups
+    partials = __combine_groups(__partial_terms(dataset), *groups)
+
+    # A state is in a single region, the one of its first row
+    group_codes = np.unravel_index(group_keys, key_shape)
+    regions = dataset[COLUMNS.REGION].iloc[key_order[group_starts]].values
+    index = pd.MultiIndex.from_arrays([regions] +
+                                      [ uniques.take(codes)
+                                        for uniques, codes in zip(key_uniques, group_codes) ],
+                                      names=[COLUMNS.REGION] + key_columns)
+    return pd.DataFrame(partials, index=index, columns=pd.MultiIndex.from_tuples(partials))
+
+def __pooled_price_statistics(combined):
+    '''
+    Station weighted mean, pooled standard deviation and
+    coefficient of variation of the market prices: the
+    within-city deviations plus the spread of the city means
+    '''
+    def statistic(column, name):
+        return combined[(column, name)]
+
+    weights = statistic(COLUMNS.MARKET_PRICE_STD, 'weight')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        price_means = (statistic(COLUMNS.MARKET_PRICE_MEAN, 'weighted_sum') /
+                       statistic(COLUMNS.MARKET_PRICE_MEAN, 'weight'))
+        spread_means = statistic(COLUMNS.MARKET_PRICE_STD, 'weighted_sum') / weights
+        squared_deviations = (statistic(COLUMNS.MARKET_PRICE_STD, 'deviations') +
+                              statistic(COLUMNS.MARKET_PRICE_STD, 'weighted_squares') -
+                              statistic(COLUMNS.MARKET_PRICE_STD, 'weighted_sum') * spread_means)
+        price_deviations = np.sqrt(np.maximum(squared_deviations, 0) /
+                                   np.where(weights > 1, weights - 1, np.nan))
+
+        return price_means, price_deviations, price_deviations / spread_means
+
+def __finalize_partials(partials, place_column):
+    '''
+    Combines the partial aggregates of every chunk into
+    one row per place (state or region), product and month
+    '''
+    combined = pd.concat(partials) if len(partials) > 1 else partials[0]
+    key_levels = [ combined.index.names.index(level)
+                   for level in [place_column, COLUMNS.PRODUCT, COLUMNS.MONTH] ]
+    key_codes = [ combined.index.codes[level] for level in key_levels ]
+    columns = { (column, aggregation): combined[(column, aggregation)].to_numpy()
+                for column, aggregations in __PARTIAL_AGGREGATIONS.items()
+                for aggregation in aggregations }
+
+    # The states of a single partial are already one per group
+    if len(partials) > 1 or place_column != COLUMNS.STATE:
+        keyed = np.all([ codes >= 0 for codes in key_codes ], axis=0)
+        if not keyed.all():
+            key_codes = [ codes[keyed] for codes in key_codes ]
+            columns = { key: values[keyed] for key, values in columns.items() }
+
+        key_shape = [ len(combined.index.levels[level]) for level in key_levels ]
+        groups = __group_rows(key_codes, key_shape)
+        columns = __combine_groups(columns, *groups)
+        key_codes = np.unravel_index(groups[-1], key_shape)
+
+    aggregate_data = { name: combined.index.levels[level].take(codes)
+                       for name, level, codes in zip([place_column, COLUMNS.PRODUCT, COLUMNS.MONTH],
+                                                     key_levels, key_codes) }
+    aggregate_data[COLUMNS.GAS_STATION_COUNT] = \
+        columns[(COLUMNS.GAS_STATION_COUNT, 'sum')].astype('int64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column, aggregations in __PARTIAL_AGGREGATIONS.items():
+            if 'count' in aggregations:
+                aggregate_data[column] = (columns[(column, 'sum')] /
+                                          columns[(column, 'count')]).astype('float32')
+            elif 'min' in aggregations or 'max' in aggregations:
+                aggregate_data[column] = columns[(column, next(iter(aggregations)))]\
+                                         .astype('float32')
+
+    price_columns = [COLUMNS.MARKET_PRICE_MEAN, COLUMNS.MARKET_PRICE_STD,
+                     COLUMNS.MARKET_PRICE_VAR_COEF]
+    for column, values in zip(price_columns, __pooled_price_statistics(columns)):
+        aggregate_data[column] = values.astype('float32')
+
+    return pd.DataFrame(aggregate_data)
+
+__PLACE_COLUMNS = [COLUMNS.PLACE_TYPE, COLUMNS.PLACE_NAME, COLUMNS.PLACE_ID]
+
+def __city_rows(dataset):
+    city_ids = dataset[COLUMNS.CITY_ID].cat.remove_unused_categories()
+
+    # Mapping the categories keeps the place labels categorical
+    return dataset.assign(**{
+        COLUMNS.PLACE_TYPE: pd.Series('CIDADE', index=dataset.index, dtype='category'),
+        COLUMNS.PLACE_NAME: city_ids.map(__list_city_places(dataset)),
+        COLUMNS.PLACE_ID: city_ids,
+    })
+
+def __state_rows(partials):
+    states_data = __finalize_partials(partials, COLUMNS.STATE)
     states_data[COLUMNS.PLACE_TYPE] = 'ESTADO'
-    states_data[COLUMNS.PLACE_NAME] = states_data[COLUMNS.STATE]\
-                                    .apply(lambda name: PLACES_DICT['state_' + name])
+    states_data[COLUMNS.PLACE_NAME] = states_data[COLUMNS.STATE].astype(str)
+    states_data[COLUMNS.PLACE_ID] = 'state_' + states_data[COLUMNS.PLACE_NAME]
+    return states_data.astype({ column: 'category'
+                                for column in [COLUMNS.STATE] + __PLACE_COLUMNS })
 
-    regions_data = group_and_aggregate([COLUMNS.REGION,
-                                       COLUMNS.MONTH])
+def __region_rows(partials):
+    regions_data = __finalize_partials(partials, COLUMNS.REGION)
     regions_data[COLUMNS.PLACE_TYPE] = 'REGIAO'
-    regions_data[COLUMNS.PLACE_NAME] = regions_data[COLUMNS.REGION]\
-                                    .apply(lambda name: PLACES_DICT['region_' + name])
+    regions_data[COLUMNS.PLACE_NAME] = 'REGIAO ' + regions_data[COLUMNS.REGION].astype(str)
+    regions_data[COLUMNS.PLACE_ID] = 'region_' + regions_data[COLUMNS.REGION].astype(str)
+    return regions_data.astype({ column: 'category'
+                                 for column in [COLUMNS.REGION] + __PLACE_COLUMNS })
+
+@instrumented('generate_aggregate_data')
+def generate_aggregate_data(dataset):
+    '''
+    Returns the city rows of the dataset together with
+    the state and region rows aggregated from them,
+    one row per place, product and month
+    '''
+    partials = __aggregate_partials(dataset)
+    return __concat_frames([
+        __city_rows(dataset),
+        __state_rows([partials]),
+        __region_rows([partials]),
+    ])
+
+def __build_place_index(aggregate_data):
+    '''
+    Maps each (product, place id) to the start and stop
+    positions of its rows, which must be contiguous and
+    sorted by month in the aggregate data
+    '''
+    groups = aggregate_data.groupby([COLUMNS.PRODUCT, COLUMNS.PLACE_ID],
+                                    observed=True, sort=False)
+
+    return { key: (positions[0], positions[-1] + 1)
+             for key, positions in groups.indices.items() }
+
+def __build_place_parents(dataset):
+    '''
+    Maps each place id to the ids of the state
+    and region it is in (none for regions)
+    '''
+    places = dataset[[COLUMNS.CITY_ID, COLUMNS.STATE, COLUMNS.REGION]]\
+             .drop_duplicates().astype(str)
+
+    place_parents = {}
+    for city_id, state, region in places.itertuples(index=False):
+        place_parents[city_id] = (f'state_{state}', f'region_{region}')
+        place_parents[f'state_{state}'] = (f'region_{region}',)
+        place_parents[f'region_{region}'] = ()
+
+    return place_parents
+
+# Yearly means of the measures of the bar charts, sorted
+# by product, place and year like the aggregate cube
+YearlyRollup = namedtuple('YearlyRollup', ['data', 'years', 'place_index'])
+
+__ROLLUP_COLUMNS = [ COLUMNS.MARKET_PRICE_STD, COLUMNS.MARKET_PRICE_VAR_COEF ]
+
+def __build_yearly_rollup(aggregate_data):
+    years = aggregate_data[COLUMNS.MONTH].dt.year.rename(COLUMNS.YEAR)
+    year_groups = aggregate_data.groupby([aggregate_data[COLUMNS.PRODUCT],
+                                          aggregate_data[COLUMNS.PLACE_ID],
+                                          years], observed=True, sort=True)
+
+    rollup_data = year_groups[__ROLLUP_COLUMNS].mean().reset_index()
+    # Each place has one name, mapped instead of taking the first
+    # of each group, which pandas does in Python for categories
+    place_names = aggregate_data.drop_duplicates(COLUMNS.PLACE_ID)\
+                                .set_index(COLUMNS.PLACE_ID)[COLUMNS.PLACE_NAME]
+    rollup_data[COLUMNS.PLACE_NAME] = rollup_data[COLUMNS.PLACE_ID].map(place_names)
+
+    rollup_years = rollup_data[COLUMNS.YEAR].values
+    # The charts color the bars by the year as a label
+    rollup_data[COLUMNS.YEAR] = rollup_data[COLUMNS.YEAR].astype(str).astype('category')
+
+    return YearlyRollup(data=rollup_data,
+                        years=rollup_years,
+                        place_index=__build_place_index(rollup_data))
+
+# Aggregate data sorted by product, place and month
+# along with the arrays used to slice it per request
+AggregateCube = namedtuple('AggregateCube', ['data', 'months', 'place_index',
+                                             'station_counts', 'price_sums', 'price_counts',
+                                             'yearly_rollup', 'price_matrix'])
+
+# Monthly measures of each place of a product as dense (place x month)
+# matrices over every month, NaN where the place has no row
+PriceMatrix = namedtuple('PriceMatrix', ['place_rows', 'months', 'values'])
+
+__MATRIX_COLUMNS = [ COLUMNS.MARKET_PRICE_MEAN, COLUMNS.MARKET_MARGIN ]
+
+def __build_price_matrix(aggregate_data, place_index):
+    month_numbers = aggregate_data[COLUMNS.MONTH].values.astype('datetime64[M]').astype(np.int64)
+    first_month = month_numbers.min() if len(month_numbers) else 0
+    months = np.arange(first_month, month_numbers.max() + 1 if len(month_numbers) else 0)\
+               .astype('datetime64[M]').astype('datetime64[ns]')
+
+    place_rows = {}
+    rows = np.empty(len(aggregate_data), dtype=np.int64)
+    for row, ((_, place_id), (start, stop)) in enumerate(place_index.items()):
+        place_rows[place_id] = row
+        rows[start:stop] = row
+
+    values = {}
+    for column in __MATRIX_COLUMNS:
+        values[column] = np.full((len(place_rows), len(months)), np.nan)
+        values[column][rows, month_numbers - first_month] = aggregate_data[column].values
+
+    return PriceMatrix(place_rows=place_rows, months=months, values=values)
+
+def __cumulative_sums(values):
+    return np.concatenate([[0], np.cumsum(values)])
+
+def __build_aggregate_cube(aggregate_data):
+    aggregate_data = aggregate_data.sort_values([COLUMNS.PRODUCT,
+                                                 COLUMNS.PLACE_ID,
+                                                 COLUMNS.MONTH],
+                                                ignore_index=True)
+    station_counts = aggregate_data[COLUMNS.GAS_STATION_COUNT].fillna(0).values
+    market_prices = aggregate_data[COLUMNS.MARKET_PRICE_MEAN].astype(np.float64)
+
+    place_index = __build_place_index(aggregate_data)
+
+    return AggregateCube(data=aggregate_data,
+                         months=aggregate_data[COLUMNS.MONTH].values,
+                         place_index=place_index,
+                         station_counts=__cumulative_sums(station_counts),
+                         price_sums=__cumulative_sums(market_prices.fillna(0).values),
+                         price_counts=__cumulative_sums(market_prices.notna().values),
+                         yearly_rollup=__build_yearly_rollup(aggregate_data),
+                         price_matrix=__build_price_matrix(aggregate_data, place_index))
+
+def __build_metadata(dataset):
+    '''
+    The products, years and places of the dataset, which
+    fill the filter options without loading the partitions
+    '''
+    last_month = dataset[COLUMNS.MONTH].max()
+    return { 'products': [ str(product) for product in dataset[COLUMNS.PRODUCT].unique() ],
+             'years': sorted(int(year) for year in dataset[COLUMNS.MONTH].dt.year.unique()),
+             'last_month': None if pd.isna(last_month) else last_month.strftime('%Y-%m'),
+             'regions': [ str(region) for region in dataset[COLUMNS.REGION].dropna().unique() ],
+             'states': [ str(state) for state in dataset[COLUMNS.STATE].dropna().unique() ],
+             'city_places': __list_city_places(dataset),
+             'place_parents': { place_id: list(parents) for place_id, parents
+                                in __build_place_parents(dataset).items() } }
+
+def __merge_metadata(metadata, new_metadata):
+    '''The metadata of a dataset extended with the rows of another one'''
+    return { **{ key: list(dict.fromkeys(metadata[key] + new_metadata[key]))
+                 for key in ['products', 'regions', 'states'] },
+             'years': sorted(set(metadata['years'] + new_metadata['years'])),
+             'last_month': max(filter(None, [metadata['last_month'], new_metadata['last_month']]),
+                               default=None),
+             'city_places': { **metadata['city_places'], **new_metadata['city_places'] },
+             'place_parents': { **metadata['place_parents'], **new_metadata['place_parents'] } }
+
+# The metadata, partitions and places of the published
+# dataset, swapped as a whole when a release is ingested
+PartitionedData = namedtuple('PartitionedData', ['version', 'metadata', 'partitions',
+                                                 'places_dict', 'place_parents'])
+
+__dataset_versions = itertools.count(1)
+
+def __publish_partitions(metadata, partitions):
+    '''
+    Publishes the dataset as one snapshot, swapped with a single
+    assignment: readers of get_dataset() never see parts of two
+    datasets. The filter option attributes are reassigned after
+    it one by one, so reading several of them while a release
+    is ingested may mix the two
+    '''
+    global PRODUCTS, YEARS, REGIONS, STATES, CITIES_UF
+    global PLACES_DICT, PLACE_PARENTS
+    global __partitioned_data
 
-    return dataset.append(states_data)\
-                  .append(regions_data)
+    city_places = metadata['city_places']
+    __partitioned_data = PartitionedData(
+        version=next(__dataset_versions),
+        metadata=metadata,
+        partitions=partitions,
+        places_dict=__generate_places_dict(metadata['regions'], metadata['states'], city_places),
+        place_parents=metadata['place_parents'])
+
+    PRODUCTS, YEARS = list(metadata['products']), list(metadata['years'])
+    REGIONS, STATES = list(metadata['regions']), list(metadata['states'])
+    CITIES_UF = list(city_places.values())
+    PLACES_DICT = __partitioned_data.places_dict
+    PLACE_PARENTS = __partitioned_data.place_parents
+
+def get_dataset():
+    '''The snapshot of the published dataset'''
+    return __partitioned_data
+
+def get_dataset_version():
+    '''Incremented every time a new dataset is published'''
+    return __partitioned_data.version
+
+def __read_partition(partition):
+    if isinstance(partition, str):
+        return feather.read_table(partition, memory_map=True).to_pandas()
+
+    return partition
+
+# The aggregate cube of each product is computed from its
+# partitions the first time the product is requested, so
+# requests only need to slice it
+__product_cubes = LRUCache(max_size=product_cache_size)
+
+def __product_cube(product):
+    partitioned_data = __partitioned_data
+    partitions = partitioned_data.partitions
+
+    product_partitions = [ partition for (partition_product, _), partition
+                           in sorted(partitions.items()) if partition_product == product ]
+    if not product_partitions:
+        # The place index of another product has no rows of an
+        # unknown one, so its selections are empty as expected
+        return __product_cube(partitioned_data.metadata['products'][0])
+
+    def build():
+        try:
+            aggregate_data = __concat_frames(__read_partition(partition)
+                                             for partition in product_partitions)
+        except FileNotFoundError:
+            # Another worker ingested a release and replaced the
+            # partitions, the sources now describe the new ones
+            __publish_partitions(*__load_partitions())
+            return __product_cube(product)
+
+        return __build_aggregate_cube(aggregate_data)
+
+    return __product_cubes.get_or_build((partitioned_data.version, product), build)
+
+def load_products(products):
+    '''Loads the cubes of the products before they are requested'''
+    for product in products:
+        __product_cube(product)
+
+def read_aggregate_data():
+    '''Reads every partition of the aggregate data at once'''
+    return __concat_frames(__read_partition(partition) for _, partition
+                           in sorted(__partitioned_data.partitions.items()))
+
+def read_dataset():
+    '''Reads the city rows of every partition, as the ANP files merged with the cities'''
+    aggregate_data = read_aggregate_data()
+    city_rows = aggregate_data[COLUMNS.PLACE_TYPE] == 'CIDADE'
+    return aggregate_data[city_rows].drop(columns=__PLACE_COLUMNS)\
+                                    .reset_index(drop=True)
+
+# Only the metadata is read at startup, the partitions
+# of each product are read on its first request
+__publish_partitions(*__load_partitions())
+
+def remove_nested_places(place_ids):
+    '''
+    Returns the place ids that are not
+    inside another one of the given places
+    '''
+    place_parents = __partitioned_data.place_parents
+    selected_places = set(place_ids)
+    return [ place_id for place_id in selected_places
+             if selected_places.isdisjoint(place_parents.get(place_id, ())) ]
+
+def __index_row_ranges(place_index, sorted_values, product, first_value, after_last_value, place_ids):
+    '''
+    Yields the start and stop positions of the rows of each place
+    whose values, sorted within the place, are in [first_value, after_last_value)
+    '''
+    for place_id in sorted(set(place_ids)):
+        if (product, place_id) not in place_index:
+            continue
+
+        start, stop = place_index[(product, place_id)]
+        place_values = sorted_values[start:stop]
+        yield (start + np.searchsorted(place_values, first_value),
+               start + np.searchsorted(place_values, after_last_value))
+
+def __place_row_ranges(aggregate_cube, product, year_range, place_ids):
+    return __index_row_ranges(aggregate_cube.place_index, aggregate_cube.months, product,
+                              np.datetime64(f'{year_range[0]}-01-01'),
+                              np.datetime64(f'{year_range[1] + 1}-01-01'),
+                              place_ids)
+
+def __rows_of_ranges(row_ranges):
+    row_ranges = [ np.arange(start, stop) for start, stop in row_ranges ]
+    return np.concatenate(row_ranges) if row_ranges else np.array([], dtype=int)
+
+@instrumented('select_aggregate_data')
+def select_aggregate_data(product, year_range, place_ids):
+    '''
+    Returns the aggregate rows of the places for the product
+    within the year range, slicing the place index instead of
+    scanning the whole cube
+    '''
+    aggregate_cube = __product_cube(product)
+    rows = __rows_of_ranges(__place_row_ranges(aggregate_cube, product, year_range, place_ids))
+
+    # Plotly and the groupings over the selection expect plain
+    # labels, not categories listing every place in the cube.
+    # Only those columns are converted, astype copies them all
+    selection = aggregate_cube.data.iloc[rows]
+    return selection.assign(**{ column: np.asarray(selection[column], dtype=object)
+                                for column in __PLACE_COLUMNS })
+
+@instrumented('select_yearly_rollup')
+def select_yearly_rollup(product, year_range, place_ids):
+    '''
+    Returns the yearly means of the standard deviation and
+    variation coefficient of the market price of the places
+    for the product within the year range, sorted by place
+    name and year as the bar charts show them
+    '''
+    yearly_rollup = __product_cube(product).yearly_rollup
+    rows = __rows_of_ranges(__index_row_ranges(yearly_rollup.place_index, yearly_rollup.years,
+                                               product, year_range[0], year_range[1] + 1,
+                                               place_ids))
+
+    return yearly_rollup.data.iloc[rows]\
+                             .astype({ COLUMNS.PLACE_NAME: object, COLUMNS.YEAR: object })\
+                             .sort_values([COLUMNS.PLACE_NAME, COLUMNS.YEAR])
+
+@instrumented('select_price_matrix')
+def select_price_matrix(product, place_ids):
+    '''
+    Returns the monthly market price and margin matrices of
+    the places for the product, over every month, with one
+    row per place found, in place id order
+    '''
+    aggregate_cube = __product_cube(product)
+    price_matrix = aggregate_cube.price_matrix
+    found_places = [ place_id for place_id in sorted(set(place_ids))
+                     if (product, place_id) in aggregate_cube.place_index ]
+    rows = [ price_matrix.place_rows[place_id] for place_id in found_places ]
+
+    return PriceMatrix(place_rows={ place_id: row for row, place_id in enumerate(found_places) },
+                       months=price_matrix.months,
+                       values={ column: values[rows] for column, values in price_matrix.values.items() })
+
+@instrumented('count_gas_stations')
+def count_gas_stations(product, year_range, place_ids):
+    '''
+    Sums the gas station counts of the places for the product
+    within the year range, counting the places nested in
+    another selected place (a city in a selected state,
+    for instance) only once
+    '''
+    aggregate_cube = __product_cube(product)
+    counted_places = remove_nested_places(place_ids)
+    station_counts = aggregate_cube.station_counts
+
+    return int(sum(station_counts[stop] - station_counts[start]
+                   for start, stop in __place_row_ranges(aggregate_cube, product,
+                                                         year_range, counted_places)))
+
+@instrumented('select_map_markers')
+def select_map_markers(product, year_range, place_ids):
+    '''
+    Returns one row per place with its coordinates and the
+    mean of its monthly market prices within the year range,
+    read from the cumulative sums instead of the month rows
+    '''
+    aggregate_cube = __product_cube(product)
+    price_sums = aggregate_cube.price_sums
+    price_counts = aggregate_cube.price_counts
+
+    row_ranges = [ (start, stop) for start, stop
+                   in __place_row_ranges(aggregate_cube, product, year_range, place_ids)
+                   if price_counts[stop] > price_counts[start] ]
+    starts = np.array([ start for start, _ in row_ranges ], dtype=int)
+    stops = np.array([ stop for _, stop in row_ranges ], dtype=int)
+
+    markers = aggregate_cube.data.iloc[starts][[COLUMNS.PLACE_ID, COLUMNS.PLACE_NAME,
+                                                COLUMNS.LATITUDE, COLUMNS.LONGITUDE]]\
+                                 .astype({ COLUMNS.PLACE_ID: object, COLUMNS.PLACE_NAME: object })
+    markers[COLUMNS.MARKET_PRICE_MEAN] = ((price_sums[stops] - price_sums[starts]) /
+                                          (price_counts[stops] - price_counts[starts]))
+
+    return markers.reset_index(drop=True)
+
+__ingest_lock = threading.Lock()
+__ingested_releases = { path: os.path.getmtime(path) for path in __release_paths() }
+
+def ingest_release(release_path):
+    '''
+    Adds an ANP release to the running dataset: it is stored
+    with the other releases and only its rows are parsed, merged
+    and aggregated. Products and months already loaded are
+    replaced by the ones in the release
+    '''
+    with __ingest_lock:
+        os.makedirs(releases_dir_path, exist_ok=True)
+        stored_path = os.path.join(releases_dir_path, os.path.basename(release_path))
+        if os.path.abspath(release_path) != os.path.abspath(stored_path):
+            shutil.copyfile(release_path, stored_path)
+        # Read before parsing, a release changed meanwhile is ingested again
+        release_mtime = os.path.getmtime(stored_path)
+
+        release_data = __compact_dataset(__merge_city_data(__read_gas_data(stored_path),
+                                                           __read_cities_data()))
+        try:
+            metadata, partitions = __ingest_partitions(__partitioned_data, release_data)
+        except FileNotFoundError:
+            # The published partitions were removed since, the
+            # sources, the stored release included, describe
+            # the partitions written by the other workers
+            metadata, partitions = __load_partitions()
+
+        __publish_partitions(metadata, partitions)
+        # Only once published, a failed release is retried on the next poll
+        __ingested_releases[stored_path] = release_mtime
+
+def __ingest_partitions(partitioned_data, release_data):
+    '''
+    The metadata and partitions of the published data with
+    the rows of the release: only the partitions of the
+    release years are read and replaced
+    '''
+    partitions = dict(partitioned_data.partitions)
+    for key, release_rows in __split_partitions(generate_aggregate_data(release_data)).items():
+        partitions[key] = (__replace_months(__read_partition(partitions[key]), release_rows)
+                           if key in partitions else release_rows)
+    metadata = __merge_metadata(partitioned_data.metadata, __build_metadata(release_data))
+
+    try:
+        partitions = __write_partitions(__partitions_dir_path(__source_paths()),
+                                        metadata, sorted(partitions.items()))
+    except FileNotFoundError:
+        raise # A published partition to link is gone
+    except OSError:
+        pass # Read-only deploys keep the partitions in memory
+
+    return metadata, partitions
+
+def watch_releases(poll_interval):
+    '''
+    Starts a daemon thread ingesting the releases
+    copied into the releases directory while running
+    '''
+    def poll_releases():
+        while True:
+            time.sleep(poll_interval)
+            for release_path in __release_paths():
+                try:
+                    # Also raises when the release was removed since it was listed
+                    if __ingested_releases.get(release_path) != os.path.getmtime(release_path):
+                        ingest_release(release_path)
+                except Exception:
+                    logging.exception(f'Could not ingest {release_path}')
+
+    threading.Thread(target=poll_releases, daemon=True).start()
 
 '''def merge_places_polygons_data(merged_city_gas_data):
     return merged_city_gas_data.reset_index().merge(__places_data, how="inner",  
         left_on='NOME DO LOCAL', right_on='State').set_index('NOME DO LOCAL')'''
-
-# DATASET.groupby(COLUMNS.PRODUCT).agg(['min', 'max']).transpose()
-
-# len(DATASET)
@@ -0,0 +1,240 @@
+'''
+Exports the dashboard outputs of a grid of filters as static
+files, so embeds of popular views can be served by a plain
+static file server instead of the Dash callbacks. Each view
+is written as JSON, with the outputs the callbacks send, and
+as an HTML page drawing them, each next to a gzip copy for
+servers serving precompressed files. manifest.json lists the
+views with their filters, files and build times.
+
+The views are built by a pool of processes. The export is
+written to OUTPUT.tmp and swapped in once complete.
+
+Usage: python export_snapshots.py [--config FILE] [--output DIR] [--workers N]
+'''
+import os
+import json
+import gzip
+import time
+import shutil
+import argparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+# Every view is built once, by processes that don't serve requests
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+os.environ['FIGURE_CACHE_SIZE'] = '0'
+os.environ['WARMUP_SIZE'] = '0'
+os.environ['REQUEST_HISTORY'] = ''
+
+import plotly
+
+import main
+import data_provider
+from figure_cache import filters_key
+from place_search import normalize_search_text
+
+DEFAULT_OUTPUT_DIR = 'snapshots'
+DEFAULT_PLACE_SET = 'default'
+
+PLOT_OUTPUTS = ['market_price_plot', 'market_margin_plot',
+                'market_price_std_deviation_plot', 'market_price_coef_var_plot']
+
+def slug(text):
+    '''Lower case words joined by dashes, "ÓLEO DIESEL" becomes "oleo-diesel"'''
+    return normalize_search_text(text).lower().replace(' ', '-')
+
+def read_grid_config(path):
+    '''
+    Filters of every view of a JSON grid config, by view id:
+    {"products": [...], "years": [[2018, 2020], ...],
+    "places": {"capitals": ["city_MANAUS", ...], ...}}. The
+    products default to all of them, the years and places
+    to those the dashboard shows first
+    '''
+    grid = {}
+    if path:
+        with open(path) as config_file:
+            grid = json.load(config_file)
+
+    products = grid.get('products', list(data_provider.PRODUCTS))
+    year_ranges = grid.get('years', [(main.DEFAULT_FIRST_YEAR, int(max(data_provider.YEARS)))])
+    place_sets = grid.get('places', { DEFAULT_PLACE_SET: main.DEFAULT_PLACES })
+
+    unknown_products = [ product for product in products if product not in data_provider.PRODUCTS ]
+    unknown_places = [ place_id for places in place_sets.values() for place_id in places
+                       if place_id not in data_provider.PLACES_DICT ]
+    if unknown_products or unknown_places:
+        raise ValueError(f'Unknown products {unknown_products} and places {unknown_places}')
+
+    return { f'{slug(product)}_{first_year}-{last_year}_{slug(place_set)}':
+                 filters_key(product, (first_year, last_year), list(places))
+             for product in products
+             for first_year, last_year in year_ranges
+             for place_set, places in place_sets.items() }
+
+def write_file(output_dir, path, text):
+    '''
+    Writes the text and its gzip copy, path.gz, returning
+    the path and the size of both
+    '''
+    data = text.encode('utf-8')
+    file_path = os.path.join(output_dir, path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as output_file:
+        output_file.write(data)
+    # No timestamp, so exporting the same data gives the same files
+    with gzip.GzipFile(file_path + '.gz', 'wb', compresslevel=9, mtime=0) as gzip_file:
+        gzip_file.write(data)
+
+    return { 'path': path, 'bytes': len(data),
+             'gzip_bytes': os.path.getsize(file_path + '.gz') }
+
+HTML_TEMPLATE = '''<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="../plotly.min.js"></script>
+<script src="../clientside.js"></script>
+<style>
+  body {{ font-family: sans-serif; margin: 0 auto; max-width: 1200px; }}
+  .badges {{ display: flex; gap: 2em; }}
+  .plots {{ display: flex; flex-wrap: wrap; }}
+</style>
+</head>
+<body>
+<h3>{title}</h3>
+<div class="badges">
+  <div><h6>Locais escolhidos</h6><h4 id="places_badge_count"></h4></div>
+  <div><h6>Preços analisados</h6><h4 id="prices_badge_count"></h4></div>
+  <div><h6>Meses selecionados</h6><h4 id="months_badge_count"></h4></div>
+</div>
+<div id="brazil_map"></div>
+<div class="plots">{plot_divs}</div>
+<script>
+  var view = {view_json};
+  var mapFigure = {map_json};
+
+  var badges = view.outputs.badges;
+  ['places_badge_count', 'prices_badge_count', 'months_badge_count'].forEach(function(id, position) {{
+      document.getElementById(id).textContent = badges[position];
+  }});
+
+  var map = window.dash_clientside.clientside.draw_map_markers(view.outputs.brazil_map, mapFigure);
+  Plotly.newPlot('brazil_map', map.data, map.layout);
+  {plot_names}.forEach(function(name) {{
+      Plotly.newPlot(name, view.outputs[name].data, view.outputs[name].layout);
+  }});
+</script>
+</body>
+</html>
+'''
+
+def script_json(value):
+    '''JSON of the value that can be inlined in a script element'''
+    return json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder).replace('</', '<\\/')
+
+def render_html(view):
+    first_year, last_year = view['years']
+    return HTML_TEMPLATE.format(title=f'{view["product"]} {first_year}-{last_year}',
+                                plot_divs=''.join(f'<div id="{output_name}"></div>'
+                                                  for output_name in PLOT_OUTPUTS),
+                                view_json=script_json(view),
+                                map_json=script_json(main.BRAZIL_MAP_BASE_FIGURE),
+                                plot_names=json.dumps(PLOT_OUTPUTS))
+
+def export_view(output_dir, view_id, filters):
+    '''
+    Builds every dashboard output of the filters and writes
+    the view files, returning its manifest entry
+    '''
+    start_time = time.perf_counter()
+    product, year_range, places = filters
+    outputs = { output_name: main.get_dashboard_output(output_name, product,
+                                                       list(year_range), list(places))
+                for output_name in main.DASHBOARD_OUTPUTS }
+    build_seconds = time.perf_counter() - start_time
+
+    view = { 'id': view_id,
+             'product': product,
+             'years': list(year_range),
+             'places': list(places),
+             'outputs': outputs }
+    files = { 'json': write_file(output_dir, f'views/{view_id}.json',
+                                 json.dumps(view, cls=plotly.utils.PlotlyJSONEncoder)),
+              'html': write_file(output_dir, f'views/{view_id}.html', render_html(view)) }
+
+    return { **{ key: value for key, value in view.items() if key != 'outputs' },
+             'files': files,
+             'build_seconds': build_seconds,
+             'seconds': time.perf_counter() - start_time }
+
+def export_snapshots(views, output_dir, workers):
+    '''
+    Exports the views, by id, to output_dir with a pool of
+    workers processes and returns the manifest
+    '''
+    start_time = time.perf_counter()
+    export_dir = f'{output_dir}.tmp'
+    shutil.rmtree(export_dir, ignore_errors=True)
+    os.makedirs(export_dir)
+
+    # Products loaded before the pool forks are shared by the workers
+    products = list(dict.fromkeys(product for product, _, _ in views.values()))
+    data_provider.load_products(products[:data_provider.product_cache_size])
+
+    # The views of a product follow each other in the grid, so
+    # the workers mostly read the products they already loaded
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [ executor.submit(export_view, export_dir, view_id, filters)
+                    for view_id, filters in views.items() ]
+        entries = [ future.result() for future in futures ]
+
+    write_file(export_dir, 'plotly.min.js', plotly.offline.get_plotlyjs())
+    shutil.copy(os.path.join('assets', 'clientside.js'), export_dir)
+    manifest = { 'generated': datetime.now(timezone.utc).isoformat(),
+                 'workers': workers,
+                 'seconds': time.perf_counter() - start_time,
+                 'views': entries }
+    with open(os.path.join(export_dir, 'manifest.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    # The previous export is served until the new one is complete
+    previous_dir = f'{output_dir}.old'
+    shutil.rmtree(previous_dir, ignore_errors=True)
+    if os.path.exists(output_dir):
+        os.rename(output_dir, previous_dir)
+    os.rename(export_dir, output_dir)
+    shutil.rmtree(previous_dir, ignore_errors=True)
+
+    return manifest
+
+def main_export():
+    parser = argparse.ArgumentParser(description='Exports dashboard views as static files')
+    parser.add_argument('--config', help='JSON grid of products, year ranges and place sets')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='directory of the export')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='processes building the views')
+    args = parser.parse_args()
+
+    views = read_grid_config(args.config)
+    manifest = export_snapshots(views, args.output, args.workers)
+
+    print(f'{"view":>45} {"build ms":>10} {"view ms":>10} {"json gzip":>10} {"html gzip":>10}')
+    for entry in manifest['views']:
+        print(f'{entry["id"]:>45} {entry["build_seconds"] * 1000:>10.1f} '
+              f'{entry["seconds"] * 1000:>10.1f} {entry["files"]["json"]["gzip_bytes"]:>9}B '
+              f'{entry["files"]["html"]["gzip_bytes"]:>9}B')
+
+    view_seconds = [ entry['seconds'] for entry in manifest['views'] ]
+    summary = (f'{len(view_seconds)} views exported to {args.output} '
+               f'in {manifest["seconds"]:.2f}s with {args.workers} workers')
+    # A grid without views still writes its empty manifest
+    if view_seconds:
+        summary += (f', {sum(view_seconds) / len(view_seconds) * 1000:.1f}ms per view, '
+                    f'{max(view_seconds) * 1000:.1f}ms at most')
+    print(summary)
+
+if __name__ == '__main__':
+    main_export()
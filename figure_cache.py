@@ -0,0 +1,139 @@
+import time
+import threading
+from collections import OrderedDict
+
+def filters_key(selected_product, selected_year_range, selected_places):
+    '''
+    Canonical, hashable form of the dashboard filters:
+    the order and repetition of the selected places do
+    not change the figures, so they don't change the key
+    '''
+    if type(selected_places) is not list:
+        selected_places = [selected_places] if selected_places else []
+
+    return (selected_product,
+            tuple(int(year) for year in selected_year_range),
+            tuple(sorted(set(selected_places))))
+
+class LRUCache:
+    '''
+    Thread safe LRU cache, of the callback outputs, the
+    filtered slices and the product cubes among others.
+    Entries are evicted when the cache grows past max_size
+    or, if max_age is set, when they are older than max_age seconds
+    '''
+
+    # Returned by __get on a miss, since a cached value may be None
+    __MISSING = object()
+
+    def __init__(self, max_size=128, max_age=None):
+        self.max_size = max_size
+        self.max_age = max_age
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__build_locks = {}
+
+    def get(self, key):
+        '''The cached value of the key, None on a miss'''
+        value = self.__get(key, count_miss=True)
+        return None if value is self.__MISSING else value
+
+    def get_or_build(self, key, build):
+        '''
+        Returns the cached value of the key, calling build()
+        to compute it on a miss. Concurrent callers missing
+        the same key wait for a single build
+        '''
+        value = self.__get(key, count_miss=True)
+        if value is not self.__MISSING:
+            return value
+
+        with self.__lock:
+            build_lock = self.__build_locks.setdefault(key, threading.Lock())
+
+        try:
+            with build_lock:
+                value = self.__get(key, count_miss=False)
+                if value is self.__MISSING:
+                    value = build()
+                    self.set(key, value)
+        finally:
+            # Also when build() raises, the next caller builds again
+            with self.__lock:
+                if self.__build_locks.get(key) is build_lock:
+                    del self.__build_locks[key]
+
+        return value
+
+    def __get(self, key, count_miss):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and self.__is_expired(entry):
+                del self.__entries[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None:
+                if count_miss:
+                    self.misses += 1
+                return self.__MISSING
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+
+        with self.__lock:
+            self.__entries[key] = (time.monotonic(), value)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def stats(self):
+        with self.__lock:
+            return { 'size': len(self.__entries),
+                     'max_size': self.max_size,
+                     'max_age': self.max_age,
+                     'hits': self.hits,
+                     'misses': self.misses,
+                     'evictions': self.evictions }
+
+    def __is_expired(self, entry):
+        return (self.max_age is not None and
+                time.monotonic() - entry[0] > self.max_age)
+
+class BuildTimings:
+    '''
+    Thread safe count, total and maximum of the build
+    durations (seconds) recorded under each name
+    '''
+
+    def __init__(self):
+        self.__timings = {}
+        self.__lock = threading.Lock()
+
+    def record(self, name, duration):
+        with self.__lock:
+            count, total, maximum = self.__timings.get(name, (0, 0.0, 0.0))
+            self.__timings[name] = (count + 1, total + duration, max(maximum, duration))
+
+    def stats(self):
+        with self.__lock:
+            return { name: { 'count': count,
+                             'mean_seconds': total / count,
+                             'max_seconds': maximum }
+                     for name, (count, total, maximum) in self.__timings.items() }
@@ -0,0 +1,50 @@
+# Production server settings: gunicorn -c gunicorn.conf.py wsgi:server
+#
+# The app is loaded once in the master before the workers are forked,
+# so the dataset and aggregate buffers are shared copy-on-write by
+# all workers instead of being loaded again by each one
+import os
+import gc
+
+bind = os.environ.get('BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+# Threads let a worker accept the callback requests of a filter
+# change while it builds another output. The pandas and Plotly
+# builds hold the GIL, so only the workers build outputs in parallel
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+timeout = 120
+
+# GUNICORN_PRELOAD=0 loads the app in every worker instead
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Threads don't survive a fork, so the master doesn't watch the
+# releases and every worker starts its own watcher instead
+releases_poll_interval = float(os.environ.get('RELEASES_POLL_INTERVAL', 60))
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+
+# Each worker has its own figure cache, so each one warms it up,
+# with the products loaded by the master only (see warm_up_filters)
+warmup_size = int(os.environ.get('WARMUP_SIZE', 20))
+os.environ['WARMUP_SIZE'] = '0'
+
+def when_ready(server):
+    if preload_app:
+        # Products are otherwise loaded on their first request, those
+        # loaded in the master are shared by the workers instead
+        import data_provider
+        import main
+        data_provider.load_products(main.preloaded_products())
+
+    # Moves everything loaded so far to the permanent generation: the
+    # collector no longer writes to those objects, so their pages stay shared
+    gc.freeze()
+
+def post_fork(server, worker):
+    if releases_poll_interval > 0:
+        import data_provider
+        data_provider.watch_releases(releases_poll_interval)
+
+    if warmup_size > 0:
+        import main
+        main.WARMUP.start(main.warm_up_filters(warmup_size))
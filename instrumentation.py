@@ -0,0 +1,165 @@
+import os
+import time
+import bisect
+import pstats
+import cProfile
+import logging
+import threading
+import functools
+import pandas as pd
+
+# Opt-in: set INSTRUMENTATION=1 to record the stages
+ENABLED = os.environ.get('INSTRUMENTATION', '0') == '1'
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+SECONDS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+ROWS_BUCKETS = [1, 10, 100, 1000, 10000, 100000, 1000000, 10000000]
+BYTES_BUCKETS = [1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+
+class Histogram:
+    '''
+    Thread safe Prometheus style histogram, with
+    one series of cumulative buckets per label value
+    '''
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+
+        self.__series = {}
+        self.__lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self.__lock:
+            counts, total = self.__series.get(label_value,
+                                              ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.__series[label_value] = (counts, total + value)
+
+    def prometheus_text(self):
+        lines = [f'# HELP {self.name} {self.help_text}',
+                 f'# TYPE {self.name} histogram']
+        with self.__lock:
+            for label_value, (counts, total) in sorted(self.__series.items()):
+                cumulative_count = 0
+                for bound, count in zip(self.buckets + ['+Inf'], counts):
+                    cumulative_count += count
+                    lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",'
+                                 f'le="{bound}"}} {cumulative_count}')
+                lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {total}')
+                lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {cumulative_count}')
+
+        return '\n'.join(lines)
+
+STAGE_SECONDS = Histogram('dashboard_stage_seconds',
+                          'Duration of the dashboard stages in seconds',
+                          'stage', SECONDS_BUCKETS)
+STAGE_ROWS = Histogram('dashboard_stage_rows',
+                       'Rows handled by the dashboard stages',
+                       'stage', ROWS_BUCKETS)
+PAYLOAD_BYTES = Histogram('dashboard_payload_bytes',
+                          'Size of the clientside filtering stores in bytes, before compression',
+                          'kind', BYTES_BUCKETS)
+
+class Stage:
+    '''
+    Times the block it wraps under the stage name,
+    the block sets rows to record its row count too
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception_info):
+        STAGE_SECONDS.observe(self.name, time.perf_counter() - self.start_time)
+        if self.rows is not None:
+            STAGE_ROWS.observe(self.name, self.rows)
+
+def instrumented(stage_name):
+    '''
+    Decorator recording each call as the stage, with the rows
+    of the DataFrame returned or else of the first argument
+    '''
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Stage(stage_name) as function_stage:
+                result = function(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    function_stage.rows = len(result)
+                elif args and isinstance(args[0], pd.DataFrame):
+                    function_stage.rows = len(args[0])
+            return result
+
+        return wrapper
+
+    return decorator
+
+def prometheus_text():
+    return '\n'.join([STAGE_SECONDS.prometheus_text(),
+                      STAGE_ROWS.prometheus_text(),
+                      PAYLOAD_BYTES.prometheus_text()]) + '\n'
+
+# At most one request is profiled at a time, the one
+# that takes the profile when it starts
+__profile_lock = threading.Lock()
+__profile_min_seconds = None
+
+def arm_request_profile(min_seconds):
+    '''
+    Profiles the next requests until one of them takes
+    at least min_seconds, then dumps its profile to PROFILE_DIR
+    '''
+    global __profile_min_seconds
+
+    with __profile_lock:
+        __profile_min_seconds = min_seconds
+
+def start_request_profile():
+    '''
+    Returns a running profiler if a profile is armed
+    and no other request is being profiled
+    '''
+    global __profile_min_seconds
+
+    with __profile_lock:
+        if __profile_min_seconds is None:
+            return None
+        min_seconds, __profile_min_seconds = __profile_min_seconds, None
+
+    profiler = cProfile.Profile()
+    profiler.min_seconds = min_seconds
+    profiler.start_time = time.perf_counter()
+    profiler.enable()
+    return profiler
+
+def finish_request_profile(profiler, request_name):
+    '''
+    Dumps the profile if the request was slow enough,
+    otherwise arms the profile again for the next one
+    '''
+    profiler.disable()
+    duration = time.perf_counter() - profiler.start_time
+    if duration < profiler.min_seconds:
+        arm_request_profile(profiler.min_seconds)
+        return None
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_path = os.path.join(PROFILE_DIR,
+                                f'request-{time.strftime("%Y%m%d-%H%M%S")}.prof')
+    pstats.Stats(profiler).dump_stats(profile_path)
+    logging.warning('Profile of %s (%.3fs) written to %s',
+                    request_name, duration, profile_path)
+    return profile_path
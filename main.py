@@ -1,5 +1,10 @@
+import os
+import json
+import time
+from datetime import datetime
 import pandas as pd
 import numpy as np
+import plotly
 import plotly.express as px
 import plotly.graph_objects as go
 # from shapely.geometry import Point
@@ -7,12 +12,47 @@ import plotly.graph_objects as go
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
+from flask import jsonify, request, g, Response
+from flask_compress import Compress
 
+import data_provider
 from data_provider import *
-
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+from figure_cache import LRUCache, BuildTimings, filters_key
+import instrumentation
+from api import api, ARROW_MIMETYPE
+from warmup import RequestHistory, WarmUp, read_filters_config
+from place_search import PlaceSearchIndex
+import anomalies
+from anomalies import ANOMALY_COLUMNS
+import analytics
+from analytics import TRANSFORMS, DEFAULT_TRANSFORM
+from instrumentation import instrumented
+
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP],
+                compress=False)
+
+# Compresses the callback responses and those of the
+# read-only API, Arrow streams included
+app.server.config['COMPRESS_MIMETYPES'] = ['text/html', 'text/css', 'text/xml',
+                                           'application/json', 'application/javascript',
+                                           ARROW_MIMETYPE]
+Compress(app.server)
+app.server.register_blueprint(api)
+
+# Outputs (figures, map markers, badges) of the recently used
+# filter combinations, six per combination,
+# FIGURE_CACHE_MAX_AGE (seconds) is unlimited when not set
+FIGURE_CACHE = LRUCache(
+    max_size=int(os.environ.get('FIGURE_CACHE_SIZE', 768)),
+    max_age=(float(os.environ['FIGURE_CACHE_MAX_AGE'])
+             if 'FIGURE_CACHE_MAX_AGE' in os.environ else None))
+
+# With CLIENTSIDE_FILTERING=1 the year slider is handled in the
+# browser, see the series store below
+CLIENTSIDE_FILTERING = os.environ.get('CLIENTSIDE_FILTERING', '0') == '1'
 
 with open(".mapbox_token.txt") as map_token_file:
     token = map_token_file.read()
@@ -25,14 +65,38 @@ def options_from_iterable(iterable):
               "value": str(option) }
             for option in iterable]
 
+def place_options(place_ids):
+    places_dict = data_provider.PLACES_DICT
+    return [{ "label": places_dict[place_id],
+              "value": place_id }
+            for place_id in place_ids if place_id in places_dict]
+
 def values_from_iterable(iterable):
     return {str(option): str(option)
             for option in iterable}
 
 # --------------------
 
+# The map layout is built once, callbacks only send the markers
+# to the clientside function in assets/clientside.js, which
+# draws them over this base figure
+def build_brazil_map_base_figure():
+    figure = go.Figure(go.Scattermapbox(mode='markers'))
+    figure.update_layout(width=800, height=600,
+                         margin=dict(t=60, b=0, l=0, r=0),
+                         mapbox=dict(accesstoken=token,
+                                     center=dict(lat=-11.619893, lon=-56.408030),
+                                     zoom=2.5),
+                         coloraxis=dict(colorscale=px.colors.sequential.Aggrnyl,
+                                        colorbar=dict(title=COLUMNS.MARKET_PRICE_MEAN)),
+                         uirevision='brazil_map')
+    return figure.to_dict()
+
+BRAZIL_MAP_BASE_FIGURE = build_brazil_map_base_figure()
+
 cities_map = html.Div([
-    dcc.Graph(id='brazil_map', figure={}),
+    dcc.Graph(id='brazil_map', figure=BRAZIL_MAP_BASE_FIGURE),
+    dcc.Store(id='brazil_map_markers'),
 ], className='brazil-map')
 
 info_badges = html.Div([
@@ -81,100 +145,175 @@ info_badges = html.Div([
         ),
 ],)
 
-filters = html.Div([
-    html.Br(),
-    html.H5("Locais selecionados:",
-        className="dcc_control"
-    ),
-    dcc.Dropdown(id="selected_places",
-            options=[{ "label": PLACES_DICT[place_id],
-                       "value": place_id }
-                     for place_id in PLACES_DICT],
-            multi=True,
-            value=['city_MANAUS', 'city_BRASILIA', 'city_FLORIANOPOLIS', 'city_SALVADOR', 'city_SAO PAULO'],
+# Filters shown when the page loads
+DEFAULT_PRODUCT = 'GASOLINA COMUM'
+DEFAULT_PLACES = ['city_MANAUS', 'city_BRASILIA', 'city_FLORIANOPOLIS', 'city_SALVADOR', 'city_SAO PAULO']
+DEFAULT_FIRST_YEAR = 2018
+
+# The sections below read the options from data_provider on
+# every page load, so they follow the ingested ANP releases
+def build_filters():
+    return html.Div([
+        html.Br(),
+        html.H5("Locais selecionados:",
+            className="dcc_control"
+        ),
+        # Only the selected places are sent with the page, the
+        # other options are searched as the user types
+        dcc.Dropdown(id="selected_places",
+                options=place_options(DEFAULT_PLACES),
+                multi=True,
+                value=DEFAULT_PLACES,
+                className="dcc_control",
+                ),
+        html.Br(),
+        html.H5("Combustível selecionado:",
+            className="dcc_control"
+        ),
+        dcc.RadioItems(
+            id="selected_product",
+            options=options_from_iterable(data_provider.PRODUCTS),
+            value=DEFAULT_PRODUCT,
+            labelStyle={'display': 'inline-block', 'margin':'4px'},
             className="dcc_control",
-            ),
-    html.Br(),
-    html.H5("Combustível selecionado:",
-        className="dcc_control"
-    ),
-    dcc.RadioItems(
-        id="selected_product",
-        options=options_from_iterable(PRODUCTS),
-        value='GASOLINA COMUM',
-        labelStyle={'display': 'inline-block', 'margin':'4px'},
-        className="dcc_control",
-    ),
-], className='filters-div')
-
-
-date_slider = html.Div([
-    html.Div([
-        html.H5("Período selecionado:"),
-    ]),
-    dcc.RangeSlider(
-        id="selected_years",
-        min=min(YEARS),
-        max=max(YEARS),
-        value=(2018, max(YEARS)),
-        marks=values_from_iterable(YEARS),
-        className="dcc_control",
-    ),
-], className="slider_control")
-
-header_section = html.Div([
-    html.Header([
+        ),
+        html.Br(),
+        html.H5("Série dos gráficos de linha:",
+            className="dcc_control"
+        ),
+        dcc.Dropdown(
+            id="selected_transform",
+            options=[{ "label": label, "value": transform }
+                     for transform, label in TRANSFORMS.items()
+                     if transform != analytics.REAL_PRICES or data_provider.DEFLATOR is not None],
+            value=DEFAULT_TRANSFORM,
+            clearable=False,
+            className="dcc_control",
+        ),
+    ], className='filters-div')
+
+
+def build_date_slider():
+    years = data_provider.YEARS
+
+    return html.Div([
+        html.Div([
+            html.H5("Período selecionado:"),
+        ]),
+        dcc.RangeSlider(
+            id="selected_years",
+            min=min(years),
+            max=max(years),
+            value=(DEFAULT_FIRST_YEAR, max(years)),
+            marks=values_from_iterable(years),
+            className="dcc_control",
+        ),
+    ], className="slider_control")
+
+def build_header_section():
+    # The last month of the published dataset, so the date
+    # follows the ingested ANP releases as well
+    last_month = data_provider.get_dataset().metadata['last_month']
+
+    return html.Div([
+        html.Header([
+            html.Div([
+                html.H1('Preços dos Combustíveis no Brasil'),
+                html.H6('Última atualização: ' +
+                        (datetime.strptime(last_month, '%Y-%m').strftime('%m/%Y')
+                         if last_month else '-')),
+            ], className="header-title")
+        ], className="header-div")
+    ])
+
+def build_data_selection_section():
+    return html.Div([
+        cities_map,
         html.Div([
-            html.H1('Preços dos Combustíveis no Brasil'),
-            html.H6('Última atualização: 20/06/2020'),
-        ], className="header-title")
-    ], className="header-div")
-])
-data_selection_section = html.Div([
-    cities_map,
-    html.Div([
-        info_badges,
-        filters,
-    ], className="filters")
-], className="map-and-filters")
-
-plots_section = html.Div([
-     dcc.Graph(id='market_price_plot', figure={}),
-     dcc.Graph(id='market_margin_plot', figure={}),
+            info_badges,
+            build_filters(),
+        ], className="filters")
+    ], className="map-and-filters")
+
+def build_plots_section():
+    # The clientside callbacks draw over the layout of the base figures
+    figures = PLOT_BASE_FIGURES if CLIENTSIDE_FILTERING else {}
+
+    return html.Div([
+     dcc.Graph(id='market_price_plot', figure=figures.get('market_price_plot', {})),
+     dcc.Graph(id='market_margin_plot', figure=figures.get('market_margin_plot', {})),
      dbc.Row(
             [
                 dbc.Col(html.Div([
-                            dcc.Graph(id='market_price_std_deviation_plot', figure={}),
+                            dcc.Graph(id='market_price_std_deviation_plot',
+                                      figure=figures.get('market_price_std_deviation_plot', {})),
                 ])),
                 dbc.Col(html.Div([
-                            dcc.Graph(id='market_price_coef_var_plot', figure={}),
+                            dcc.Graph(id='market_price_coef_var_plot',
+                                      figure=figures.get('market_price_coef_var_plot', {})),
                 ]))
             ])
-])
+    ])
+
+def build_anomalies_section():
+    return html.Div([
+        html.H5("Cidades que mais se afastam do estado e da região:"),
+        html.Div(id='anomalies_table'),
+    ], className="anomalies-div")
 
 # Generate the app
-app.layout = html.Div([
-    header_section,
-    data_selection_section,
-    date_slider,
-    plots_section
-])
-
-def build_brazil_map_figure(filtered_dataset, selected_product):
-    return px.scatter_mapbox(filtered_dataset,
-                             lat=COLUMNS.LATITUDE, lon=COLUMNS.LONGITUDE,
-                             size=COLUMNS.MARKET_PRICE_MEAN,
-                             width=800, height=600,
-                             zoom=2.5, # mapbox_style="dark",
-                             center=dict(lat=-11.619893, lon=-56.408030),
-                             color_continuous_scale=px.colors.sequential.Aggrnyl,
-                             color=COLUMNS.MARKET_PRICE_MEAN,
-                             hover_name=COLUMNS.PLACE_NAME,
-                             hover_data={ COLUMNS.MARKET_PRICE_MEAN: ':.2f',
-                                          COLUMNS.LATITUDE: False,
-                                          COLUMNS.LONGITUDE: False },
-                             title=f"Preço Médio do Combustível nas Revendas { PRODUCT_UNITS[selected_product] }",
-    ) 
+def serve_layout():
+    return html.Div([
+        build_header_section(),
+        build_data_selection_section(),
+        build_date_slider(),
+        build_plots_section(),
+        build_anomalies_section(),
+    ] + ([dcc.Store(id='series_store'), dcc.Store(id='series_store_years')]
+         if CLIENTSIDE_FILTERING else []))
+
+# Above MAP_CLUSTER_THRESHOLD places, nearby markers are merged
+MAP_CLUSTER_THRESHOLD = int(os.environ.get('MAP_CLUSTER_THRESHOLD', 300))
+
+def cluster_map_markers(markers, max_markers):
+    '''
+    Merges the markers falling in the same cell of a
+    latitude/longitude grid, doubling the cell size
+    until at most max_markers are left
+    '''
+    cell_size = 0.5
+    while True:
+        cells = [(markers[COLUMNS.LATITUDE] // cell_size).astype(int),
+                 (markers[COLUMNS.LONGITUDE] // cell_size).astype(int)]
+        clusters = markers.groupby(cells, sort=False).agg(
+                            **{ COLUMNS.PLACE_NAME: (COLUMNS.PLACE_NAME, 'first'),
+                                COLUMNS.LATITUDE: (COLUMNS.LATITUDE, 'mean'),
+                                COLUMNS.LONGITUDE: (COLUMNS.LONGITUDE, 'mean'),
+                                COLUMNS.MARKET_PRICE_MEAN: (COLUMNS.MARKET_PRICE_MEAN, 'mean'),
+                                'LOCAIS': (COLUMNS.PLACE_NAME, 'size') })
+        if len(clusters) <= max_markers:
+            break
+        cell_size *= 2
+
+    merged = clusters['LOCAIS'] > 1
+    clusters.loc[merged, COLUMNS.PLACE_NAME] = \
+        clusters.loc[merged, 'LOCAIS'].map(lambda count: f'{count} locais (média)')
+    return clusters.reset_index(drop=True)
+
+@instrumented('build_brazil_map_markers')
+def build_brazil_map_markers(markers, selected_product):
+    '''
+    Returns the marker arrays drawn on the map,
+    rounded to what the map can show
+    '''
+    if len(markers) > MAP_CLUSTER_THRESHOLD:
+        markers = cluster_map_markers(markers, MAP_CLUSTER_THRESHOLD)
+
+    return { 'title': PLOT_TITLES['brazil_map'].format(unit=PRODUCT_UNITS[selected_product]),
+             'names': markers[COLUMNS.PLACE_NAME].tolist(),
+             'lat': markers[COLUMNS.LATITUDE].astype(float).round(4).tolist(),
+             'lon': markers[COLUMNS.LONGITUDE].astype(float).round(4).tolist(),
+             'prices': markers[COLUMNS.MARKET_PRICE_MEAN].astype(float).round(3).tolist() }
 
 """#def get_polygon(filtered_dataset, color='blue'):
 def get_polygon(lons, lats, color='blue'):
@@ -228,6 +367,16 @@ def build_brazil_map_figure(filtered_dataset):
     return fig"""
 
 
+# Titles of the map and plots, by output name, for the unit of the product
+PLOT_TITLES = {
+    'brazil_map': "Preço Médio do Combustível nas Revendas {unit}",
+    'market_price_plot': "Preço Médio nas Revendas {unit}",
+    'market_margin_plot': "Margem Média das Revendas {unit}",
+    'market_price_std_deviation_plot': "Desvio Padrão Médio dos Preços nas Revendas {unit}",
+    'market_price_coef_var_plot': "Coeficiente de Variação Médio dos Preços nas Revendas {unit}",
+}
+
+@instrumented('build_market_price_plot')
 def build_market_price_plot(filtered_dataset, selected_product):
     return px.line(filtered_dataset,
                    x=COLUMNS.MONTH,
@@ -235,233 +384,623 @@ def build_market_price_plot(filtered_dataset, selected_product):
                    line_group=COLUMNS.PLACE_NAME,
                    hover_data = ['UNIDADE DE MEDIDA'],
                    color=COLUMNS.PLACE_NAME,
-                   title=f"Preço Médio nas Revendas { PRODUCT_UNITS[selected_product] }")
+                   title=PLOT_TITLES['market_price_plot'].format(unit=PRODUCT_UNITS[selected_product]))
 
+@instrumented('build_market_margin_plot')
 def build_market_margin_plot(filtered_dataset, selected_product):
     return px.line(filtered_dataset,
                    x=COLUMNS.MONTH,
                    y=COLUMNS.MARKET_MARGIN,
                    line_group=COLUMNS.PLACE_NAME,
                    color=COLUMNS.PLACE_NAME,
-                   title=f"Margem Média das Revendas { PRODUCT_UNITS[selected_product] }")
+                   title=PLOT_TITLES['market_margin_plot'].format(unit=PRODUCT_UNITS[selected_product]))
 
+@instrumented('build_market_price_std_deviation_plot')
 def build_market_price_std_deviation_plot(filtered_dataset, selected_product):
     return px.bar(filtered_dataset,
                    x=COLUMNS.PLACE_NAME,
                    y=COLUMNS.MARKET_PRICE_STD,
                    barmode='group',
-                   color='ANO',
-                   title=f"Desvio Padrão Médio dos Preços nas Revendas { PRODUCT_UNITS[selected_product] }",
+                   color=COLUMNS.YEAR,
+                   title=PLOT_TITLES['market_price_std_deviation_plot'].format(unit=PRODUCT_UNITS[selected_product]),
                    color_continuous_scale=px.colors.cyclical.IceFire)
 
+@instrumented('build_market_price_var_coef_plot')
 def build_market_price_var_coef_plot(filtered_dataset, selected_product):
     return px.bar(filtered_dataset,
                    x=COLUMNS.PLACE_NAME,
                    y=COLUMNS.MARKET_PRICE_VAR_COEF,
                    barmode='group',
-                   color='ANO',
-                   title=f"Coeficiente de Variação Médio dos Preços nas Revendas { PRODUCT_UNITS[selected_product] }",
+                   color=COLUMNS.YEAR,
+                   title=PLOT_TITLES['market_price_coef_var_plot'].format(unit=PRODUCT_UNITS[selected_product]),
                    color_continuous_scale=px.colors.cyclical.IceFire)
 
-def filter_by_places(dataset, selected_places):
+@instrumented('filter_by_places')
+def filter_by_places(selected_product, selected_year_range, selected_places):
     '''
-    Returns a dataset with data matching
-    any of the selected places
+    Returns the aggregate data of the product and years
+    matching any of the selected places
     '''
     if type(selected_places) is not list:
         selected_places = [selected_places]
 
-    cities = []
-    states = []
-    regions = []
-
     for place_id in selected_places:
-        if place_id.startswith('city'):
-            cities.append(PLACES_DICT[place_id])
-        elif place_id.startswith('state'):
-            states.append(PLACES_DICT[place_id])
-        elif place_id.startswith('region'):
-            regions.append(PLACES_DICT[place_id])
-        else:
+        if not place_id.startswith(('city', 'state', 'region')):
             raise Exception(place_id)
 
-    cities_filter = ((dataset[COLUMNS.PLACE_TYPE] == 'CIDADE') &
-                     (dataset[COLUMNS.PLACE_NAME].isin(cities)))
-    states_filter = ((dataset[COLUMNS.PLACE_TYPE] == 'ESTADO') &
-                     (dataset[COLUMNS.PLACE_NAME].isin(states)))
-    regions_filter = ((dataset[COLUMNS.PLACE_TYPE] == 'REGIAO') &
-                     (dataset[COLUMNS.PLACE_NAME].isin(regions)))
-
-    filters = cities_filter | states_filter | regions_filter
+    return select_aggregate_data(selected_product,
+                                 selected_year_range,
+                                 selected_places)
 
-    return dataset[filters]
-
-def get_gas_stations_count(dataset):
-    #print(dataset)
-    #print(len(dataset))
-    #print(len(dataset.dropna()))
+def get_gas_stations_count(selected_product, selected_year_range, selected_places):
     '''
     Computes the real gas station total count,
     removing duplicates from compound places
     (one place inside the other)
     '''
+    if type(selected_places) is not list:
+        selected_places = [selected_places]
 
-    cities_data = dataset[dataset[COLUMNS.PLACE_TYPE] == 'CIDADE'].dropna()
-    states_data = dataset[dataset[COLUMNS.PLACE_TYPE] == 'ESTADO'].dropna()
-    regions_data = dataset[dataset[COLUMNS.PLACE_TYPE] == 'REGIAO'].dropna()
-
-    #DATASET[DATASET['ESTADO'] == states_data['NOME DO LOCAL']]['REGIÃO']
-    #states_data['REGION'] = DATASET[DATASET['ESTADO'] == states_data['NOME DO LOCAL']]['REGIÃO']
-
-    count_from_regions = regions_data[COLUMNS.GAS_STATION_COUNT].sum()
-
-    #cities_list = cities_data['MUNICÍPIO'].unique()
-    states_list = states_data['NOME DO LOCAL'].unique() #SE NOME DO LOCAL É UM ESTADO, NÃO TEM MAIS "ESTADO" E "REGIAÕ"
-    regions_list = regions_data['NOME DO LOCAL'].str.replace('REGIAO ', '').unique() #SE NOME DO LOCAL É UMA REGIAO, NÃO TEM MAIS "ESTADO" E "REGIAÕ"
-
-    #@np.vectorize
-    def is_under_selected_region(state):
-        if(type(state) is float):
-            return true
-        dataset_match_row = DATASET[DATASET['ESTADO'] == state].tail(1)
-        return dataset_match_row['REGIÃO'].isin(regions_list)
-
-    #print((states_data['NOME DO LOCAL']).dtype)
-
-    count_from_states = states_data[~(states_data['NOME DO LOCAL'].apply(is_under_selected_region))][COLUMNS.GAS_STATION_COUNT].sum() if len(states_data) > 0 else 0
-    count_from_cities = cities_data.loc[(~cities_data['ESTADO'].isin(states_list)) & (~cities_data['REGIÃO'].isin(regions_list))][COLUMNS.GAS_STATION_COUNT].sum()
-   
-
-    return sum([count_from_cities, count_from_states, count_from_regions])
-    #foreach cities_data, if cities_data['ESTADO'] in states_list, set qtd = 0
-    #foreach states_data, if states_data['REGIÃO'] in regions_list, set qtd = 0
-
-    '''count_from_regions = regions_data[COLUMNS.GAS_STATION_COUNT].sum()
-
-    # SOMA TODOS AS REGIÕES, FAZ UMA LISTA DE REGIÕES UNICAS FILTRADAS
-    # VERIFICA O DATASET PELOS ESTADOS -> SE A REGIÃO ESTIVER NA LISTA, SETA PRA ZERO
-    # VERIFICA O DATASET PELOS CIDADES -> 
-
-    count_from_states = states_data[COLUMNS.GAS_STATION_COUNT].sum()
-    count_from_cities = cities_data[COLUMNS.GAS_STATION_COUNT].sum()
-
-    @np.vectorize
-    # PARANA, 100, ESTADO
-    # SUL, 1000, REGIAO
-    def withdraw_city_counts(place_name, place_gas_station_count, place_column):
-        ''''''
-        For each place, withdraw the sum of the
-        gas station counts of the cities within the place.
-        ''''''
-        cd = cities_data
-        city_within_place_filter = cd[place_column] == place_name
-        # print(f'place_column={place_column}, place_name={place_name}')
-        cities_within_place_data = cd[city_within_place_filter]
-        # print('city_within_place_data')
-        # print(cities_within_place_data)
-        cities_gas_station_counts = cities_within_place_data[COLUMNS.GAS_STATION_COUNT]
-        # print('cities_gas_station_counts')
-        # print(cities_gas_station_counts)
-
-        return place_gas_station_count - cities_gas_station_counts.sum()
-
-    count_from_states = 0
-    if len(states_data) > 0:
-        counts_by_state = states_data.groupby(COLUMNS.PLACE_NAME, as_index=False).sum()
-        count_from_states = \
-            withdraw_city_counts(counts_by_state[COLUMNS.PLACE_NAME],
-                                counts_by_state[COLUMNS.GAS_STATION_COUNT],
-                                COLUMNS.STATE)\
-                                .sum()
-
-    @np.vectorize
-    # SUDESTE, 1000, REGIAO
-    def withdraw_state_counts(place_name, place_gas_station_count, place_column):
-        ''''''
-        For each place, withdraw the sum of the
-        gas station counts of the states within the place.
-        ''''''
-        sd = states_data
-        state_within_place_filter = sd[place_column] == place_name
-        # print(f'place_column={place_column}, place_name={place_name}')
-        states_within_place_data = sd[state_within_place_filter]
-        # print('city_within_place_data')
-        # print(cities_within_place_data)
-        states_gas_station_counts = states_within_place_data[COLUMNS.GAS_STATION_COUNT]
-        # print('cities_gas_station_counts')
-        # print(cities_gas_station_counts)
-
-        return place_gas_station_count - states_gas_station_counts.sum()
-
-    count_from_regions = 0
-    if len(regions_data) > 0:
-        counts_by_region = regions_data.groupby(COLUMNS.PLACE_NAME, as_index=False).sum()
-
-        count_from_regions = \
-            withdraw_city_counts(counts_by_region[COLUMNS.PLACE_NAME].str.replace('REGIAO ', ''),
-                                counts_by_region[COLUMNS.GAS_STATION_COUNT],
-                                COLUMNS.REGION)\
-                                .sum()
-        count_from_regions += \
-            withdraw_state_counts(counts_by_region[COLUMNS.PLACE_NAME].str.replace('REGIAO ', ''),
-                                counts_by_region[COLUMNS.GAS_STATION_COUNT],
-                                COLUMNS.REGION)\
-                                .sum()'''
-
-   
-
-# DATASET.head(1).transpose()
-
-@app.callback(
-    [Output(component_id='brazil_map', component_property='figure'),
-     Output(component_id='market_price_plot', component_property='figure'),
-     Output(component_id='market_margin_plot', component_property='figure'),
-     Output(component_id='market_price_std_deviation_plot', component_property='figure'),
-     Output(component_id='market_price_coef_var_plot', component_property='figure'),
-     Output(component_id='places_badge_count', component_property='children'),
-     Output(component_id='prices_badge_count', component_property='children'),
-     Output(component_id='months_badge_count', component_property='children'),],
-    [Input(component_id='selected_product', component_property='value'),
-     Input(component_id='selected_years', component_property='value'),
-     Input(component_id='selected_places', component_property='value'),]
-)
-def update_plots_from_filters(selected_product, selected_year_range, selected_places):
-    product_filter = DATASET[COLUMNS.PRODUCT] == selected_product
+    return count_gas_stations(selected_product,
+                              selected_year_range,
+                              selected_places)
 
-    dataset_years = DATASET[COLUMNS.MONTH].dt.year
-    years_filter = ((dataset_years >= selected_year_range[0]) &
-                    (dataset_years <= selected_year_range[1]))
+# The filtered rows of the recent filter combinations,
+# shared by the outputs built from them
+FILTERED_SLICE_CACHE = LRUCache(max_size=int(os.environ.get('FILTERED_SLICE_CACHE_SIZE', 16)))
 
-    filtered_dataset = DATASET[product_filter & years_filter]
+def get_filtered_slice(selected_product, selected_year_range, selected_places):
+    '''
+    Returns the memoized filter_by_places result,
+    outputs must not modify it
+    '''
+    cache_key = (get_dataset_version(),
+                 filters_key(selected_product, selected_year_range, selected_places))
 
-    filtered_dataset = generate_aggregate_data(filtered_dataset)
+    return FILTERED_SLICE_CACHE.get_or_build(
+        cache_key, lambda: filter_by_places(selected_product,
+                                            selected_year_range,
+                                            selected_places))
 
-    filtered_dataset = filter_by_places(filtered_dataset, selected_places)
+def build_transformed_slice(selected_product, selected_year_range, selected_places, transform):
+    '''
+    Returns the rows of the market prices and margins of the places,
+    transformed over every month at once and then cut to the year
+    range, with the plot columns of the filtered slice
+    '''
+    if type(selected_places) is not list:
+        selected_places = [selected_places]
 
-    market_price_plot_figure = build_market_price_plot(filtered_dataset, selected_product)
-    market_margin_plot_figure = build_market_margin_plot(filtered_dataset, selected_product)
+    price_matrix = select_price_matrix(selected_product, selected_places)
+    matrix_columns = list(price_matrix.values)
 
-    filtered_dataset['ANO'] = filtered_dataset[COLUMNS.MONTH].dt.year.astype(str)
-    place_groups = filtered_dataset.groupby([COLUMNS.PLACE_NAME], as_index=False)
-    place_and_year_groups = filtered_dataset.groupby([COLUMNS.PLACE_NAME, 'ANO'], as_index=False)
+    # The measures of every place are stacked and transformed in one pass
+    values, months = analytics.apply_transform(
+        transform, np.vstack([ price_matrix.values[column] for column in matrix_columns ]),
+        price_matrix.months, data_provider.DEFLATOR)
+    values = values.reshape(len(matrix_columns), len(price_matrix.place_rows), len(months))
 
-    brazil_map_figure = build_brazil_map_figure(place_groups.mean(), selected_product)
-    market_price_std_deviation_plot = build_market_price_std_deviation_plot(place_and_year_groups.mean(), selected_product)
-    market_price_var_coef_plot = build_market_price_var_coef_plot(place_and_year_groups.mean(), selected_product)
+    years = months.astype('datetime64[Y]').astype(int) + 1970
+    in_range = (years >= selected_year_range[0]) & (years <= selected_year_range[1])
+    values, months = values[:, :, in_range], months[in_range]
+
+    # Rows where any measure is known, by place and month like the filtered slice
+    rows, columns = np.nonzero(~np.isnan(values).all(axis=0))
+    place_names = np.array([ data_provider.PLACES_DICT.get(place_id, place_id)
+                             for place_id in price_matrix.place_rows ], dtype=object)
+    unit = '%' if transform in analytics.PERCENT_TRANSFORMS else PRODUCT_UNITS[selected_product]
+
+    return pd.DataFrame({ COLUMNS.MONTH: months[columns],
+                          COLUMNS.PLACE_NAME: place_names[rows],
+                          COLUMNS.UNIT: unit,
+                          **{ column: column_values[rows, columns]
+                              for column, column_values in zip(matrix_columns, values) } })
+
+def get_transformed_slice(selected_product, selected_year_range, selected_places, transform):
+    '''
+    Returns the memoized build_transformed_slice result,
+    outputs must not modify it
+    '''
+    cache_key = (get_dataset_version(),
+                 filters_key(selected_product, selected_year_range, selected_places),
+                 transform)
+
+    return FILTERED_SLICE_CACHE.get_or_build(
+        cache_key, lambda: build_transformed_slice(selected_product,
+                                                   selected_year_range,
+                                                   selected_places,
+                                                   transform))
+
+def transform_title(output_name, selected_product, transform):
+    # The labels of the percent transforms already end in (%)
+    unit = '' if transform in analytics.PERCENT_TRANSFORMS else PRODUCT_UNITS[selected_product]
+    title = PLOT_TITLES[output_name].format(unit=unit).rstrip()
+    return title if transform == DEFAULT_TRANSFORM else f'{title} - {TRANSFORMS[transform]}'
+
+def build_map_output(selected_product, selected_year_range, selected_places):
+    return build_brazil_map_markers(select_map_markers(selected_product,
+                                                       selected_year_range,
+                                                       selected_places),
+                                    selected_product)
+
+def build_line_plot_output(build_plot, output_name, selected_product, selected_year_range,
+                           selected_places, transform):
+    if transform == DEFAULT_TRANSFORM:
+        filtered_dataset = get_filtered_slice(selected_product, selected_year_range, selected_places)
+        return build_plot(filtered_dataset, selected_product).to_dict()
+
+    transformed_slice = get_transformed_slice(selected_product, selected_year_range,
+                                              selected_places, transform)
+    figure = build_plot(transformed_slice, selected_product)
+    figure.update_layout(title_text=transform_title(output_name, selected_product, transform))
+    return figure.to_dict()
+
+def build_market_price_output(selected_product, selected_year_range, selected_places,
+                              transform=DEFAULT_TRANSFORM):
+    return build_line_plot_output(build_market_price_plot, 'market_price_plot', selected_product,
+                                  selected_year_range, selected_places, transform)
+
+def build_market_margin_output(selected_product, selected_year_range, selected_places,
+                               transform=DEFAULT_TRANSFORM):
+    return build_line_plot_output(build_market_margin_plot, 'market_margin_plot', selected_product,
+                                  selected_year_range, selected_places, transform)
+
+def build_market_price_std_deviation_output(selected_product, selected_year_range, selected_places):
+    yearly_rollup = select_yearly_rollup(selected_product, selected_year_range, selected_places)
+    return build_market_price_std_deviation_plot(yearly_rollup, selected_product).to_dict()
+
+def build_market_price_var_coef_output(selected_product, selected_year_range, selected_places):
+    yearly_rollup = select_yearly_rollup(selected_product, selected_year_range, selected_places)
+    return build_market_price_var_coef_plot(yearly_rollup, selected_product).to_dict()
+
+def build_badges_output(selected_product, selected_year_range, selected_places):
+    filtered_dataset = get_filtered_slice(selected_product, selected_year_range, selected_places)
 
     places_badge_count = len(selected_places)
-    #prices_badge_count = get_gas_stations_count(filtered_dataset)
-    prices_badge_count = filtered_dataset[COLUMNS.GAS_STATION_COUNT].sum() 
+    prices_badge_count = get_gas_stations_count(selected_product,
+                                                selected_year_range,
+                                                selected_places)
     months_badge_count = len(filtered_dataset[COLUMNS.MONTH].unique())
 
-    return (brazil_map_figure,
-            market_price_plot_figure,
-            market_margin_plot_figure,
-            market_price_std_deviation_plot,
-            market_price_var_coef_plot,
-            places_badge_count,
-            prices_badge_count,
-            months_badge_count)
+    return (places_badge_count, prices_badge_count, months_badge_count)
+
+# Each output has its own callback, so the browser requests
+# them in parallel and shows every one as soon as it is built.
+# The builds hold the GIL, so those served by the threads of one
+# worker take turns: only different worker processes build at once
+DASHBOARD_OUTPUTS = {
+    'brazil_map': ([Output(component_id='brazil_map_markers', component_property='data')],
+                   build_map_output),
+    'market_price_plot': ([Output(component_id='market_price_plot', component_property='figure')],
+                          build_market_price_output),
+    'market_margin_plot': ([Output(component_id='market_margin_plot', component_property='figure')],
+                           build_market_margin_output),
+    'market_price_std_deviation_plot': ([Output(component_id='market_price_std_deviation_plot', component_property='figure')],
+                                        build_market_price_std_deviation_output),
+    'market_price_coef_var_plot': ([Output(component_id='market_price_coef_var_plot', component_property='figure')],
+                                   build_market_price_var_coef_output),
+    'badges': ([Output(component_id='places_badge_count', component_property='children'),
+                Output(component_id='prices_badge_count', component_property='children'),
+                Output(component_id='months_badge_count', component_property='children')],
+               build_badges_output),
+}
+
+def build_plot_base_figures():
+    '''
+    The plots without data, keeping the layouts plotly express
+    gives them: built from the default filters, since it needs rows
+    '''
+    year_range = (DEFAULT_FIRST_YEAR, int(max(data_provider.YEARS)))
+    filtered_dataset = select_aggregate_data(DEFAULT_PRODUCT, year_range, DEFAULT_PLACES)
+    yearly_rollup = select_yearly_rollup(DEFAULT_PRODUCT, year_range, DEFAULT_PLACES)
+
+    return { output_name: { 'data': [],
+                            'layout': build_plot(plot_data, DEFAULT_PRODUCT).to_dict()['layout'] }
+             for output_name, build_plot, plot_data in [
+                 ('market_price_plot', build_market_price_plot, filtered_dataset),
+                 ('market_margin_plot', build_market_margin_plot, filtered_dataset),
+                 ('market_price_std_deviation_plot', build_market_price_std_deviation_plot, yearly_rollup),
+                 ('market_price_coef_var_plot', build_market_price_var_coef_plot, yearly_rollup)] }
+
+PLOT_BASE_FIGURES = build_plot_base_figures() if CLIENTSIDE_FILTERING else {}
+
+# Set once the base figures exist, Dash builds the layout right away
+app.layout = serve_layout
+
+FILTER_INPUTS = [Input(component_id='selected_product', component_property='value'),
+                 Input(component_id='selected_years', component_property='value'),
+                 Input(component_id='selected_places', component_property='value')]
+
+# The line plots also follow the transform control
+TRANSFORM_OUTPUTS = ['market_price_plot', 'market_margin_plot']
+TRANSFORM_INPUT = Input(component_id='selected_transform', component_property='value')
+
+# Build durations of each output, served on /stats/figure-timings
+FIGURE_TIMINGS = BuildTimings()
+
+def get_dashboard_output(output_name, selected_product, selected_year_range, selected_places,
+                         transform=DEFAULT_TRANSFORM):
+    '''
+    Returns the cached value of the output for the filters,
+    building and timing it on a miss. The transform only
+    applies to the TRANSFORM_OUTPUTS
+    '''
+    if type(selected_places) is not list:
+        selected_places = [selected_places]
+
+    _, build_output = DASHBOARD_OUTPUTS[output_name]
+    options = { 'transform': transform } if output_name in TRANSFORM_OUTPUTS else {}
+
+    def build():
+        start_time = time.perf_counter()
+        output = build_output(selected_product, selected_year_range, selected_places, **options)
+        FIGURE_TIMINGS.record(output_name, time.perf_counter() - start_time)
+        return output
+
+    cache_key = (get_dataset_version(), output_name,
+                 filters_key(selected_product, selected_year_range, selected_places),
+                 *options.values())
+
+    return FIGURE_CACHE.get_or_build(cache_key, build)
+
+# Filters of the dashboard requests, read back to warm up the
+# popular ones: each filter change calls every output callback
+# once, so only the badges callback records it
+REQUEST_HISTORY = RequestHistory(os.environ.get(
+    'REQUEST_HISTORY', os.path.join(data_provider.cache_dir_path, 'request-history.jsonl')))
+HISTORY_OUTPUT = 'badges'
+
+def register_output_callback(output_name):
+    outputs, _ = DASHBOARD_OUTPUTS[output_name]
+
+    inputs = FILTER_INPUTS + ([TRANSFORM_INPUT] if output_name in TRANSFORM_OUTPUTS else [])
+
+    @app.callback(outputs, inputs)
+    def update_output(selected_product, selected_year_range, selected_places,
+                      selected_transform=DEFAULT_TRANSFORM):
+        if output_name == HISTORY_OUTPUT:
+            REQUEST_HISTORY.record(selected_product, selected_year_range, selected_places)
+
+        output = get_dashboard_output(output_name, selected_product,
+                                      selected_year_range, selected_places,
+                                      selected_transform)
+        return output if len(outputs) > 1 else [output]
+
+# Series store of the clientside filtering mode: the server sends
+# the monthly series of the selected product and places for every
+# year at once, and the clientside callbacks in assets/clientside.js
+# draw the outputs of the selected years from it, so moving the
+# year slider sends no request. Above SERIES_STORE_MAX_BYTES of JSON,
+# or MAP_CLUSTER_THRESHOLD places, the store carries the outputs
+# built by the server for the selected years instead
+SERIES_STORE_MAX_BYTES = int(os.environ.get('SERIES_STORE_MAX_BYTES', 512 * 1024))
+
+def json_values(series, decimals):
+    '''Rounded values of the series, None for the missing ones'''
+    values = series.astype(float).round(decimals)
+    return values.astype(object).where(values.notna(), None).tolist()
+
+def build_series_payload(selected_product, selected_places, transform=DEFAULT_TRANSFORM):
+    '''
+    Compact columnar series of the places for the product
+    over every year: the place and month of each row are
+    positions in the places and months lists. The lines
+    of the transformed series are sent apart from the rows
+    '''
+    year_range = (int(min(data_provider.YEARS)), int(max(data_provider.YEARS)))
+    aggregate_data = select_aggregate_data(selected_product, year_range, selected_places)
+    place_codes, place_ids = pd.factorize(aggregate_data[COLUMNS.PLACE_ID])
+    month_codes, months = pd.factorize(aggregate_data[COLUMNS.MONTH], sort=True)
+    places = aggregate_data.iloc[np.unique(place_codes, return_index=True)[1]]
+
+    counted_data = select_aggregate_data(selected_product, year_range,
+                                         remove_nested_places(selected_places))
+    station_counts = counted_data.groupby(COLUMNS.MONTH)[COLUMNS.GAS_STATION_COUNT].sum()\
+                                 .reindex(months, fill_value=0)
+
+    yearly_rollup = select_yearly_rollup(selected_product, year_range, selected_places)
+    yearly_rollup = yearly_rollup[yearly_rollup[COLUMNS.PLACE_ID].isin(place_ids)]
+
+    unit = PRODUCT_UNITS[selected_product]
+    titles = { output_name: (transform_title(output_name, selected_product, transform)
+                             if output_name in TRANSFORM_OUTPUTS else title.format(unit=unit))
+               for output_name, title in PLOT_TITLES.items() }
+
+    lines = {}
+    if transform != DEFAULT_TRANSFORM:
+        line_data = build_transformed_slice(selected_product, year_range, selected_places, transform)
+        line_month_codes, line_months = pd.factorize(line_data[COLUMNS.MONTH], sort=True)
+        place_codes_by_name = { name: code for code, name in enumerate(places[COLUMNS.PLACE_NAME]) }
+        lines = { 'lines': { 'months': line_months.strftime('%Y-%m').tolist(),
+                             'place': line_data[COLUMNS.PLACE_NAME].map(place_codes_by_name).tolist(),
+                             'month': line_month_codes.tolist(),
+                             'price': json_values(line_data[COLUMNS.MARKET_PRICE_MEAN], 3),
+                             'margin': json_values(line_data[COLUMNS.MARKET_MARGIN], 3) } }
+
+    return { 'kind': 'series',
+             'titles': titles,
+             'place_count': len(selected_places),
+             'places': { 'names': places[COLUMNS.PLACE_NAME].tolist(),
+                         'lat': json_values(places[COLUMNS.LATITUDE], 4),
+                         'lon': json_values(places[COLUMNS.LONGITUDE], 4) },
+             'months': months.strftime('%Y-%m').tolist(),
+             'stations': station_counts.astype(int).tolist(),
+             'rows': { 'place': place_codes.tolist(),
+                       'month': month_codes.tolist(),
+                       'price': json_values(aggregate_data[COLUMNS.MARKET_PRICE_MEAN], 3),
+                       'margin': json_values(aggregate_data[COLUMNS.MARKET_MARGIN], 3) },
+             'yearly': { 'place': place_ids.get_indexer(yearly_rollup[COLUMNS.PLACE_ID]).tolist(),
+                         'year': yearly_rollup[COLUMNS.YEAR].astype(str).tolist(),
+                         'std': json_values(yearly_rollup[COLUMNS.MARKET_PRICE_STD], 4),
+                         'var_coef': json_values(yearly_rollup[COLUMNS.MARKET_PRICE_VAR_COEF], 4) },
+             **lines }
+
+def payload_size(payload):
+    '''Bytes of the payload as dash sends it, before compression'''
+    return len(json.dumps(payload, cls=plotly.utils.PlotlyJSONEncoder))
+
+def get_series_store(selected_product, selected_year_range, selected_places,
+                     transform=DEFAULT_TRANSFORM):
+    '''
+    Returns the series payload of the product and places,
+    or the outputs built for the years when the payload
+    would be larger than SERIES_STORE_MAX_BYTES
+    '''
+    if type(selected_places) is not list:
+        selected_places = [selected_places]
+
+    def build():
+        if len(selected_places) > MAP_CLUSTER_THRESHOLD:
+            return { 'kind': 'oversized' }
+
+        payload = build_series_payload(selected_product, selected_places, transform)
+        size = payload_size(payload)
+        if instrumentation.ENABLED:
+            instrumentation.PAYLOAD_BYTES.observe('series', size)
+        return payload if size <= SERIES_STORE_MAX_BYTES else { 'kind': 'oversized' }
+
+    # The series cover every year, so the years are not part of the key
+    cache_key = (get_dataset_version(), 'series_store',
+                 filters_key(selected_product, (0, 0), selected_places), transform)
+    payload = FIGURE_CACHE.get_or_build(cache_key, build)
+    if payload['kind'] != 'oversized':
+        return payload
+
+    payload = { 'kind': 'outputs',
+                'years': [ int(year) for year in selected_year_range ],
+                'outputs': { output_name: get_dashboard_output(output_name, selected_product,
+                                                               selected_year_range,
+                                                               selected_places, transform)
+                             for output_name in DASHBOARD_OUTPUTS } }
+    if instrumentation.ENABLED:
+        instrumentation.PAYLOAD_BYTES.observe('outputs', payload_size(payload))
+    return payload
+
+def register_series_store_callbacks():
+    # Asks the server for a new store when the years leave
+    # the ones it covers, an outputs store covers only its years
+    app.clientside_callback(
+        ClientsideFunction(namespace='clientside', function_name='request_store_years'),
+        Output(component_id='series_store_years', component_property='data'),
+        [Input(component_id='selected_years', component_property='value')],
+        [State(component_id='series_store', component_property='data')]
+    )
+
+    @app.callback(Output(component_id='series_store', component_property='data'),
+                  [Input(component_id='selected_product', component_property='value'),
+                   Input(component_id='selected_places', component_property='value'),
+                   Input(component_id='series_store_years', component_property='data'),
+                   TRANSFORM_INPUT],
+                  [State(component_id='selected_years', component_property='value')])
+    def update_series_store(selected_product, selected_places, _, selected_transform,
+                            selected_year_range):
+        if selected_product is None or selected_year_range is None:
+            raise PreventUpdate
+
+        REQUEST_HISTORY.record(selected_product, selected_year_range, selected_places)
+        return get_series_store(selected_product, selected_year_range, selected_places,
+                                selected_transform)
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='clientside', function_name='draw_series_store'),
+        [ output for outputs, _ in DASHBOARD_OUTPUTS.values() for output in outputs ],
+        [Input(component_id='series_store', component_property='data'),
+         Input(component_id='selected_years', component_property='value')],
+        [State(component_id=output_name, component_property='figure')
+         for output_name in DASHBOARD_OUTPUTS if output_name.endswith('_plot')]
+    )
+
+if CLIENTSIDE_FILTERING:
+    register_series_store_callbacks()
+else:
+    for output_name in DASHBOARD_OUTPUTS:
+        register_output_callback(output_name)
+
+app.clientside_callback(
+    ClientsideFunction(namespace='clientside', function_name='draw_map_markers'),
+    Output(component_id='brazil_map', component_property='figure'),
+    [Input(component_id='brazil_map_markers', component_property='data')],
+    [State(component_id='brazil_map', component_property='figure')]
+)
+
+# The places index is built once per dataset version
+PLACE_SEARCH_INDEXES = LRUCache(max_size=1)
+PLACE_SEARCH_LIMIT = int(os.environ.get('PLACE_SEARCH_LIMIT', 50))
+
+def get_place_search_index():
+    dataset = data_provider.get_dataset()
+    return PLACE_SEARCH_INDEXES.get_or_build(
+        dataset.version, lambda: PlaceSearchIndex(dataset.places_dict))
+
+@app.callback(Output(component_id='selected_places', component_property='options'),
+              [Input(component_id='selected_places', component_property='search_value')],
+              [State(component_id='selected_places', component_property='value')])
+def update_place_options(search_value, selected_places):
+    '''
+    The selected places, which must stay among the options,
+    followed by the places matching the search or, before
+    anything is typed, by the regions and states
+    '''
+    if type(selected_places) is not list:
+        selected_places = [selected_places] if selected_places else []
+
+    if search_value:
+        found_places = get_place_search_index().search(search_value, PLACE_SEARCH_LIMIT)
+    else:
+        found_places = [ place_id for place_id in data_provider.PLACES_DICT
+                         if not place_id.startswith('city') ]
+
+    return place_options(list(dict.fromkeys(selected_places + found_places)))
+
+# Scores of the anomalies job (python anomalies.py),
+# read again whenever the job rewrites them
+ANOMALIES = LRUCache(max_size=1)
+ANOMALIES_TABLE_SIZE = int(os.environ.get('ANOMALIES_TABLE_SIZE', 20))
+
+ANOMALIES_TABLE_COLUMNS = [COLUMNS.PLACE_NAME, COLUMNS.MONTH, COLUMNS.MARKET_PRICE_MEAN,
+                           COLUMNS.MARKET_MARGIN, ANOMALY_COLUMNS.PRICE_STATE_Z,
+                           ANOMALY_COLUMNS.PRICE_REGION_Z, ANOMALY_COLUMNS.MARGIN_STATE_Z,
+                           ANOMALY_COLUMNS.MARGIN_REGION_Z, ANOMALY_COLUMNS.DIST_PRICE_SPREAD]
+
+def get_anomalies():
+    '''The scores of the last run of the job, None before the first one'''
+    try:
+        modified_time = os.path.getmtime(anomalies.anomalies_path)
+    except OSError:
+        return None
+
+    return ANOMALIES.get_or_build(modified_time, anomalies.read_anomalies)
+
+@app.callback(Output(component_id='anomalies_table', component_property='children'),
+              [Input(component_id='selected_product', component_property='value'),
+               Input(component_id='selected_years', component_property='value')])
+def update_anomalies_table(selected_product, selected_year_range):
+    anomalies_data = get_anomalies()
+    if anomalies_data is None:
+        return html.P("Execute python anomalies.py para calcular os desvios.")
+
+    outliers = anomalies.top_outliers(anomalies_data, selected_product,
+                                      selected_year_range, ANOMALIES_TABLE_SIZE)
+    table_data = outliers[ANOMALIES_TABLE_COLUMNS].astype({ column: 'float64'
+                                                            for column in ANOMALIES_TABLE_COLUMNS[2:] })
+    table_data = table_data.round(3).astype(object)
+    table_data[COLUMNS.MONTH] = outliers[COLUMNS.MONTH].dt.strftime('%Y-%m')
+
+    # Built from lists, pandas formats every cell of from_dataframe
+    rows = table_data.where(table_data.notna(), '').values.tolist()
+    return dbc.Table([html.Thead(html.Tr([ html.Th(column) for column in ANOMALIES_TABLE_COLUMNS ])),
+                      html.Tbody([ html.Tr([ html.Td(value) for value in row ]) for row in rows ])],
+                     striped=True, hover=True, size='sm')
+
+@app.server.route('/stats/figure-cache')
+def figure_cache_stats():
+    return jsonify(FIGURE_CACHE.stats())
+
+@app.server.route('/stats/figure-timings')
+def figure_timings_stats():
+    return jsonify(FIGURE_TIMINGS.stats())
+
+def preloaded_products():
+    '''
+    The products loaded before the first request: the default
+    one, shown by every page load, then those of the most
+    requested filters and the others, as many as the product
+    cache holds
+    '''
+    requested_products = [ filters[0] for filters in REQUEST_HISTORY.most_common(None) ]
+    products = dict.fromkeys([DEFAULT_PRODUCT] + requested_products + list(data_provider.PRODUCTS))
+    return [ product for product in products
+             if product in data_provider.PRODUCTS ][:data_provider.product_cache_size]
+
+def warm_up_filters(count):
+    '''
+    The filters to warm up: those of the WARMUP_FILTERS file,
+    then the most requested ones, then each product with the
+    default places and years, keeping the first count of the
+    preloaded products and known places. Other products would
+    evict the preloaded cubes, which gunicorn workers share
+    '''
+    products = preloaded_products()
+    filters_list = []
+    if 'WARMUP_FILTERS' in os.environ:
+        filters_list += read_filters_config(os.environ['WARMUP_FILTERS'])
+    filters_list += REQUEST_HISTORY.most_common(None)
+    default_year_range = (DEFAULT_FIRST_YEAR, int(max(data_provider.YEARS)))
+    filters_list += [ filters_key(product, default_year_range, DEFAULT_PLACES)
+                      for product in products ]
+
+    known_filters = [ filters for filters in dict.fromkeys(filters_list)
+                      if filters[0] in products and
+                         all(place_id in data_provider.PLACES_DICT for place_id in filters[2]) ]
+    return known_filters[:count]
+
+def warm_up_outputs(selected_product, selected_year_range, selected_places):
+    if CLIENTSIDE_FILTERING:
+        get_series_store(selected_product, list(selected_year_range), list(selected_places))
+        return
+
+    for output_name in DASHBOARD_OUTPUTS:
+        get_dashboard_output(output_name, selected_product,
+                             list(selected_year_range), list(selected_places))
+
+# Fills the figure cache with the outputs of the popular
+# filters in the background, progress is on /stats/warmup
+WARMUP = WarmUp(warm_up_outputs)
+
+@app.server.route('/stats/warmup')
+def warmup_stats():
+    return jsonify(WARMUP.stats())
+
+# Callback requests are timed when INSTRUMENTATION=1, and profiled
+# once one takes PROFILE_SLOW_REQUESTS seconds or more when it is set
+CALLBACK_PATH = '/_dash-update-component'
+
+@app.server.before_request
+def start_request_instrumentation():
+    if request.path != CALLBACK_PATH:
+        return
+
+    g.request_start_time = time.perf_counter()
+    g.request_profiler = instrumentation.start_request_profile()
+
+# Teardown runs after the failed requests too, after_request
+# doesn't, which would leave their profiler enabled
+@app.server.teardown_request
+def finish_request_instrumentation(exception):
+    if request.path != CALLBACK_PATH or 'request_start_time' not in g:
+        return
+
+    request_name = (request.get_json(silent=True) or {}).get('output', request.path)
+    if instrumentation.ENABLED:
+        instrumentation.STAGE_SECONDS.observe('callback_request',
+                                              time.perf_counter() - g.request_start_time)
+    if g.request_profiler is not None:
+        instrumentation.finish_request_profile(g.request_profiler, request_name)
+
+if instrumentation.ENABLED:
+    @app.server.route('/metrics')
+    def metrics():
+        return Response(instrumentation.prometheus_text(),
+                        mimetype='text/plain; version=0.0.4')
+
+    @app.server.route('/metrics/profile', methods=['POST'])
+    def profile_next_slow_request():
+        min_seconds = float(request.args.get('min_seconds', 1))
+        instrumentation.arm_request_profile(min_seconds)
+        return jsonify({ 'min_seconds': min_seconds })
+
+if 'PROFILE_SLOW_REQUESTS' in os.environ:
+    instrumentation.arm_request_profile(float(os.environ['PROFILE_SLOW_REQUESTS']))
+
+# Warm up the WARMUP_SIZE most popular filters, 0 disables it
+warmup_size = int(os.environ.get('WARMUP_SIZE', 20))
+if warmup_size > 0:
+    WARMUP.start(warm_up_filters(warmup_size))
+
+# Pick up new ANP releases every RELEASES_POLL_INTERVAL seconds, 0 disables it
+releases_poll_interval = float(os.environ.get('RELEASES_POLL_INTERVAL', 60))
+if releases_poll_interval > 0:
+    watch_releases(releases_poll_interval)
 
 # Run
 if __name__ == '__main__':
@@ -0,0 +1,53 @@
+import re
+import bisect
+import unicodedata
+
+def normalize_search_text(text):
+    '''
+    Upper case words without accents or punctuation,
+    so "São Paulo (SP)" becomes "SAO PAULO SP"
+    '''
+    text = unicodedata.normalize('NFKD', text).encode('ascii', errors='ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^0-9A-Z]+', ' ', text.upper()).split())
+
+class PlaceSearchIndex:
+    '''
+    Prefix search over the words of the place names, ignoring
+    case and accents: "sao pa", "paulo" and "sp" all find
+    SAO PAULO (SP). Every name is kept sorted once from each
+    of its words on, so a search is a binary search followed
+    by a scan of the matches
+    '''
+
+    def __init__(self, places_dict):
+        self.places_dict = places_dict
+
+        entries = []
+        for place_id, name in places_dict.items():
+            words = normalize_search_text(name).split()
+            for position in range(len(words)):
+                entries.append((' '.join(words[position:]), position, place_id))
+        entries.sort()
+
+        self.__keys = [ key for key, _, _ in entries ]
+        self.__entries = entries
+
+    def search(self, query, limit):
+        '''
+        Ids of at most limit places with a word starting with the
+        query, those whose name starts with it first, then by name
+        '''
+        query = normalize_search_text(query)
+        if not query:
+            return []
+
+        # The earliest word of each place matching the query
+        match_positions = {}
+        for key, position, place_id in self.__entries[bisect.bisect_left(self.__keys, query):]:
+            if not key.startswith(query):
+                break
+            match_positions[place_id] = min(position, match_positions.get(place_id, position))
+
+        return sorted(match_positions,
+                      key=lambda place_id: (match_positions[place_id] > 0,
+                                            self.places_dict[place_id]))[:limit]
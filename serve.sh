@@ -0,0 +1,5 @@
+#! /bin/bash
+
+echo ">>> Activating the environment and running the production server."
+echo ">>> It may take a while ..."
+. env/bin/activate && gunicorn -c gunicorn.conf.py wsgi:server
@@ -0,0 +1,71 @@
+'''
+The tests check data_provider against reference implementations
+over the data in DATA_DIR, and are skipped when its ANP file is
+missing. Run them from the repository root: python -m pytest tests
+'''
+import os
+import sys
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.chdir(ROOT_PATH)
+os.environ['RELEASES_POLL_INTERVAL'] = '0'
+# Every product stays loaded across the tests
+os.environ['PRODUCT_CACHE_SIZE'] = '100'
+
+GAS_FILE_NAME = 'dados-ANP-2013-2020.csv'
+
+@pytest.fixture(scope='session')
+def data_provider():
+    data_dir = os.environ.get('DATA_DIR', 'data')
+    if not os.path.exists(os.path.join(data_dir, GAS_FILE_NAME)):
+        pytest.skip(f'{GAS_FILE_NAME} is not in {data_dir}')
+
+    import data_provider
+    return data_provider
+
+@pytest.fixture(scope='session')
+def dataset(data_provider):
+    '''The city rows of every partition'''
+    return data_provider.read_dataset()
+
+def private(module, name):
+    '''A double underscore function of a module, which Python doesn't mangle at module level'''
+    return getattr(module, f'__{name}')
+
+def random_filters(data_provider, seed, selection_sizes=(1, 5, 30)):
+    '''A random product, year range and selection of cities, states and regions'''
+    generator = random.Random(seed)
+    place_ids = sorted(data_provider.PLACES_DICT)
+    years = sorted(int(year) for year in data_provider.YEARS)
+    first_year = generator.choice(years)
+    last_year = generator.choice([ year for year in years if year >= first_year ])
+    size = min(generator.choice(selection_sizes), len(place_ids))
+    return (generator.choice(data_provider.PRODUCTS), (first_year, last_year),
+            generator.sample(place_ids, size))
+
+def comparable(frame, sort_columns):
+    '''Plain labels and float64 measures, sorted by the columns'''
+    frame = frame.astype({ column: object for column in frame.columns
+                           if frame[column].dtype.name == 'category' })
+    frame = frame.astype({ column: 'float64' for column in frame.columns
+                           if pd.api.types.is_float_dtype(frame[column]) })
+    return frame.sort_values(sort_columns, ignore_index=True)
+
+def assert_same_rows(expected, result, sort_columns):
+    '''The same rows, with the measures equal within float32 precision'''
+    expected, result = comparable(expected, sort_columns), comparable(result, sort_columns)
+    assert sorted(expected.columns) == sorted(result.columns)
+    assert len(expected) == len(result)
+    for column in expected.columns:
+        if pd.api.types.is_float_dtype(expected[column]):
+            np.testing.assert_allclose(result[column], expected[column],
+                                       rtol=1e-5, atol=1e-6, equal_nan=True, err_msg=column)
+        else:
+            assert (result[column].fillna('').astype(str).values ==
+                    expected[column].fillna('').astype(str).values).all(), column
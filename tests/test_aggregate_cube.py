@@ -0,0 +1,23 @@
+'''
+Slicing the aggregate cube gives the rows the dashboard computed
+per request before the cube existed: the city rows of the
+product and years, aggregated into states and regions with
+generate_aggregate_data, then filtered by place
+'''
+import pytest
+
+from conftest import random_filters, assert_same_rows
+
+@pytest.mark.parametrize('seed', range(30))
+def test_cube_matches_per_request_aggregation(data_provider, dataset, seed):
+    COLUMNS = data_provider.COLUMNS
+    product, year_range, place_ids = random_filters(data_provider, seed)
+
+    years = dataset[COLUMNS.MONTH].dt.year
+    filtered_dataset = dataset[(dataset[COLUMNS.PRODUCT] == product) &
+                               (years >= year_range[0]) & (years <= year_range[1])]
+    aggregate_data = data_provider.generate_aggregate_data(filtered_dataset)
+    expected = aggregate_data[aggregate_data[COLUMNS.PLACE_ID].isin(place_ids)]
+
+    result = data_provider.select_aggregate_data(product, year_range, place_ids)
+    assert_same_rows(expected, result, [COLUMNS.PLACE_ID, COLUMNS.MONTH])
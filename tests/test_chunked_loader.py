@@ -0,0 +1,44 @@
+'''
+The chunked loader data_provider uses, spilling the city rows
+to disk, writes the same metadata and aggregate rows as the
+eager loader, which parses the whole CSV at once
+'''
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import private, assert_same_rows
+
+def read_partitions(partitions):
+    return pd.concat([ pd.read_feather(path) for path in partitions.values() ], ignore_index=True)
+
+@pytest.fixture(scope='module')
+def eager_result(data_provider, tmp_path_factory):
+    dataset = private(data_provider, 'compact_dataset')(private(data_provider, 'read_source_data')())
+    metadata = private(data_provider, 'build_metadata')(dataset)
+    partitions = private(data_provider, 'split_partitions')(data_provider.generate_aggregate_data(dataset))
+    partitions_path = os.path.join(tmp_path_factory.mktemp('eager'), 'partitions')
+    return metadata, read_partitions(private(data_provider, 'write_partitions')(
+        partitions_path, metadata, sorted(partitions.items())))
+
+@pytest.mark.parametrize('chunk_size', [10000, 200000])
+def test_chunked_loader_matches_eager_loader(data_provider, eager_result, tmp_path, chunk_size):
+    COLUMNS = data_provider.COLUMNS
+    partitions_path = os.path.join(tmp_path, 'partitions')
+    metadata, partitions = private(data_provider, 'load_source_data_in_chunks')(
+        chunk_size, f'{partitions_path}.spill.tmp')
+    partitions = private(data_provider, 'write_partitions')(partitions_path, metadata, partitions)
+    expected_metadata, expected_aggregate_data = eager_result
+
+    # The eager loader appends the releases after the base file
+    # rows, so only the order of the labels may differ
+    assert sorted(metadata) == sorted(expected_metadata)
+    for key, values in metadata.items():
+        if isinstance(values, dict):
+            assert values == expected_metadata[key], key
+        else:
+            assert sorted(values) == sorted(expected_metadata[key]), key
+
+    assert_same_rows(expected_aggregate_data, read_partitions(partitions),
+                     [COLUMNS.PLACE_ID, COLUMNS.PRODUCT, COLUMNS.MONTH])
@@ -0,0 +1,23 @@
+'''
+count_gas_stations counts each city row covered by the selected
+places once, even when a city is inside a selected state or region
+'''
+import pytest
+
+from conftest import random_filters
+
+@pytest.mark.parametrize('seed', range(50))
+def test_count_matches_brute_force(data_provider, dataset, seed):
+    COLUMNS = data_provider.COLUMNS
+    product, year_range, place_ids = random_filters(data_provider, seed,
+                                                    selection_sizes=(1, 2, 5, 10, 50, 10000))
+
+    years = dataset[COLUMNS.MONTH].dt.year
+    covered = (dataset[COLUMNS.CITY_ID].isin(place_ids) |
+               ('state_' + dataset[COLUMNS.STATE].astype(str)).isin(place_ids) |
+               ('region_' + dataset[COLUMNS.REGION].astype(str)).isin(place_ids))
+    rows = ((dataset[COLUMNS.PRODUCT] == product) &
+            (years >= year_range[0]) & (years <= year_range[1]) & covered)
+    expected = int(dataset.loc[rows, COLUMNS.GAS_STATION_COUNT].sum())
+
+    assert data_provider.count_gas_stations(product, year_range, place_ids) == expected
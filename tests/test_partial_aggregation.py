@@ -0,0 +1,82 @@
+'''
+The state and region rows of the NumPy partial aggregation
+kernel match a pandas reference, which pools the market prices
+of the stations with the two pass formula, whether the dataset
+is aggregated at once or in chunks
+'''
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import private
+
+def reference_aggregates(dataset, COLUMNS, place_column):
+    '''
+    Aggregates of every group computed directly: means of the
+    measures and the pooled prices of the stations, the sum of
+    the squared deviations of every station from the group mean
+    '''
+    group_columns = [place_column, COLUMNS.PRODUCT, COLUMNS.MONTH]
+    mean_columns = [COLUMNS.MARKET_MARGIN, COLUMNS.DIST_PRICE_MEAN, COLUMNS.DIST_PRICE_STD,
+                    COLUMNS.DIST_PRICE_VAR_COEF, COLUMNS.LATITUDE, COLUMNS.LONGITUDE]
+    data = dataset[group_columns].copy()
+    for column in dataset.columns.difference(group_columns):
+        if pd.api.types.is_numeric_dtype(dataset[column]):
+            data[column] = dataset[column].astype('float64')
+
+    station_counts = data[COLUMNS.GAS_STATION_COUNT]
+    prices = data[COLUMNS.MARKET_PRICE_MEAN]
+    spread = prices.notna() & data[COLUMNS.MARKET_PRICE_STD].notna()
+    data['weight'] = station_counts.where(prices.notna())
+    data['weighted_price'] = (station_counts * prices).where(prices.notna())
+    data['spread_weight'] = station_counts.where(spread)
+    data['spread_price'] = (station_counts * prices).where(spread)
+
+    groups = data.groupby(group_columns, observed=True)
+    spread_means = groups['spread_price'].transform('sum') / groups['spread_weight'].transform('sum')
+    data['squared_deviations'] = ((station_counts - 1) * data[COLUMNS.MARKET_PRICE_STD] ** 2 +
+                                  station_counts * (prices - spread_means) ** 2).where(spread)
+
+    groups = data.groupby(group_columns, observed=True)
+    sums = groups[['weight', 'weighted_price', 'spread_weight',
+                   'spread_price', 'squared_deviations']].sum(min_count=1)
+    expected = groups[mean_columns].mean()
+    expected[COLUMNS.GAS_STATION_COUNT] = groups[COLUMNS.GAS_STATION_COUNT].sum()
+    for column in [COLUMNS.MARKET_PRICE_MIN, COLUMNS.DIST_PRICE_MIN]:
+        expected[column] = groups[column].min()
+    for column in [COLUMNS.MARKET_PRICE_MAX, COLUMNS.DIST_PRICE_MAX]:
+        expected[column] = groups[column].max()
+    expected[COLUMNS.MARKET_PRICE_MEAN] = sums['weighted_price'] / sums['weight']
+    deviations = np.sqrt(sums['squared_deviations'] /
+                         (sums['spread_weight'] - 1).where(sums['spread_weight'] > 1))
+    expected[COLUMNS.MARKET_PRICE_STD] = deviations
+    expected[COLUMNS.MARKET_PRICE_VAR_COEF] = deviations / (sums['spread_price'] /
+                                                            sums['spread_weight'])
+
+    return expected.sort_index()
+
+@pytest.mark.parametrize('chunks', [1, 4])
+@pytest.mark.parametrize('place', ['STATE', 'REGION'])
+def test_kernel_matches_reference(data_provider, dataset, place, chunks):
+    COLUMNS = data_provider.COLUMNS
+    aggregate_partials = private(data_provider, 'aggregate_partials')
+    finalize_partials = private(data_provider, 'finalize_partials')
+    place_column = getattr(COLUMNS, place)
+
+    partials = [ aggregate_partials(dataset.iloc[rows])
+                 for rows in np.array_split(np.arange(len(dataset)), chunks) ]
+    expected = reference_aggregates(dataset, COLUMNS, place_column)
+    result = finalize_partials(partials, place_column)\
+             .set_index(expected.index.names).sort_index()
+
+    assert result.index.equals(expected.index)
+    for column in expected.columns:
+        np.testing.assert_allclose(result[column].astype('float64'), expected[column],
+                                   rtol=1e-5, atol=1e-6, equal_nan=True, err_msg=column)
+
+def test_kernel_of_no_rows(data_provider, dataset):
+    COLUMNS = data_provider.COLUMNS
+    partials = private(data_provider, 'aggregate_partials')(dataset.iloc[:0])
+    result = private(data_provider, 'finalize_partials')([partials], COLUMNS.STATE)
+    assert len(result) == 0
+    assert COLUMNS.MARKET_PRICE_VAR_COEF in result.columns
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter, deque
+
+from figure_cache import filters_key
+
+class RequestHistory:
+    '''
+    Appends the filters of the dashboard requests to a JSON
+    lines file, so the popular ones are known after a restart.
+    Only the last max_entries requests are read back, and the
+    file is cut back to them once it holds twice as many. An
+    empty path keeps no history
+    '''
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+
+        self.__lock = threading.Lock()
+        # Lines in the file, counted on the first record. The
+        # other workers append too, so it can fall behind
+        self.__line_count = None
+
+    def record(self, selected_product, selected_year_range, selected_places):
+        if not self.path:
+            return
+
+        product, years, places = filters_key(selected_product, selected_year_range, selected_places)
+        line = json.dumps({ 'product': product, 'years': years, 'places': places })
+
+        with self.__lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                if self.__line_count is None:
+                    self.__line_count = self.__count_lines()
+                with open(self.path, 'a') as history_file:
+                    history_file.write(line + '\n')
+                self.__line_count += 1
+
+                if self.__line_count > 2 * self.max_entries:
+                    self.__truncate()
+            except OSError:
+                pass # Read-only deploys just don't keep a history
+
+    def __count_lines(self):
+        try:
+            with open(self.path) as history_file:
+                return sum(1 for _ in history_file)
+        except FileNotFoundError:
+            return 0
+
+    def __truncate(self):
+        '''
+        Rewrites the file with its last max_entries lines and
+        renames it over the old one. Lines the other workers
+        append meanwhile are lost, a few requests of the history
+        '''
+        with open(self.path) as history_file:
+            lines = deque(history_file, maxlen=self.max_entries)
+
+        temporary_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary_path, 'w') as history_file:
+            history_file.writelines(lines)
+        os.replace(temporary_path, self.path)
+        self.__line_count = len(lines)
+
+    def most_common(self, count):
+        '''The count most requested filters (all for None), most requested first'''
+        if not self.path:
+            return []
+
+        with self.__lock:
+            try:
+                with open(self.path) as history_file:
+                    lines = deque(history_file, maxlen=self.max_entries)
+            except OSError:
+                return []
+
+        requests = Counter()
+        for line in lines:
+            try:
+                requests[read_filters(json.loads(line))] += 1
+            except (ValueError, KeyError, TypeError):
+                continue # Lines cut by a crash
+
+        return [ filters for filters, _ in requests.most_common(count) ]
+
+def read_filters(entry):
+    '''Filters key of a {"product", "years", "places"} entry'''
+    return filters_key(entry['product'], entry['years'], list(entry['places']))
+
+def read_filters_config(path):
+    '''Filters keys listed in a JSON file of {"product", "years", "places"} entries'''
+    with open(path) as config_file:
+        return [ read_filters(entry) for entry in json.load(config_file) ]
+
+class WarmUp:
+    '''
+    Calls build(product, year_range, places) for each
+    filters key on a daemon thread, one at a time, logging
+    the progress and keeping the timings for stats()
+    '''
+
+    def __init__(self, build):
+        self.build = build
+
+        self.__lock = threading.Lock()
+        self.__stats = { 'state': 'idle', 'total': 0, 'done': 0,
+                         'failed': 0, 'seconds': 0.0, 'max_seconds': 0.0 }
+
+    def start(self, filters_list):
+        filters_list = list(filters_list)
+        with self.__lock:
+            self.__stats.update(state='running', total=len(filters_list), done=0,
+                                failed=0, seconds=0.0, max_seconds=0.0)
+
+        threading.Thread(target=self.__run, args=(filters_list,), daemon=True).start()
+
+    def __run(self, filters_list):
+        start_time = time.perf_counter()
+        for position, filters in enumerate(filters_list, 1):
+            build_start_time = time.perf_counter()
+            try:
+                self.build(*filters)
+                failed = 0
+            except Exception:
+                logging.exception(f'Could not warm up {filters}')
+                failed = 1
+            duration = time.perf_counter() - build_start_time
+
+            with self.__lock:
+                self.__stats['done'] += 1
+                self.__stats['failed'] += failed
+                self.__stats['seconds'] = time.perf_counter() - start_time
+                self.__stats['max_seconds'] = max(self.__stats['max_seconds'], duration)
+            logging.info('Warm-up %d/%d: %s in %.3fs', position, len(filters_list),
+                         filters, duration)
+
+        with self.__lock:
+            self.__stats['state'] = 'done'
+        logging.info('Warm-up of %d filters done in %.1fs',
+                     len(filters_list), time.perf_counter() - start_time)
+
+    def stats(self):
+        with self.__lock:
+            return dict(self.__stats)
@@ -0,0 +1,4 @@
+# WSGI entry point of the production server, see gunicorn.conf.py
+from main import app
+
+server = app.server